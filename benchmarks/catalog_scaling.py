@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Shows how catalog rendering time grows with the number of datasets.
+
+Renders catalogs of increasing size through `EuropeanMobilityDCATAPProfile`
+into one graph, the way `RDFSerializer.serialize_catalog` does, with the
+dataset graph cache disabled. Per-dataset cost should stay flat: if it grows
+with the catalog size, some profile step is scanning the whole catalog graph.
+
+    python -m benchmarks.catalog_scaling --sizes 100 200 400 800
+"""
+import argparse
+import time
+
+from benchmarks import standins
+from benchmarks.datasets import catalog
+
+
+def render_catalog(dataset_dicts):
+    from rdflib import Graph, URIRef
+    from ckanext.dcat.profiles.base import DCAT
+    from ckanext.dcat_be_napits.profiles import EuropeanMobilityDCATAPProfile
+
+    g = Graph()
+    catalog_ref = URIRef(standins.catalog_uri())
+    EuropeanMobilityDCATAPProfile(g).graph_from_catalog({}, catalog_ref)
+    for dataset_dict in dataset_dicts:
+        dataset_ref = URIRef(standins.dataset_uri(dataset_dict))
+        EuropeanMobilityDCATAPProfile(g).graph_from_dataset(dataset_dict, dataset_ref)
+        g.add((catalog_ref, DCAT.dataset, dataset_ref))
+    return g
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200, 400, 800])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    org_dicts, dataset_dicts = catalog(max(args.sizes))
+    standins.install(org_dicts)
+
+    from ckanext.dcat_be_napits.cache import dataset_graph_cache
+    dataset_graph_cache.configure(max_size=0, max_age=0)
+
+    print('{0:>8} {1:>10} {2:>12} {3:>14}'.format('datasets', 'triples', 'seconds', 'ms / dataset'))
+    for size in args.sizes:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            g = render_catalog(dataset_dicts[:size])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print('{0:>8} {1:>10} {2:>12.3f} {3:>14.3f}'.format(size, len(g), best, 1000 * best / size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic transportdata.be-style dataset and organization dicts, shaped like
+the `package_show` / `organization_show` output the profiles read.
+"""
+import json
+import random
+
+LANGUAGES = ['en', 'nl', 'fr', 'de']
+
+MOBILITY_THEMES = {
+    'https://w3id.org/mobilitydcat-ap/mobility-theme/road-network-and-traffic': [
+        'https://w3id.org/mobilitydcat-ap/mobility-theme/road-traffic',
+        'https://w3id.org/mobilitydcat-ap/mobility-theme/road-works',
+    ],
+    'https://w3id.org/mobilitydcat-ap/mobility-theme/public-transport': [],
+}
+
+NUTS_REGIONS = ['BE1', 'BE10', 'BE2', 'BE21', 'BE23', 'BE24', 'BE25', 'BE3', 'BE32', 'BE33', 'BE35']
+
+
+def _translated(text, rng, languages=LANGUAGES):
+    # Like our db, untranslated values are preset with empty strings
+    return dict((lang, '{0} ({1})'.format(text, lang) if lang == 'en' or rng.random() < 0.5 else '')
+                for lang in languages)
+
+
+def organization(index):
+    return {
+        'id': 'org-{0:04d}'.format(index),
+        'name': 'organization-{0}'.format(index),
+        'title': 'Organization {0}'.format(index),
+        'do_email': 'info@organization{0}.be'.format(index),
+        'do_tel': '+3220000{0:04d}'.format(index),
+        'do_website': 'https://organization{0}.be'.format(index),
+        'display_title_en': 'Organization {0}'.format(index),
+        'display_title_nl': 'Organisatie {0}'.format(index),
+        'display_title_fr': 'Organisation {0}'.format(index),
+        'display_title_de': '',
+        'country': 'Belgium',
+        'administrative_area': 'Brussels',
+        'postal_code': '1000',
+        'city': 'Brussels',
+        'street_address': 'Rue de la Loi {0}'.format(index),
+    }
+
+
+def resource(dataset_id, index, rng):
+    upload = rng.random() < 0.5
+    return {
+        'id': '{0}-res-{1}'.format(dataset_id, index),
+        'package_id': dataset_id,
+        'name': 'Resource {0}'.format(index),
+        'url': 'https://data.example.be/{0}/{1}.zip'.format(dataset_id, index),
+        'url_type': 'upload' if upload else '',
+        'format': 'ZIP',
+        'mimetype': 'application/zip',
+        'size': rng.randint(1000, 10 ** 8),
+        'license_type': 'http://publications.europa.eu/resource/authority/licence/CC_BY_4_0' if rng.random() < 0.7 else '',
+        'license_text_translated': _translated('https://data.example.be/license', rng),
+        'conditions_access': 'https://w3id.org/mobilitydcat-ap/conditions-for-access-and-usage/free-of-charge',
+        'conditions_usage': 'https://w3id.org/mobilitydcat-ap/conditions-for-access-and-usage/licence-provided',
+        'additional_info_access_usage_translated': _translated('Access and usage', rng),
+        'acc_int': 'https://w3id.org/mobilitydcat-ap/application-layer-protocol/http-https',
+        'acc_con': 'https://w3id.org/mobilitydcat-ap/communication-method/pull',
+        'acc_gra': 'https://w3id.org/mobilitydcat-ap/grammar/xsd',
+        'acc_mod': 'https://w3id.org/mobilitydcat-ap/mobility-data-standard/netex',
+        'acc_desc': 'NeTEx Belgian profile',
+        'acc_enc': 'UTF-8',
+        'description_resource_translated': _translated('Resource {0}'.format(index), rng),
+    }
+
+
+def dataset(index, organizations, rng=None, resources=3):
+    rng = rng or random.Random(index)
+    dataset_id = 'ds-{0:06d}'.format(index)
+    org_dict = organizations[index % len(organizations)]
+    return {
+        'id': dataset_id,
+        'name': 'dataset-{0}'.format(index),
+        'title': 'Dataset {0}'.format(index),
+        'notes': 'Notes',
+        'metadata_created': '2023-01-01T10:00:00.000000',
+        'metadata_modified': '2024-{0:02d}-{1:02d}T10:00:00.{2:06d}'.format(index % 12 + 1, index % 28 + 1, index),
+        'title_translated': _translated('Dataset {0}'.format(index), rng),
+        'notes_translated': _translated('Description of dataset {0}'.format(index), rng),
+        'organization': {'id': org_dict['id'], 'name': org_dict['name'], 'title': org_dict['title']},
+        'owner_org': org_dict['id'],
+        'tags': [{'name': 'traffic'}, {'name': 'roads'}],
+        'extras': [],
+        'contact_point_name': 'Contact {0}'.format(index),
+        'contact_point_email': 'contact{0}@example.be'.format(index),
+        'contact_point_tel': '+3230000{0:04d}'.format(index % 10000),
+        'publisher_firstname': 'Jan',
+        'publisher_surname': 'Peeters',
+        'mobility_theme': json.dumps(MOBILITY_THEMES),
+        'fluent_tags': ['https://w3id.org/mobilitydcat-ap/transport-mode/car'],
+        'network_coverage': ['{https://w3id.org/mobilitydcat-ap/network-coverage/motorway,'
+                             'https://w3id.org/mobilitydcat-ap/network-coverage/urban-road}'],
+        'georeferencing_method': ['https://w3id.org/mobilitydcat-ap/georeferencing-method/geocoordinates'],
+        'nap_type': ['MMTIS'],
+        'reference_system': ['https://www.opengis.net/def/crs/EPSG/0/4326'],
+        'qual_ass_translated': _translated('Quality checked', rng),
+        'regions_covered': ['http://data.europa.eu/nuts/code/{0}'.format(code)
+                            for code in rng.sample(NUTS_REGIONS, rng.randint(1, 4))],
+        'spatial': '{"type": "Polygon", "coordinates": [[[2.5, 49.5], [6.4, 49.5], [6.4, 51.5], [2.5, 51.5], [2.5, 49.5]]]}',
+        'resources': [resource(dataset_id, i, rng) for i in range(resources)],
+    }
+
+
+def catalog(size, organizations=50, seed=0):
+    '''
+    Returns `(organization_dicts, dataset_dicts)` for a catalog of `size` datasets
+    '''
+    rng = random.Random(seed)
+    org_dicts = [organization(i) for i in range(min(organizations, max(size, 1)))]
+    return org_dicts, [dataset(i, org_dicts, rng) for i in range(size)]
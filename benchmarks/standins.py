@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins that let the DCAT profiles run without a CKAN site, database,
+search index or network.
+
+`install()` replaces the CKAN / ckanext-dcat URI helpers (which go through the
+plugin machinery) with plain string formatting, answers the catalog's
+last-modification lookup without a `package_search` and prefills the
+organization cache, so no `organization_show` is needed.
+"""
+import sys
+
+from ckantoolkit import config
+
+SITE_URL = 'https://transportdata.be'
+LAST_CATALOG_MODIFICATION = '2024-05-01T10:00:00'
+
+CONFIG = {
+    'ckan.site_url': SITE_URL,
+    'ckan.site_title': 'Transportdata.be',
+    'ckan.locale_default': 'en',
+}
+
+
+def catalog_uri():
+    return SITE_URL
+
+
+def dataset_uri(dataset_dict):
+    return dataset_dict.get('uri') or '{0}/dataset/{1}'.format(SITE_URL, dataset_dict['id'])
+
+
+def resource_uri(resource_dict):
+    return resource_dict.get('uri') or '{0}/dataset/{1}/resource/{2}'.format(
+        SITE_URL, resource_dict['package_id'], resource_dict['id'])
+
+
+def publisher_uri_organization_fallback(dataset_dict):
+    if dataset_dict.get('organization'):
+        return '{0}/organization/{1}'.format(SITE_URL, dataset_dict['organization']['id'])
+    return None
+
+
+URI_HELPERS = {
+    'catalog_uri': catalog_uri,
+    'dataset_uri': dataset_uri,
+    'resource_uri': resource_uri,
+    'publisher_uri_organization_fallback': publisher_uri_organization_fallback,
+}
+
+
+def install(organizations=()):
+    '''
+    Patches the stand-ins in every loaded ckanext-dcat and ckanext-dcat-be-napits
+    module that imported one of the URI helpers.
+    '''
+    config.update(CONFIG)
+
+    import ckanext.dcat.utils as dcat_utils
+    from ckanext.dcat.profiles.base import RDFProfile
+    import ckanext.dcat_be_napits.profiles  # noqa: F401 load the modules to patch
+
+    originals = dict((name, getattr(dcat_utils, name)) for name in URI_HELPERS)
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith('ckanext.dcat') or module is None:
+            continue
+        for name, standin in URI_HELPERS.items():
+            if getattr(module, name, None) is originals[name]:
+                setattr(module, name, standin)
+
+    from ckanext.dcat_be_napits.cache import organization_cache
+
+    from ckanext.dcat_be_napits.profiles.euro_dcat_ap_2 import EuropeanDCATAP2Profile
+
+    for profile_class in (RDFProfile, EuropeanDCATAP2Profile):
+        profile_class._last_catalog_modification = lambda self: LAST_CATALOG_MODIFICATION
+    organization_cache.configure(max_age=0)
+    for org_dict in organizations:
+        organization_cache[org_dict['id']] = org_dict
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Times the DCAT profiles and the RDF serializations on synthetic catalogs.
+
+For every catalog size, renders the catalog, its datasets and their catalog
+records through `EuropeanMobilityDCATAPProfile` into one graph, with the
+dataset graph cache disabled, then serializes that graph to Turtle, RDF/XML
+and JSON-LD. Each stage reports its time, its throughput in datasets per
+second and, in a second pass under `tracemalloc`, its peak memory.
+
+    python -m benchmarks.suite --sizes 10 1000 10000 --json results.json
+    python -m benchmarks.suite --baseline results.json
+
+With `--baseline`, exits with status 1 if a stage got slower than the
+baseline by more than `--tolerance`.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks import standins
+from benchmarks.datasets import catalog
+
+SERIALIZATIONS = [
+    ('serialize ttl', 'turtle'),
+    ('serialize xml', 'pretty-xml'),
+    ('serialize jsonld', 'json-ld'),
+]
+
+
+def _stages(dataset_dicts):
+    '''
+    Returns the `(name, function)` stages for `dataset_dicts`. The stages
+    share one graph and have to run in order.
+    '''
+    from rdflib import Graph, URIRef
+    from ckanext.dcat.profiles.base import DCAT
+    from ckanext.dcat_be_napits.profiles import EuropeanMobilityDCATAPProfile
+    from ckanext.dcat_be_napits.utils import catalog_record_uri
+
+    state = {}
+
+    def graph_from_catalog():
+        state['g'] = Graph()
+        state['catalog_ref'] = URIRef(standins.catalog_uri())
+        EuropeanMobilityDCATAPProfile(state['g']).graph_from_catalog({}, state['catalog_ref'])
+
+    def graph_from_dataset():
+        g, catalog_ref = state['g'], state['catalog_ref']
+        for dataset_dict in dataset_dicts:
+            dataset_ref = URIRef(standins.dataset_uri(dataset_dict))
+            EuropeanMobilityDCATAPProfile(g).graph_from_dataset(dataset_dict, dataset_ref)
+            g.add((catalog_ref, DCAT.dataset, dataset_ref))
+
+    def graph_from_catalog_record():
+        g, catalog_ref = state['g'], state['catalog_ref']
+        for dataset_dict in dataset_dicts:
+            dataset_ref = URIRef(standins.dataset_uri(dataset_dict))
+            record_ref = URIRef(catalog_record_uri(dataset_dict))
+            EuropeanMobilityDCATAPProfile(g).graph_from_catalog_record(dataset_dict, dataset_ref, record_ref)
+            g.add((catalog_ref, DCAT.record, record_ref))
+
+    def serialize(_format):
+        return lambda: state['g'].serialize(format=_format)
+
+    stages = [
+        ('graph_from_catalog', graph_from_catalog),
+        ('graph_from_dataset', graph_from_dataset),
+    ]
+    if _supports_catalog_records():
+        stages.append(('graph_from_catalog_record', graph_from_catalog_record))
+    stages.extend((name, serialize(_format)) for name, _format in SERIALIZATIONS)
+    return stages, state
+
+
+def _supports_catalog_records():
+    # Catalog records come from the ckanext-dcat fork this extension requires
+    from ckanext.dcat.profiles.euro_dcat_ap_2 import EuropeanDCATAP2Profile
+    return hasattr(EuropeanDCATAP2Profile, 'graph_from_catalog_record')
+
+
+def _run(dataset_dicts, trace_memory):
+    from ckanext.dcat_be_napits.cache import catalog_graph_cache
+    catalog_graph_cache.clear()
+
+    stages, state = _stages(dataset_dicts)
+    results = {}
+    for name, function in stages:
+        gc.collect()
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = peak
+        else:
+            results[name] = elapsed
+    return results, len(state['g'])
+
+
+def run(size, repeat=1, trace_memory=True):
+    '''
+    Benchmarks a catalog of `size` datasets and returns a dict of results
+    per stage
+    '''
+    org_dicts, dataset_dicts = catalog(size)
+    standins.install(org_dicts)
+
+    from ckanext.dcat_be_napits.cache import dataset_graph_cache
+    dataset_graph_cache.configure(max_size=0, max_age=0)
+
+    best = {}
+    for _ in range(repeat):
+        timings, triples = _run(dataset_dicts, trace_memory=False)
+        for name, elapsed in timings.items():
+            best[name] = min(best.get(name, elapsed), elapsed)
+    peaks = _run(dataset_dicts, trace_memory=True)[0] if trace_memory else {}
+
+    return dict((name, {
+        'seconds': elapsed,
+        'datasets_per_second': size / elapsed if elapsed else None,
+        'peak_mb': peaks[name] / 10 ** 6 if name in peaks else None,
+        'triples': triples,
+    }) for name, elapsed in best.items())
+
+
+def _print(size, results):
+    print('{0} datasets, {1} triples'.format(size, next(iter(results.values()))['triples']))
+    print('  {0:<28} {1:>10} {2:>14} {3:>10}'.format('stage', 'seconds', 'datasets / s', 'peak MB'))
+    for name, result in results.items():
+        peak = '{0:>10.1f}'.format(result['peak_mb']) if result['peak_mb'] is not None else '{0:>10}'.format('-')
+        print('  {0:<28} {1:>10.3f} {2:>14.1f} {3}'.format(
+            name, result['seconds'], result['datasets_per_second'], peak))
+
+
+def _regressions(all_results, baseline, tolerance):
+    regressions = []
+    for size, results in all_results.items():
+        for name, result in results.items():
+            previous = baseline.get(size, {}).get(name)
+            if previous and result['seconds'] > previous['seconds'] * (1 + tolerance):
+                regressions.append('{0} datasets, {1}: {2:.3f}s, was {3:.3f}s'.format(
+                    size, name, result['seconds'], previous['seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per size, the fastest one is reported')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the tracemalloc pass')
+    parser.add_argument('--json', help='Writes the results to this file')
+    parser.add_argument('--baseline', help='Results file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown against the baseline (default: 0.2)')
+    args = parser.parse_args()
+
+    if not _supports_catalog_records():
+        print('ckanext-dcat has no catalog record support, skipping graph_from_catalog_record\n')
+
+    all_results = {}
+    for size in args.sizes:
+        results = run(size, repeat=args.repeat, trace_memory=not args.no_memory)
+        all_results[str(size)] = results
+        _print(size, results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = _regressions(all_results, baseline, args.tolerance)
+        for regression in regressions:
+            print('Slower than the baseline: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
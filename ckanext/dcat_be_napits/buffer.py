@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Compact rdflib store for the graphs datasets are rendered into.
+
+rdflib's default in-memory store indexes every triple three times, per
+context, in nested dicts: most of a worker's memory on a full catalog
+request. While a dataset is rendered, the profiles only add triples, look
+up the ones of a subject, make a few passes over the whole graph (removing
+empty literals, moving `locn:geometry` to `dcat:bbox`) and read the result
+once, so a TripleBuffer keeps just enough for that:
+
+* every term once, in a table, the triples referring to it by position
+* the triples in three append-only arrays of term ids, and removed ones
+  marked in a bytearray rather than taken out
+* the rows of each subject and object, for the lookups of the profiles and
+  the serializers
+
+It is plugged into a regular `Graph`, so profiles, caches and serializers
+use it as any graph.
+"""
+from array import array
+
+from rdflib import Graph
+from rdflib.store import Store
+
+ANY = None
+
+
+class TripleBuffer(Store):
+    '''
+    Append-only, array-backed triple store with interned terms.
+
+    Patterns with a bound subject or object read the rows of that term,
+    other ones scan the rows. Iterating over a pattern while removing or
+    adding triples is safe: triples added meanwhile are not yielded.
+    '''
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super(TripleBuffer, self).__init__(configuration, identifier)
+        self._ids = {}
+        self._terms = []
+        self._subjects = array('I')
+        self._predicates = array('I')
+        self._objects = array('I')
+        self._removed = bytearray()
+        self._subject_rows = {}
+        self._object_rows = {}
+        self._length = 0
+        self._namespaces = {}
+        self._prefixes = {}
+
+    def _intern(self, term):
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+        return term_id
+
+    def _find(self, subject_id, predicate_id, object_id):
+        for row in self._subject_rows.get(subject_id, ()):
+            if (self._predicates[row] == predicate_id and self._objects[row] == object_id
+                    and not self._removed[row]):
+                return row
+        return None
+
+    def add(self, triple, context=None, quoted=False):
+        subject, predicate, _object = triple
+        subject_id, predicate_id, object_id = self._intern(subject), self._intern(predicate), self._intern(_object)
+        if self._find(subject_id, predicate_id, object_id) is not None:
+            return
+        row = len(self._removed)
+        self._subjects.append(subject_id)
+        self._predicates.append(predicate_id)
+        self._objects.append(object_id)
+        self._removed.append(0)
+        self._subject_rows.setdefault(subject_id, array('I')).append(row)
+        self._object_rows.setdefault(object_id, array('I')).append(row)
+        self._length += 1
+
+    def _rows(self, triple_pattern):
+        '''
+        Yields the rows matching `triple_pattern`, as of the call
+        '''
+        subject, predicate, _object = triple_pattern
+        ids = []
+        for term in triple_pattern:
+            if term is ANY:
+                ids.append(None)
+            elif term in self._ids:
+                ids.append(self._ids[term])
+            else:
+                # A term that is in no triple
+                return
+        subject_id, predicate_id, object_id = ids
+
+        if subject_id is not None:
+            rows = self._subject_rows.get(subject_id, ())
+        elif object_id is not None:
+            rows = self._object_rows.get(object_id, ())
+        else:
+            rows = range(len(self._removed))
+
+        for row in rows[:] if isinstance(rows, array) else rows:
+            if self._removed[row]:
+                continue
+            if subject_id is not None and self._subjects[row] != subject_id:
+                continue
+            if predicate_id is not None and self._predicates[row] != predicate_id:
+                continue
+            if object_id is not None and self._objects[row] != object_id:
+                continue
+            yield row
+
+    def _triple(self, row):
+        terms = self._terms
+        return terms[self._subjects[row]], terms[self._predicates[row]], terms[self._objects[row]]
+
+    def triples(self, triple_pattern, context=None):
+        for row in self._rows(triple_pattern):
+            yield self._triple(row), iter(())
+
+    def remove(self, triple_pattern, context=None):
+        for row in list(self._rows(triple_pattern)):
+            self._removed[row] = 1
+            self._length -= 1
+
+    def __len__(self, context=None):
+        return self._length
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        bound_namespace = self._namespaces.get(prefix)
+        bound_prefix = self._prefixes.get(namespace)
+        if not override and (bound_namespace is not None or bound_prefix is not None):
+            return
+        if bound_prefix is not None:
+            del self._namespaces[bound_prefix]
+        if bound_namespace is not None:
+            del self._prefixes[bound_namespace]
+        self._namespaces[prefix] = namespace
+        self._prefixes[namespace] = prefix
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace)
+
+    def namespaces(self):
+        return iter(list(self._namespaces.items()))
+
+
+class ScratchGraphs(object):
+    '''
+    Creates the graphs datasets are rendered into, backed by a TripleBuffer
+    if `buffered`, or by rdflib's default store
+    '''
+
+    def __init__(self, buffered=False):
+        self.buffered = buffered
+
+    def configure(self, buffered):
+        self.buffered = buffered
+
+    def new(self, namespace_manager=None):
+        if self.buffered:
+            return Graph(store=TripleBuffer(), namespace_manager=namespace_manager)
+        return Graph(namespace_manager=namespace_manager)
+
+
+scratch_graphs = ScratchGraphs()
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
+
+import ckantoolkit as toolkit
+
+from ckanext.dcat_be_napits.canonical import blank_nodes
+from ckanext.dcat_be_napits.utils import PROFILE_VERSION, catalog_language
+
+log = logging.getLogger(__name__)
+
+DEFAULT_GRAPH_CACHE_SIZE = 5000
+DEFAULT_GRAPH_CACHE_MAX_AGE = 3600
+DEFAULT_ORG_CACHE_MAX_AGE = 600
+
+# Config the upstream `graph_from_catalog` reads
+CATALOG_CONFIG_OPTIONS = [
+    'ckanext.dcat.base_uri',
+    'ckan.site_url',
+    'ckan.site_title',
+    'ckan.site_description',
+    'ckan.locale_default',
+]
+
+
+_graph_cache_bypassed = ContextVar('dcat_be_napits_graph_cache_bypassed', default=False)
+
+
+@contextmanager
+def graph_cache_bypass():
+    '''
+    Renders the datasets of the block without reading or filling
+    `dataset_graph_cache`, eg for the whole catalog: each dataset is rendered
+    once, and keeping their triples would grow the cache to its `max_size`
+    '''
+    token = _graph_cache_bypassed.set(True)
+    try:
+        yield
+    finally:
+        _graph_cache_bypassed.reset(token)
+
+
+class DatasetGraphCache(object):
+    '''
+    Bounded, process-wide LRU cache of the triples generated for a dataset.
+
+    Entries are keyed on dataset id + `metadata_modified` + `PROFILE_VERSION`,
+    so an edited dataset never hits a stale entry, and on the language it is
+    rendered in (see `language_scope`). Entries also expire after `max_age`
+    seconds: the rendered graph embeds organization details, which don't bump
+    `metadata_modified` and may be edited in another worker process.
+    A `max_size` of 0 disables the cache, `graph_cache_bypass` bypasses it
+    for a block.
+    '''
+
+    def __init__(self, max_size=DEFAULT_GRAPH_CACHE_SIZE, max_age=DEFAULT_GRAPH_CACHE_MAX_AGE):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def configure(self, max_size, max_age):
+        with self._lock:
+            self.max_size = max_size
+            self.max_age = max_age
+            self._evict()
+
+    def _key(self, dataset_dict):
+        return (dataset_dict.get('metadata_modified'), PROFILE_VERSION)
+
+    def get(self, dataset_dict):
+        '''
+        Returns the cached triples for `dataset_dict`, or None on a miss
+        '''
+        dataset_id = dataset_dict.get('id')
+        if not self.enabled or not dataset_id or _graph_cache_bypassed.get():
+            return None
+        entry_key = (dataset_id, catalog_language())
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                self.misses += 1
+                return None
+            key, _org_id, created, triples = entry
+            if key != self._key(dataset_dict) or (self.max_age and time.time() - created > self.max_age):
+                del self._entries[entry_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return triples
+
+    def set(self, dataset_dict, triples):
+        dataset_id = dataset_dict.get('id')
+        if not self.enabled or not dataset_id or _graph_cache_bypassed.get():
+            return
+        org_id = (dataset_dict.get('organization') or {}).get('id')
+        entry_key = (dataset_id, catalog_language())
+        with self._lock:
+            self._entries[entry_key] = (self._key(dataset_dict), org_id, time.time(), tuple(triples))
+            self._entries.move_to_end(entry_key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, dataset_id):
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == dataset_id]:
+                del self._entries[entry_key]
+
+    def invalidate_organization(self, org_id):
+        '''
+        Drops the entries of all datasets published by organization `org_id`
+        '''
+        with self._lock:
+            stale = [entry_key for entry_key, entry in self._entries.items() if entry[1] == org_id]
+            for entry_key in stale:
+                del self._entries[entry_key]
+        if stale:
+            log.debug('Invalidated %d cached dataset graphs of organization %s', len(stale), org_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def catalog_header_key(catalog_ref, catalog_dict=None):
+    '''
+    Returns a key of everything the static part of the catalog, ie all of it
+    but its `dct:modified`, depends on: the catalog URI, the catalog dict, the
+    language, the blank node mode and the site config (which sysadmins can
+    edit while the process runs)
+    '''
+    return (
+        str(catalog_ref),
+        repr(sorted((catalog_dict or {}).items())),
+        PROFILE_VERSION,
+        catalog_language(),
+        blank_nodes.mode,
+        tuple(toolkit.config.get(option) for option in CATALOG_CONFIG_OPTIONS),
+    )
+
+
+class CatalogGraphCache(object):
+    '''
+    Process-wide cache of the static part of the catalog itself, without its
+    datasets and its `dct:modified`: its triples, keyed on
+    `catalog_header_key`, and their serialization in each format, keyed on
+    `(catalog_header_key, rdflib format)`.
+
+    The constants of the profiles don't change while the process runs, the
+    key covers everything else, so entries never go stale.
+    '''
+
+    max_size = 64
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        '''
+        Caches `value`: a tuple of triples or serialized bytes
+        '''
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class OrganizationCache(object):
+    '''
+    Process-wide cache of organization dicts, with a TTL.
+
+    It stands in for the `_org_cache` dict of the upstream profiles (which
+    otherwise lives for the whole process and is never invalidated), so it
+    supports `in`, item access and assignment. Unlike a dict, item access
+    falls back to `organization_show` on a miss.
+    A `max_age` of 0 keeps entries until they are invalidated.
+    '''
+
+    def __init__(self, max_age=DEFAULT_ORG_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_age):
+        self.max_age = max_age
+
+    def _fresh(self, org_id):
+        entry = self._entries.get(org_id)
+        if entry is None:
+            return None
+        created, org_dict = entry
+        if self.max_age and time.time() - created > self.max_age:
+            return None
+        return org_dict
+
+    def __contains__(self, org_id):
+        return self._fresh(org_id) is not None
+
+    def __getitem__(self, org_id):
+        org_dict = self._fresh(org_id)
+        if org_dict is None:
+            try:
+                org_dict = toolkit.get_action('organization_show')({'ignore_auth': True}, {'id': org_id})
+            except toolkit.ObjectNotFound:
+                raise KeyError(org_id)
+            self[org_id] = org_dict
+        return org_dict
+
+    def __setitem__(self, org_id, org_dict):
+        with self._lock:
+            self._entries[org_id] = (time.time(), org_dict)
+
+    def get(self, org_id, default=None):
+        try:
+            return self[org_id]
+        except KeyError:
+            return default
+
+    def cached(self, org_id):
+        '''
+        Returns the cached dict of `org_id`, without loading it, or None
+        '''
+        return self._fresh(org_id)
+
+    def invalidate(self, org_id):
+        with self._lock:
+            self._entries.pop(org_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def prefetch(self, dataset_dicts):
+        '''
+        Loads the organizations of all `dataset_dicts` that are not cached yet,
+        with batched `organization_list` calls instead of one
+        `organization_show` per organization.
+        '''
+        missing = {}
+        for dataset_dict in dataset_dicts:
+            org = dataset_dict.get('organization')
+            if org and org['id'] not in missing and org['id'] not in self:
+                missing[org['id']] = org['name']
+        if not missing:
+            return
+
+        batch_size = toolkit.asint(toolkit.config.get('ckan.group_and_organization_list_all_fields_max', 25))
+        names = list(missing.values())
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            org_dicts = toolkit.get_action('organization_list')({'ignore_auth': True}, {
+                'organizations': batch,
+                'all_fields': True,
+                'include_extras': True,
+                'include_dataset_count': False,
+                'include_member_count': False,
+                'limit': len(batch),
+            })
+            for org_dict in org_dicts:
+                # organization_show returns the extras as top level fields
+                for extra in org_dict.pop('extras', []):
+                    org_dict.setdefault(extra['key'], extra['value'])
+                self[org_dict['id']] = org_dict
+        log.debug('Prefetched %d organizations', len(missing))
+
+
+dataset_graph_cache = DatasetGraphCache()
+catalog_graph_cache = CatalogGraphCache()
+organization_cache = OrganizationCache()
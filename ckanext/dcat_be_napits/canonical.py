@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Stable blank nodes and canonical N-Triples.
+
+The profiles describe contact points, licenses, rights statements, publisher
+persons, quality annotations and locations with blank nodes, which get a new
+id on every render. Two renders of a dataset then only compare with a graph
+isomorphism check.
+
+`stable_blank_nodes` names each blank node after where it hangs in the
+graph: the IRI of the node referring to it (eg the dataset or distribution),
+the property it is referred with (its role) and a hash of what it describes.
+Blank nodes nobody refers to, like the publisher person, hang from the root,
+eg the dataset. The names are either blank node labels or skolem IRIs
+(`<catalog>/.well-known/genid/<id>`).
+
+With stable names, `canonical_ntriples` writes a graph as sorted N-Triples:
+two renders of the same dataset give the same bytes, so a hash of the output
+tells whether the dataset changed.
+"""
+import hashlib
+import logging
+from collections import defaultdict
+
+from rdflib import BNode, Graph, URIRef
+
+from ckanext.dcat_be_napits.utils import catalog_uri
+
+log = logging.getLogger(__name__)
+
+FRESH = 'fresh'
+STABLE = 'stable'
+SKOLEM = 'skolem'
+BLANK_NODE_MODES = (FRESH, STABLE, SKOLEM)
+
+SKOLEM_PATH = '/.well-known/genid/'
+
+
+def _digest(*parts):
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def stable_blank_nodes(triples, root, skolem=False):
+    '''
+    Returns `triples` with their blank nodes renamed after their position
+    in the graph, as labels or, if `skolem` is set, as skolem IRIs. `root`
+    is the node blank nodes that nothing refers to hang from.
+    '''
+    triples = list(triples)
+    outgoing = defaultdict(list)
+    incoming = defaultdict(list)
+    for s, p, o in triples:
+        if isinstance(s, BNode):
+            outgoing[s].append((p, o))
+        if isinstance(o, BNode):
+            incoming[o].append((s, p))
+
+    contents = {}
+
+    def content(node, path=()):
+        # Hash of what a blank node describes, nested blank nodes included
+        if node in contents:
+            return contents[node]
+        if node in path:
+            return ''
+        parts = sorted('{0} {1}'.format(p.n3(), content(o, path + (node,)) if isinstance(o, BNode) else o.n3())
+                       for p, o in outgoing[node])
+        contents[node] = _digest(*parts)
+        return contents[node]
+
+    names = {}
+    ordinals = defaultdict(int)
+
+    def name(node, path=()):
+        if node in names:
+            return names[node]
+        if node in path:
+            return _digest(str(root), content(node))
+        parents = incoming.get(node)
+        if parents:
+            # A named parent if there is one, in a stable order
+            s, p = min(parents, key=lambda parent: (
+                isinstance(parent[0], BNode), str(parent[1]),
+                content(parent[0]) if isinstance(parent[0], BNode) else str(parent[0])))
+            base = name(s, path + (node,)) if isinstance(s, BNode) else str(s)
+            role = str(p)
+        else:
+            base, role = str(root), ''
+        key = (base, role, content(node))
+        # Blank nodes describing the same thing in the same role are
+        # interchangeable, so whichever gets which ordinal doesn't matter
+        ordinal = ordinals[key]
+        ordinals[key] += 1
+        names[node] = _digest(base, role, key[2], str(ordinal))[:20]
+        return names[node]
+
+    if skolem:
+        prefix = catalog_uri().rstrip('/') + SKOLEM_PATH
+        terms = dict((node, URIRef(prefix + name(node))) for node in set(outgoing) | set(incoming))
+    else:
+        terms = dict((node, BNode(name(node))) for node in set(outgoing) | set(incoming))
+
+    return [(terms.get(s, s), p, terms.get(o, o)) for s, p, o in triples]
+
+
+def canonical_ntriples(triples):
+    '''
+    Returns `triples` serialized as N-Triples, sorted, without duplicates
+    '''
+    graph = Graph()
+    for triple in triples:
+        graph.add(triple)
+    lines = set(graph.serialize(format='nt', encoding='utf-8').splitlines())
+    lines.discard(b'')
+    return b''.join(line + b'\n' for line in sorted(lines))
+
+
+class BlankNodes(object):
+    '''
+    How the blank nodes of rendered datasets and of the catalog are named:
+    `fresh` (new ids on every render), `stable` (labels) or `skolem` (IRIs)
+    '''
+
+    def __init__(self, mode=FRESH):
+        self.configure(mode)
+
+    def configure(self, mode=FRESH):
+        mode = mode or FRESH
+        if mode not in BLANK_NODE_MODES:
+            log.warning('Unknown blank node mode %s, using %s', mode, FRESH)
+            mode = FRESH
+        self.mode = mode
+
+    def stabilize(self, triples, root):
+        '''
+        Returns `triples` with the blank nodes named in the configured mode
+        '''
+        if self.mode == FRESH:
+            return triples
+        return stable_blank_nodes(triples, root, skolem=self.mode == SKOLEM)
+
+
+blank_nodes = BlankNodes()
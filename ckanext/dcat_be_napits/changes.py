@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental catalog feed for harvesters.
+
+Lists the datasets modified after a given time, oldest change first, with
+their catalog records. Datasets deleted since then are listed as tombstones:
+a catalog record with the `deleted` ADMS change type and no dataset.
+
+Pages are linked with a keyset cursor, the `(metadata_modified, id)` of the
+last dataset of the page, rather than a page number: datasets changing while
+a harvester walks the pages move to the end of the feed instead of shifting
+the pages it has not read yet.
+"""
+import json
+import base64
+import logging
+from datetime import timezone
+
+from dateutil.parser import parse as parse_date
+from rdflib import Literal, Namespace, URIRef
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.dcat.logic import DATASETS_PER_PAGE
+from ckanext.dcat.processors import HYDRA
+from ckanext.dcat.profiles.base import ADMS, CleanedURIRef, DCAT, DCT, FOAF, RDF, XSD
+from ckanext.dcat.utils import url_to_rdflib_format
+
+from ckanext.dcat_be_napits.cache import organization_cache
+from ckanext.dcat_be_napits.streaming import StreamingCatalogSerializer
+from ckanext.dcat_be_napits.utils import catalog_language, catalog_record_uri, dataset_uri, solr_quote, uri_scope
+
+log = logging.getLogger(__name__)
+
+CHANGE_TYPE = Namespace('http://purl.org/adms/changetype/')
+
+CATALOG_FQ_LIST = ['-dataset_type:harvest', '-dataset_type:showcase']
+
+
+def utc_datetime(value):
+    '''
+    Parses a date string, eg a `metadata_modified`, into a naive UTC datetime
+    '''
+    value = parse_date(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def solr_date(value):
+    '''
+    Formats a naive UTC datetime for a Solr query
+    '''
+    return value.isoformat() + 'Z'
+
+
+def encode_cursor(dataset_dict):
+    '''
+    Returns the cursor pointing after `dataset_dict`
+    '''
+    key = json.dumps([dataset_dict['metadata_modified'], dataset_dict['id']])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    '''
+    Returns the `(metadata_modified, id)` of a cursor, or raises a
+    ValidationError if it is not one
+    '''
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        metadata_modified, dataset_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return solr_date(utc_datetime(metadata_modified)), str(dataset_id)
+    except (ValueError, TypeError, OverflowError):
+        raise toolkit.ValidationError({'cursor': ['Invalid cursor']})
+
+
+def keyset_fq(cursor, descending=False):
+    '''
+    Returns the Solr filter matching the datasets after `cursor` when sorted
+    on `metadata_modified, id`, ascending or descending
+    '''
+    metadata_modified, dataset_id = decode_cursor(cursor)
+    if descending:
+        return '(metadata_modified:[* TO {0}}} OR (metadata_modified:{1} AND id:[* TO {2}}}))'.format(
+            metadata_modified, solr_quote(metadata_modified), solr_quote(dataset_id))
+    return '(metadata_modified:{{{0} TO *] OR (metadata_modified:{1} AND id:{{{2} TO *]))'.format(
+        metadata_modified, solr_quote(metadata_modified), solr_quote(dataset_id))
+
+
+def parse_since(since):
+    '''
+    Returns `since` as a naive UTC datetime, or raises a ValidationError
+    '''
+    if not since:
+        raise toolkit.ValidationError({'since': ['Missing value']})
+    try:
+        return utc_datetime(since)
+    except (ValueError, OverflowError):
+        raise toolkit.ValidationError({'since': ['Invalid date']})
+
+
+def search_changes(context, since, cursor=None, rows=None):
+    '''
+    Returns the page of datasets, deleted ones included, modified after
+    `since` (and after `cursor`), with the total number of changes and the
+    cursor of the next page, if any
+    '''
+    rows = rows or int(toolkit.config.get('ckanext.dcat.datasets_per_page', DATASETS_PER_PAGE))
+    fq_list = CATALOG_FQ_LIST + ['metadata_modified:{{{0} TO *]'.format(solr_date(parse_since(since)))]
+    if cursor:
+        fq_list.append(keyset_fq(cursor))
+
+    query = toolkit.get_action('package_search')(dict(context), {
+        'q': '*:*',
+        'fq_list': fq_list,
+        'sort': 'metadata_modified asc, id asc',
+        'include_deleted': True,
+        'rows': rows + 1,
+    })
+    dataset_dicts = query['results'][:rows]
+    next_cursor = encode_cursor(dataset_dicts[-1]) if len(query['results']) > rows else None
+    return dataset_dicts, query['count'], next_cursor
+
+
+class ChangesSerializer(StreamingCatalogSerializer):
+    '''
+    Serializes a page of the changes feed with the mobility profile
+    '''
+
+    def graph_from_tombstone(self, dataset_dict, catalog_ref):
+        '''
+        Adds the catalog record of a deleted dataset and returns its reference
+        '''
+        catalog_record_ref = CleanedURIRef(catalog_record_uri(dataset_dict))
+        self.g.add((catalog_record_ref, RDF.type, DCAT.CatalogRecord))
+        self.g.add((catalog_record_ref, FOAF.primaryTopic, CleanedURIRef(dataset_uri(dataset_dict))))
+        self.g.add((catalog_record_ref, DCT.modified,
+                    Literal(dataset_dict['metadata_modified'], datatype=XSD.dateTime)))
+        self.g.add((catalog_record_ref, ADMS.status, CHANGE_TYPE.deleted))
+        self.g.add((catalog_ref, DCAT.record, catalog_record_ref))
+        return catalog_record_ref
+
+    def graph_from_change(self, dataset_dict, catalog_ref, since):
+        '''
+        Adds a changed dataset and its catalog record, marked as created or
+        updated after `since` (a naive UTC datetime), or its tombstone
+        '''
+        if dataset_dict.get('state') == 'deleted':
+            return self.graph_from_tombstone(dataset_dict, catalog_ref)
+
+        dataset_ref = self.graph_from_dataset(dataset_dict)
+        self.g.add((catalog_ref, DCAT.dataset, dataset_ref))
+        catalog_record_ref = self.graph_from_catalog_record(dataset_dict, dataset_ref)
+        self.g.add((catalog_ref, DCAT.record, catalog_record_ref))
+        created = utc_datetime(dataset_dict['metadata_created']) > since
+        self.g.add((catalog_record_ref, ADMS.status, CHANGE_TYPE.created if created else CHANGE_TYPE.updated))
+        return catalog_record_ref
+
+    def add_keyset_pagination(self, count, current, next_url=None, previous_url=None):
+        '''
+        Describes the page as a hydra:PartialCollectionView, linking to the
+        pages before and after it
+        '''
+        self.g.bind('hydra', HYDRA)
+        view_ref = URIRef(current)
+        self.g.add((view_ref, RDF.type, HYDRA.PartialCollectionView))
+        self.g.add((view_ref, HYDRA.totalItems, Literal(count)))
+        if next_url:
+            self.g.add((view_ref, HYDRA.next, URIRef(next_url)))
+        if previous_url:
+            self.g.add((view_ref, HYDRA.previous, URIRef(previous_url)))
+        return view_ref
+
+    def serialize_changes(self, dataset_dicts, since, count, current, next_url=None, _format='turtle'):
+        catalog_ref = self.graph_from_catalog()
+        since = parse_since(since)
+        with uri_scope():
+            for dataset_dict in dataset_dicts:
+                self.graph_from_change(dataset_dict, catalog_ref, since)
+        self.add_keyset_pagination(count, current, next_url)
+        return self.g.serialize(format=_format)
+
+
+def changes_page_url(_format, since, cursor=None):
+    return toolkit.url_for('dcat_be_napits.read_catalog_changes', _format=_format,
+                           since=since, cursor=cursor, lang=catalog_language(), _external=True)
+
+
+def serialize_changes_page(context, data_dict):
+    '''
+    Returns the page of the changes feed for `data_dict` (`since`, `cursor`,
+    `format`), serialized
+    '''
+    since = data_dict.get('since')
+    cursor = data_dict.get('cursor')
+    _format = data_dict.get('format') or 'ttl'
+    dataset_dicts, count, next_cursor = search_changes(context, since, cursor)
+
+    organization_cache.prefetch([d for d in dataset_dicts if d.get('state') != 'deleted'])
+
+    serializer = ChangesSerializer(profiles=data_dict.get('profiles'))
+    return serializer.serialize_changes(
+        dataset_dicts, since, count,
+        current=changes_page_url(_format, since, cursor),
+        next_url=next_cursor and changes_page_url(_format, since, next_cursor),
+        _format=url_to_rdflib_format(_format),
+    )
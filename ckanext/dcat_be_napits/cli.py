@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import sys
+import json
+
+import click
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.dcat_be_napits.cache import dataset_graph_cache
+from ckanext.dcat_be_napits.export import export_catalog, DEFAULT_CHUNK_SIZE
+from ckanext.dcat_be_napits.parsing import parse_catalog
+from ckanext.dcat_be_napits.profiler import DEFAULT_FORMATS as DEFAULT_PROFILE_FORMATS, profile_dataset, report, sample
+from ckanext.dcat_be_napits.streaming import iter_catalog_datasets
+from ckanext.dcat_be_napits import validation
+from ckanext.dcat_be_napits.vocabulary import build_index, read_concepts, BUNDLED_VOCABULARIES
+
+
+@click.group()
+def dcat_be_napits():
+    """DCAT utilities for the Belgian NAP"""
+    pass
+
+
+@dcat_be_napits.command(context_settings={"show_default": True})
+@click.argument("output", type=click.File(mode="wb"))
+@click.option(
+    "-f", "--format", "_format", type=click.Choice(["ttl", "nt"]), default="ttl",
+    help="Serialization format",
+)
+@click.option(
+    "-w", "--workers", type=click.IntRange(min=1), default=os.cpu_count() or 1,
+    help="Number of worker processes rendering the datasets",
+)
+@click.option(
+    "-c", "--chunk-size", type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE,
+    help="Number of datasets sent to a worker at a time",
+)
+@click.option(
+    "--canonical", is_flag=True,
+    help="Write each dataset as sorted N-Triples with stable blank nodes (N-Triples only)",
+)
+@click.pass_context
+def export(ctx, output, _format, workers, chunk_size, canonical):
+    """
+    Writes the whole MobilityDCAT-AP catalog, datasets and catalog records
+    included, to OUTPUT (a file path, or - for stdout), e.g.:
+
+        ckan dcat-be-napits export --workers 8 catalog.ttl
+    """
+    if canonical and _format != "nt":
+        raise click.UsageError("--canonical needs --format nt")
+    with ctx.meta["flask_app"].test_request_context():
+        count = export_catalog(output, _format=_format, workers=workers, chunk_size=chunk_size,
+                               canonical=canonical)
+    click.secho("Exported {0} datasets".format(count), fg="green", err=True)
+
+
+@dcat_be_napits.command("parse-catalog", context_settings={"show_default": True})
+@click.argument("source", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.File(mode="w"))
+@click.option(
+    "-f", "--format", "_format", type=click.Choice(["nt", "ttl", "xml", "jsonld"]), default="nt",
+    help="Serialization format of SOURCE",
+)
+@click.pass_context
+def parse_catalog_command(ctx, source, output, _format):
+    """
+    Parses the MobilityDCAT-AP catalog file SOURCE, eg the catalog of another
+    NAP, one dataset at a time and writes the dataset dicts to OUTPUT (a file
+    path, or - for stdout) as JSON lines, e.g.:
+
+        ckan dcat-be-napits parse-catalog --format nt catalog.nt datasets.jsonl
+    """
+    count = 0
+    with ctx.meta["flask_app"].test_request_context():
+        for dataset_dict in parse_catalog(source, _format):
+            output.write(json.dumps(dataset_dict) + "\n")
+            count += 1
+    click.secho("Parsed {0} datasets".format(count), fg="green", err=True)
+
+
+@dcat_be_napits.command("build-vocabularies")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.argument("sources", nargs=-1, type=click.Path(exists=True))
+@click.option(
+    "--no-bundled", is_flag=True,
+    help="Leave out the vocabularies bundled with the extension",
+)
+def build_vocabularies(output, sources, no_bundled):
+    """
+    Builds the vocabulary index OUTPUT from the SKOS files, or directories of
+    SKOS files, in SOURCES and the bundled vocabularies, e.g.:
+
+        ckan dcat-be-napits build-vocabularies vocabularies.idx mobility-theme.ttl nuts.rdf
+
+    Point ckanext.dcat_be_napits.vocabularies.index to OUTPUT to use it.
+    """
+    paths = list(sources) if no_bundled else [BUNDLED_VOCABULARIES] + list(sources)
+    concepts = read_concepts(paths)
+    count = build_index(concepts, output)
+    click.secho("Indexed {0} concepts ({1} URIs)".format(len(concepts), count), fg="green", err=True)
+
+
+@dcat_be_napits.command(context_settings={"show_default": True})
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option(
+    "-w", "--workers", type=click.IntRange(min=1), default=os.cpu_count() or 1,
+    help="Number of worker processes validating the datasets",
+)
+@click.option(
+    "-c", "--chunk-size", type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE,
+    help="Number of datasets validated at a time",
+)
+@click.option(
+    "-s", "--shapes", "shape_paths", multiple=True, type=click.Path(exists=True, dir_okay=False),
+    help="SHACL shapes (Turtle) to validate against, can be repeated; default: the bundled shapes",
+)
+@click.option(
+    "-i", "--incremental", is_flag=True,
+    help="Only validate the datasets that changed since the report in OUTPUT was written",
+)
+@click.pass_context
+def validate(ctx, output, workers, chunk_size, shape_paths, incremental):
+    """
+    Validates the rendered MobilityDCAT-AP datasets against SHACL shapes and
+    writes a report per dataset to OUTPUT, as JSON lines. Exits with status 1
+    if a dataset has violations, e.g.:
+
+        ckan dcat-be-napits validate --workers 8 --incremental validation.jsonl
+    """
+    if validation.pyshacl is None:
+        raise click.ClickException("SHACL validation needs pyshacl: pip install pyshacl")
+
+    previous = {}
+    if incremental and os.path.exists(output):
+        with open(output) as f:
+            previous = dict((dataset_report["id"], dataset_report) for dataset_report in map(json.loads, f))
+
+    reports = []
+    with ctx.meta["flask_app"].test_request_context():
+        with open(output + ".tmp", "w") as f:
+            for dataset_report in validation.validate_catalog(
+                    workers=workers, chunk_size=chunk_size, shape_paths=list(shape_paths) or None,
+                    previous=previous):
+                f.write(json.dumps(dataset_report) + "\n")
+                reports.append({"conforms": dataset_report["conforms"], "results": dataset_report["results"]})
+    os.replace(output + ".tmp", output)
+
+    count, invalid, violations = validation.summary(reports)
+    for (path, constraint), violation_count in violations:
+        click.echo("{0:>8} {1} {2}".format(violation_count, path or "-", constraint))
+    click.secho("{0} of {1} datasets have violations".format(invalid, count),
+                fg="red" if invalid else "green", err=True)
+    if invalid:
+        ctx.exit(1)
+
+
+@dcat_be_napits.command("profile-datasets", context_settings={"show_default": True})
+@click.option(
+    "-d", "--dataset", "dataset_ids", multiple=True,
+    help="Profile this dataset (id or name), can be repeated; default: the whole catalog",
+)
+@click.option(
+    "-s", "--sample", "sample_size", type=click.IntRange(min=1),
+    help="Profile this many datasets, picked at random",
+)
+@click.option("--seed", type=int, help="Seed of the random sample")
+@click.option(
+    "-f", "--format", "formats", multiple=True, default=DEFAULT_PROFILE_FORMATS,
+    help="rdflib formats to serialize the datasets to, can be repeated",
+)
+@click.option("-n", "--top", type=click.IntRange(min=1), default=20, help="Number of datasets listed")
+@click.option("--no-memory", is_flag=True, help="Skip the tracemalloc pass")
+@click.option(
+    "--csv", "csv_output", type=click.File(mode="w"),
+    help="Also write the cost of every dataset to this CSV file",
+)
+@click.pass_context
+def profile_datasets(ctx, dataset_ids, sample_size, seed, formats, top, no_memory, csv_output):
+    """
+    Renders datasets through the MobilityDCAT-AP profile one by one and
+    reports the most expensive ones, a histogram of the render times and the
+    fields driving the cost, e.g.:
+
+        ckan dcat-be-napits profile-datasets --sample 500 --top 20
+    """
+    dataset_graph_cache.configure(max_size=0, max_age=0)
+    with ctx.meta["flask_app"].test_request_context():
+        if dataset_ids:
+            show = toolkit.get_action("package_show")
+            dataset_dicts = [show({"ignore_auth": True}, {"id": dataset_id}) for dataset_id in dataset_ids]
+        else:
+            dataset_dicts = iter_catalog_datasets()
+            if sample_size:
+                dataset_dicts = sample(dataset_dicts, sample_size, seed)
+
+        costs = []
+        with click.progressbar(dataset_dicts, label="Rendering", file=sys.stderr) as bar:
+            for dataset_dict in bar:
+                costs.append(profile_dataset(dataset_dict, formats=list(formats), trace_memory=not no_memory))
+
+    for line in report(costs, top=top):
+        click.echo(line)
+
+    if csv_output:
+        features = list(costs[0].features) if costs else []
+        writer = csv.writer(csv_output)
+        writer.writerow(["id", "name", "seconds", "serialize_seconds", "triples"]
+                        + ["bytes_" + _format for _format in formats] + ["peak_memory"] + features)
+        for cost in costs:
+            writer.writerow([cost.id, cost.name, cost.seconds, cost.serialize_seconds, cost.triples]
+                            + [cost.bytes[_format] for _format in formats] + [cost.peak_memory]
+                            + [cost.features[feature] for feature in features])
+
+
+def get_commands():
+    return [dcat_be_napits]
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Conditional GET for the DCAT endpoints.
+
+Before the view runs, a validator is computed for the requested catalog page
+or dataset from a cheap search: the highest `metadata_modified`, the number of
+datasets, the profile version and a fingerprint of the static catalog
+metadata. Requests whose `If-None-Match` still matches get a 304 without any
+graph being built. Other responses get the validator as `ETag` and
+`Last-Modified` headers.
+
+`If-Modified-Since` alone is only answered for datasets: deleting a dataset or
+editing the catalog config doesn't move the highest `metadata_modified` of a
+catalog, only its `ETag`.
+
+Organization changes don't bump `metadata_modified`, so the publisher details
+in a page can be outdated until one of its datasets changes.
+"""
+import hashlib
+import logging
+from collections import namedtuple
+
+from dateutil.parser import parse as parse_date
+from flask import Response, g
+
+import ckan.plugins.toolkit as toolkit
+from ckan.lib.search import SearchError
+
+from ckanext.dcat_be_napits import changes
+from ckanext.dcat_be_napits.cache import CATALOG_CONFIG_OPTIONS
+from ckanext.dcat_be_napits.canonical import blank_nodes
+from ckanext.dcat_be_napits.profiles import euro_dcat_ap_2, euro_mobility_dcat_ap
+from ckanext.dcat_be_napits.utils import PROFILE_VERSION
+from ckanext.dcat_be_napits.vocabulary import vocabulary_index
+
+log = logging.getLogger(__name__)
+
+Validator = namedtuple('Validator', ['etag', 'last_modified'])
+
+# Endpoints whose Last-Modified moves with every change of the response
+DATED_ENDPOINTS = ('dcat.read_dataset', 'dcat.read_dataset_series')
+
+
+def catalog_header_fingerprint():
+    '''
+    Returns a hash of everything the catalog header is built from, except
+    the datasets: the hardcoded catalog metadata of the profiles and the
+    config they read
+    '''
+    static_values = [
+        euro_dcat_ap_2.CATALOG_DESCRIPTION,
+        euro_dcat_ap_2.CATALOG_ISSUED.isoformat(),
+        euro_dcat_ap_2.CATALOG_LICENSE_TYPE,
+        euro_dcat_ap_2.CATALOG_THEME_TAXONOMY,
+        euro_dcat_ap_2.CATALOG_PUBLISHER_UUID,
+        euro_dcat_ap_2.CATALOG_PUBLISHER_NAME,
+        euro_dcat_ap_2.CATALOG_PUBLISHER_ADDRESS,
+        euro_dcat_ap_2.CATALOG_PUBLISHER_MBOX,
+        sorted(euro_dcat_ap_2.SUPPORTED_LANGUAGES_MAP.values()),
+        euro_mobility_dcat_ap.EURO_SCHEME_URI_COUNTRY,
+        euro_mobility_dcat_ap.CONCEPT_URI_BEL,
+    ]
+    config_values = [toolkit.config.get(option) for option in CATALOG_CONFIG_OPTIONS]
+    return hashlib.sha1(repr((static_values, config_values)).encode('utf-8')).hexdigest()
+
+
+def _validator(query, *keys):
+    '''
+    Builds a Validator from a `package_search` sorted on `metadata_modified
+    desc`, and `keys` identifying the response
+    '''
+    last_modified = None
+    if query['results']:
+        last_modified = parse_date(query['results'][0]['metadata_modified'])
+        if last_modified.tzinfo is not None:
+            last_modified = last_modified.replace(tzinfo=None)
+    etag_source = repr((
+        PROFILE_VERSION,
+        vocabulary_index.fingerprint,
+        blank_nodes.mode,
+        catalog_header_fingerprint(),
+        last_modified and last_modified.isoformat(),
+        query['count'],
+    ) + keys)
+    return Validator(hashlib.sha1(etag_source.encode('utf-8')).hexdigest(), last_modified)
+
+
+def catalog_validator(_format):
+    '''
+    Validator of a catalog page, for the same request args as
+    `ckanext.dcat.utils.read_catalog_page`
+    '''
+    toolkit.check_access('dcat_catalog_show', {}, {})
+    args = toolkit.request.args
+
+    fq_list = ['-dataset_type:harvest', '-dataset_type:showcase']
+    modified_since = args.get('modified_since')
+    if modified_since:
+        try:
+            modified_since = parse_date(modified_since).isoformat() + 'Z'
+        except (ValueError, OverflowError):
+            return None
+        fq_list.append('metadata_modified:[{0} TO NOW]'.format(modified_since))
+
+    # Any change moves a dataset to the first page, so the highest
+    # metadata_modified of the whole result set covers every page
+    query = toolkit.get_action('package_search')({}, {
+        'q': args.get('q') or '*:*',
+        'fq': args.get('fq') or '',
+        'fq_list': fq_list,
+        'sort': 'metadata_modified desc',
+        'fl': ['id', 'metadata_modified'],
+        'rows': 1,
+    })
+    return _validator(query, 'catalog', _format, sorted(args.items(multi=True)))
+
+
+def full_catalog_validator(_format):
+    toolkit.check_access('dcat_catalog_show', {}, {})
+    query = toolkit.get_action('package_search')({}, {
+        'q': '*:*',
+        'fq_list': ['-dataset_type:harvest', '-dataset_type:showcase'],
+        'sort': 'metadata_modified desc',
+        'fl': ['id', 'metadata_modified'],
+        'rows': 1,
+    })
+    args = toolkit.request.args
+    return _validator(query, 'full_catalog', _format, args.get('lang'), args.get('canonical'))
+
+
+def changes_validator(_format):
+    toolkit.check_access('dcat_catalog_show', {}, {})
+    args = toolkit.request.args
+    try:
+        since = changes.solr_date(changes.parse_since(args.get('since')))
+    except toolkit.ValidationError:
+        return None
+    query = toolkit.get_action('package_search')({}, {
+        'q': '*:*',
+        'fq_list': changes.CATALOG_FQ_LIST + ['metadata_modified:{{{0} TO *]'.format(since)],
+        'sort': 'metadata_modified desc',
+        'fl': ['id', 'metadata_modified'],
+        'include_deleted': True,
+        'rows': 1,
+    })
+    return _validator(query, 'changes', _format, sorted(args.items(multi=True)))
+
+
+def dataset_validator(_id, _format):
+    toolkit.check_access('dcat_dataset_show', {}, {'id': _id})
+    _id = _id.replace('\\', '').replace('"', '')
+    query = toolkit.get_action('package_search')({}, {
+        'fq': '(id:"{0}" OR name:"{0}")'.format(_id),
+        'sort': 'metadata_modified desc',
+        'fl': ['id', 'metadata_modified'],
+        'include_private': True,
+        'rows': 1,
+    })
+    if not query['results']:
+        # Let the view answer
+        return None
+    return _validator(query, 'dataset', query['results'][0]['id'], _format,
+                      sorted(toolkit.request.args.items(multi=True)))
+
+
+def _view_validator(endpoint, view_args):
+    _format = view_args.get('_format')
+    if not _format:
+        # Content negotiation or the HTML page
+        return None
+    if endpoint == 'dcat.read_catalog':
+        return catalog_validator(_format)
+    if endpoint in ('dcat.read_dataset', 'dcat.read_dataset_series'):
+        return dataset_validator(view_args['_id'], _format)
+    if endpoint == 'dcat_be_napits.read_full_catalog':
+        return full_catalog_validator(_format)
+    if endpoint == 'dcat_be_napits.read_catalog_changes':
+        return changes_validator(_format)
+    return None
+
+
+def _not_modified(validator):
+    request = toolkit.request
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(validator.etag)
+    if request.endpoint not in DATED_ENDPOINTS:
+        return False
+    if request.if_modified_since and validator.last_modified:
+        if_modified_since = request.if_modified_since.replace(tzinfo=None)
+        return validator.last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def _set_validator_headers(response, validator):
+    # Weak: the serializations are equivalent, but blank node ids differ
+    response.set_etag(validator.etag, weak=True)
+    if validator.last_modified:
+        response.last_modified = validator.last_modified
+
+
+def before_request():
+    '''
+    Answers conditional requests to the DCAT endpoints with a 304 when
+    nothing changed
+    '''
+    request = toolkit.request
+    if request.method not in ('GET', 'HEAD') or not request.endpoint:
+        return None
+    try:
+        validator = _view_validator(request.endpoint, request.view_args or {})
+    except (toolkit.NotAuthorized, toolkit.ObjectNotFound, toolkit.ValidationError, SearchError):
+        # The view reports these
+        return None
+    if validator is None:
+        return None
+
+    g.dcat_be_napits_validator = validator
+    if _not_modified(validator):
+        response = Response(status=304)
+        _set_validator_headers(response, validator)
+        return response
+    return None
+
+
+def after_request(response):
+    validator = g.get('dcat_be_napits_validator')
+    if validator is not None and response.status_code == 200:
+        _set_validator_headers(response, validator)
+    return response
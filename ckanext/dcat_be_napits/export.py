@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel export of the whole catalog.
+
+The parent process pages through the datasets, as for the streaming catalog,
+and hands chunks of them, together with their organizations, to a pool of
+worker processes. The workers render and serialize the chunks without touching
+the database, and the parent writes the results in order after the catalog
+header.
+"""
+import os
+import time
+import logging
+import multiprocessing
+from collections import deque
+
+from ckanext.dcat.profiles.base import CleanedURIRef
+
+from ckanext.dcat_be_napits.cache import dataset_graph_cache, graph_cache_bypass, organization_cache
+from ckanext.dcat_be_napits.streaming import (
+    StreamingCatalogSerializer,
+    iter_catalog_datasets,
+    streaming_format,
+)
+from ckanext.dcat_be_napits.utils import catalog_uri
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100
+
+# Serializer of a worker process, set up by `_init_worker`
+_worker_serializer = None
+
+
+def iter_chunks(dataset_dicts, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Groups `dataset_dicts` in lists of `chunk_size` datasets, each one along
+    with the (cached) dicts of their organizations
+    '''
+    chunk = []
+    for dataset_dict in dataset_dicts:
+        chunk.append(dataset_dict)
+        if len(chunk) >= chunk_size:
+            yield chunk, _chunk_organizations(chunk)
+            chunk = []
+    if chunk:
+        yield chunk, _chunk_organizations(chunk)
+
+
+def _chunk_organizations(dataset_dicts):
+    org_dicts = {}
+    for dataset_dict in dataset_dicts:
+        org = dataset_dict.get('organization')
+        if org and org['id'] not in org_dicts:
+            org_dicts[org['id']] = organization_cache[org['id']]
+    return org_dicts
+
+
+def _init_worker(profiles):
+    global _worker_serializer
+    _worker_serializer = StreamingCatalogSerializer(profiles=profiles)
+    # Each dataset is rendered once, don't keep its triples around
+    dataset_graph_cache.configure(max_size=0, max_age=0)
+
+
+def render_chunk(chunk, _format, serializer=None, canonical=False):
+    '''
+    Renders a chunk from `iter_chunks` and returns it serialized in `_format`
+    (an rdflib format), or as canonical N-Triples if `canonical`
+    '''
+    dataset_dicts, org_dicts = chunk
+    serializer = serializer or _worker_serializer
+    for org_id, org_dict in org_dicts.items():
+        organization_cache[org_id] = org_dict
+    catalog_ref = CleanedURIRef(catalog_uri())
+    if canonical:
+        return b''.join(serializer.serialize_canonical_entry(dataset_dict, catalog_ref)
+                        for dataset_dict in dataset_dicts)
+    graph = serializer.graph_from_catalog_entries(dataset_dicts, catalog_ref)
+    return graph.serialize(format=_format, encoding='utf-8')
+
+
+def render_chunks(chunks, _format, serializer, workers=1, profiles=None, canonical=False):
+    '''
+    Renders the chunks of `iter_chunks` with `workers` processes and yields
+    each chunk with its output, in order, ready to be written after the
+    previous ones by `serializer`
+    '''
+    if workers == 1:
+        # Like the workers, doesn't keep the triples of each dataset around
+        with graph_cache_bypass():
+            for chunk in chunks:
+                yield chunk, serializer.merge_chunk(render_chunk(chunk, _format, serializer, canonical), _format)
+        return
+
+    # Forked workers inherit the loaded config and plugins. They only get the
+    # chunks to render, the parent keeps all database access.
+    context = multiprocessing.get_context('fork')
+    with context.Pool(workers, initializer=_init_worker, initargs=(profiles,)) as pool:
+        # Chunks are submitted a few at a time, so the parent doesn't read the
+        # whole catalog ahead of the workers, and yielded in order
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.apply_async(render_chunk, (chunk, _format, None, canonical))))
+            if len(pending) >= workers * 2:
+                chunk, result = pending.popleft()
+                yield chunk, serializer.merge_chunk(result.get(), _format)
+        while pending:
+            chunk, result = pending.popleft()
+            yield chunk, serializer.merge_chunk(result.get(), _format)
+
+
+def export_catalog(output, _format='ttl', workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   profiles=None, dataset_dicts=None, canonical=False):
+    '''
+    Writes the whole catalog serialized in `_format` (N-Triples or Turtle) to
+    the binary file object `output`, rendering it with `workers` processes.
+    With `canonical`, each dataset is written as canonical N-Triples.
+
+    Returns the number of datasets written.
+    '''
+    _format = streaming_format(_format)
+    if canonical and _format != 'nt':
+        raise ValueError('Only N-Triples can be canonical')
+    workers = workers or os.cpu_count() or 1
+    if dataset_dicts is None:
+        dataset_dicts = iter_catalog_datasets()
+
+    serializer = StreamingCatalogSerializer(profiles=profiles)
+    output.write(serializer.serialize_catalog_header(_format, canonical=canonical))
+
+    started = time.time()
+    count = 0
+    chunks = iter_chunks(dataset_dicts, chunk_size)
+    for chunk, data in render_chunks(chunks, _format, serializer, workers, profiles, canonical):
+        output.write(data)
+        count += len(chunk[0])
+
+    log.info('Exported %d datasets in %.1fs with %d workers', count, time.time() - started, workers)
+    return count
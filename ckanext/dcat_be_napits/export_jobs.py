@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Background exports of the whole catalog.
+
+`dcat_be_napits_export_start` puts an export on CKAN's job queue and returns
+its id right away; `dcat_be_napits_export_show` tells how far it got and,
+once it is complete, where to download it. The export is a gzip file with a
+member per chunk of datasets, so no web request holds a worker while the
+catalog is rendered.
+
+After each chunk, the export saves a checkpoint: the datasets done, the last
+dataset id (they are exported in id order) and the size of the file so far.
+When the worker running an export dies, eg on a restart, the export is put
+back on the queue the next time an export of the same catalog is started. It
+then resumes from its last checkpoint: the file is truncated to the
+checkpoint's size and the datasets after its last id are exported.
+"""
+import os
+import re
+import gzip
+import json
+import uuid
+import fcntl
+import logging
+import datetime
+import contextlib
+
+import ckan.plugins.toolkit as toolkit
+from ckan.lib import jobs
+
+from ckanext.dcat_be_napits.changes import CATALOG_FQ_LIST
+from ckanext.dcat_be_napits.export import DEFAULT_CHUNK_SIZE, iter_chunks, render_chunks
+from ckanext.dcat_be_napits.fragments import COMPRESS_LEVEL
+from ckanext.dcat_be_napits.jobs import WAITING_STATUSES
+from ckanext.dcat_be_napits.streaming import (
+    StreamingCatalogSerializer,
+    after_id_fq,
+    iter_catalog_datasets,
+    streaming_format,
+)
+from ckanext.dcat_be_napits.utils import PROFILE_VERSION, language_scope, uri_scope
+
+log = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+# rq statuses of a job that has a worker, or will get one
+LIVE_STATUSES = WAITING_STATUSES + ('started',)
+
+DEFAULT_TIMEOUT = 6 * 3600
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# File extension of the exports, per rdflib format
+EXTENSIONS = {
+    'nt': 'nt',
+    'turtle': 'ttl',
+}
+
+# Fields of the state only the export itself needs
+CHECKPOINT_FIELDS = ('cursor', 'offset', 'version')
+
+_EXPORT_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _now():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def _catalog_version():
+    '''
+    Changes when the exported catalog may change: the profile version, the
+    latest `metadata_modified` and the number of datasets. Organization
+    edits don't change it.
+    '''
+    query = toolkit.get_action('package_search')({'ignore_auth': True}, {
+        'q': '*:*',
+        'fq_list': CATALOG_FQ_LIST,
+        'sort': 'metadata_modified desc',
+        'fl': ['id', 'metadata_modified'],
+        'rows': 1,
+    })
+    last_modified = query['results'][0]['metadata_modified'] if query['results'] else None
+    return [PROFILE_VERSION, last_modified, query['count']]
+
+
+def _after(cursor):
+    return after_id_fq(cursor) if cursor else None
+
+
+def _count_datasets(cursor=None):
+    fq_list = list(CATALOG_FQ_LIST)
+    if cursor:
+        fq_list.append(_after(cursor))
+    return toolkit.get_action('package_search')({'ignore_auth': True}, {
+        'q': '*:*',
+        'fq_list': fq_list,
+        'rows': 0,
+    })['count']
+
+
+def export_dict(state):
+    '''
+    Returns the state of an export without its checkpoint
+    '''
+    return dict((key, value) for key, value in state.items() if key not in CHECKPOINT_FIELDS)
+
+
+class ExportJobs(object):
+    '''
+    The background exports, kept in directory `path`: the state of each one
+    (`<id>.json`), its file while it is written (`<id>.<ext>.gz.part`) and
+    once it is complete (`<id>.<ext>.gz`). An empty `path` disables them.
+    Exports are started and resumed holding a lock on `path/.lock`.
+
+    Exports are enqueued with `backend`, `ckan.lib.jobs` or a stand-in with
+    the same `enqueue` and `job_from_id` functions. Finished exports are
+    deleted after `max_age` seconds.
+    '''
+
+    def __init__(self, backend=jobs):
+        self.backend = backend
+        self.configure(None)
+
+    def configure(self, path, queue=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                  timeout=DEFAULT_TIMEOUT, max_age=DEFAULT_MAX_AGE):
+        self.path = path or None
+        self.queue = queue or jobs.DEFAULT_QUEUE_NAME
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_age = max_age
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def _file(self, export_id, suffix):
+        return os.path.join(self.path, export_id + suffix)
+
+    def file_path(self, state):
+        '''
+        Path of the file of export `state` once it is complete
+        '''
+        return self._file(state['id'], '.{0}.gz'.format(EXTENSIONS[state['format']]))
+
+    def _part_path(self, state):
+        return self.file_path(state) + '.part'
+
+    def get(self, export_id):
+        '''
+        Returns the state of export `export_id`, or None if there is none
+        '''
+        if not self.enabled or not _EXPORT_ID.match(export_id or ''):
+            return None
+        try:
+            with open(self._file(export_id, '.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _save(self, state):
+        # Written aside and renamed, so readers never see a partial state
+        state['updated'] = _now()
+        path = self._file(state['id'], '.json')
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _states(self):
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith('.json'):
+                state = self.get(name[:-len('.json')])
+                if state is not None:
+                    yield state
+
+    def _job_id(self, export_id):
+        return 'dcat_be_napits-export-{0}'.format(export_id)
+
+    def _enqueue(self, state):
+        return self.backend.enqueue(
+            run_export, args=[state['id']], title='DCAT export {0}'.format(state['id']), queue=self.queue,
+            rq_kwargs={'job_id': self._job_id(state['id']), 'timeout': self.timeout})
+
+    @contextlib.contextmanager
+    def _lock(self):
+        # Across processes, so two requests don't both start or resume
+        # the same export
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _alive(self, export_id):
+        try:
+            job = self.backend.job_from_id(self._job_id(export_id))
+        except KeyError:
+            return False
+        return job.get_status() in LIVE_STATUSES
+
+    def start(self, _format='ttl', lang=None):
+        '''
+        Starts an export of the catalog in `_format` (N-Triples or Turtle),
+        with literals in all languages or in `lang` only, and returns its
+        state. An export of the same catalog that is still running, or that
+        is complete and up to date, is returned instead. A running export
+        that no worker runs anymore is put back on the queue first.
+        '''
+        _format = streaming_format(_format)
+        os.makedirs(self.path, exist_ok=True)
+        version = _catalog_version()
+        with self._lock():
+            self.prune()
+            for state in self._states():
+                if state['format'] != _format or state['lang'] != lang:
+                    continue
+                if state['status'] in (QUEUED, RUNNING):
+                    return self._resume(state)
+                if state['status'] == COMPLETE and state['version'] == version:
+                    return state
+            return self._create(_format, lang, version)
+
+    def _create(self, _format, lang, version):
+        state = {
+            'id': uuid.uuid4().hex,
+            'format': _format,
+            'lang': lang,
+            'status': QUEUED,
+            'total': version[2],
+            'done': 0,
+            'bytes': 0,
+            'size': 0,
+            'chunks': 0,
+            'resumed': 0,
+            'created': _now(),
+            'started': None,
+            'finished': None,
+            'error': None,
+            'cursor': None,
+            'offset': 0,
+            'version': version,
+        }
+        self._save(state)
+        self._enqueue(state)
+        log.info('Started export %s of the catalog in %s', state['id'], _format)
+        return state
+
+    def _resume(self, state):
+        # Puts an unfinished export back on the queue if no worker runs it,
+        # to resume from its last checkpoint
+        if not self._alive(state['id']):
+            log.warning('Export %s lost its worker, resuming it after %d datasets', state['id'], state['done'])
+            state['status'] = QUEUED
+            self._save(state)
+            self._enqueue(state)
+        return state
+
+    def run(self, export_id):
+        '''
+        Runs export `export_id`, from its last checkpoint if it has one
+        '''
+        state = self.get(export_id)
+        if state is None or state['status'] == COMPLETE:
+            return
+        if state['offset']:
+            state['resumed'] += 1
+            log.info('Resuming export %s after %d datasets', export_id, state['done'])
+        state.update(status=RUNNING, started=state['started'] or _now(), error=None)
+        self._save(state)
+        try:
+            with uri_scope(), language_scope(state['lang']):
+                self._export(state)
+        except Exception as e:
+            state.update(status=FAILED, error=str(e))
+            self._save(state)
+            raise
+
+    def _export(self, state):
+        _format = state['format']
+        part_path = self._part_path(state)
+        serializer = StreamingCatalogSerializer()
+        if state['offset'] and not os.path.exists(part_path):
+            log.warning('The file of export %s is gone, starting it over', state['id'])
+            state.update(done=0, bytes=0, size=0, chunks=0, cursor=None, offset=0)
+        state['total'] = state['done'] + _count_datasets(state['cursor'])
+
+        with open(part_path, 'r+b' if os.path.exists(part_path) else 'w+b') as output:
+            # Drops what was written after the last checkpoint
+            output.truncate(state['offset'])
+            output.seek(state['offset'])
+
+            def checkpoint(data, dataset_dicts=()):
+                output.write(gzip.compress(data, COMPRESS_LEVEL))
+                output.flush()
+                os.fsync(output.fileno())
+                state['bytes'] += len(data)
+                state['offset'] = state['size'] = output.tell()
+                if dataset_dicts:
+                    state['done'] += len(dataset_dicts)
+                    state['chunks'] += 1
+                    state['cursor'] = dataset_dicts[-1]['id']
+                self._save(state)
+
+            if not state['offset']:
+                checkpoint(serializer.serialize_catalog_header(_format))
+            # Turtle chunks after a resume declare their prefixes again
+            chunks = iter_chunks(iter_catalog_datasets(fq=_after(state['cursor'])), self.chunk_size)
+            for chunk, data in render_chunks(chunks, _format, serializer, self.workers):
+                checkpoint(data, chunk[0])
+
+        os.replace(part_path, self.file_path(state))
+        state.update(status=COMPLETE, finished=_now())
+        self._save(state)
+        log.info('Export %s complete: %d datasets, %d bytes', state['id'], state['done'], state['size'])
+
+    def prune(self):
+        '''
+        Deletes the finished exports older than `max_age`
+        '''
+        if not self.max_age:
+            return
+        now = datetime.datetime.utcnow()
+        for state in list(self._states()):
+            if state['status'] not in (COMPLETE, FAILED):
+                continue
+            if (now - datetime.datetime.fromisoformat(state['updated'])).total_seconds() <= self.max_age:
+                continue
+            for path in (self.file_path(state), self._part_path(state), self._file(state['id'], '.json')):
+                if os.path.exists(path):
+                    os.remove(path)
+            log.debug('Deleted export %s', state['id'])
+
+
+def run_export(export_id):
+    '''
+    Job running export `export_id`
+    '''
+    export_jobs.run(export_id)
+
+
+export_jobs = ExportJobs()
@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk store of pre-serialized dataset fragments.
+
+A fragment is the output of `graph_from_dataset` and
+`graph_from_catalog_record` for one dataset, plus the `dcat:dataset` and
+`dcat:record` links from the catalog, serialized in one format. Fragments are
+written once, next to a gzip-compressed copy, and catalog pages are then put
+together from the stored bytes: only the catalog header (the catalog itself
+and the pagination) goes through rdflib's serializer.
+
+Each stored file starts with one line holding the namespaces the fragment
+declares, as JSON, followed by the bytes that go into the output as is:
+
+* N-Triples: the triples
+* Turtle: the statements, without the `@prefix` lines
+* JSON-LD: `,` followed by the node objects, without the enclosing array
+* RDF/XML: the elements inside `rdf:RDF`
+
+The file name is a hash of everything the fragment is rendered from besides
+the dataset itself, so editing an organization, bumping `PROFILE_VERSION` or
+loading another vocabulary index makes the old fragments miss. The variants
+of a dataset, eg in each language or blank node mode, are stored side by
+side. Writing a fragment removes the dataset's out of date ones, and all the
+files of updated and deleted datasets are removed by the plugin.
+
+Gzip members can be concatenated, so a gzip-encoded response is the stored
+`.gz` files joined with the few bytes compressed on the fly. Brotli streams
+can't be concatenated, so no brotli copy is kept.
+"""
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import itertools
+import tempfile
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.dcat.utils import url_to_rdflib_format
+
+from ckanext.dcat_be_napits.canonical import blank_nodes
+from ckanext.dcat_be_napits.cache import organization_cache
+from ckanext.dcat_be_napits.utils import PROFILE_VERSION, catalog_language, catalog_uri
+from ckanext.dcat_be_napits.vocabulary import vocabulary_index
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FORMATS = 'nt ttl jsonld xml'
+
+# rdflib formats that can be assembled from fragments, and their file extension
+FRAGMENT_FORMATS = {
+    'nt': 'nt',
+    'turtle': 'ttl',
+    'n3': 'n3',
+    'json-ld': 'jsonld',
+    'pretty-xml': 'rdf',
+}
+
+# Organization fields the profiles render for the publisher
+PUBLISHER_FIELDS = [
+    'title', 'do_website', 'do_email', 'do_tel',
+    'display_title_en', 'display_title_nl', 'display_title_fr', 'display_title_de',
+    'country', 'administrative_area', 'postal_code', 'city', 'street_address',
+]
+
+COMPRESS_LEVEL = 6
+
+_PREFIX_LINE = re.compile(br'^@prefix (\S*): <([^>]*)> \.$')
+_XMLNS = re.compile(br'xmlns:([\w.-]+)="([^"]*)"')
+_XML_DECLARATION = b'<?xml version="1.0" encoding="utf-8"?>\n'
+
+
+class FragmentConflict(Exception):
+    '''
+    The fragments of a page bind the same prefix to different namespaces, in
+    a format that needs all namespaces declared upfront
+    '''
+
+
+def split_serialization(output, rdflib_format):
+    '''
+    Splits the output of rdflib's serializer into the `[(prefix, namespace)]`
+    it declares and the bytes that can be concatenated with other fragments
+    '''
+    if rdflib_format in ('turtle', 'n3'):
+        lines = output.split(b'\n')
+        namespaces = []
+        while lines and lines[0].startswith(b'@prefix'):
+            prefix, namespace = _PREFIX_LINE.match(lines.pop(0)).groups()
+            namespaces.append((prefix.decode('utf-8'), namespace.decode('utf-8')))
+        body = b'\n'.join(lines).strip(b'\n')
+        return namespaces, body + b'\n\n' if body else b''
+
+    if rdflib_format == 'json-ld':
+        output = output.strip()
+        if output.startswith(b'{'):
+            return [], output
+        return [], output[1:-1].strip(b'\n')
+
+    if rdflib_format == 'pretty-xml':
+        start = output.index(b'<rdf:RDF')
+        end = output.index(b'>', start)
+        root = output[start:end]
+        namespaces = [(prefix.decode('utf-8'), namespace.decode('utf-8'))
+                      for prefix, namespace in _XMLNS.findall(root)]
+        if root.endswith(b'/'):
+            return namespaces, b''
+        body = output[end + 1:output.rindex(b'</rdf:RDF>')].strip(b'\n')
+        return namespaces, body + b'\n' if body else b''
+
+    return [], output
+
+
+def _hash(values):
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
+def content_key(dataset_dict):
+    '''
+    Returns a key of what the rendering of `dataset_dict` depends on in any
+    language or mode: the dataset, its organization, the profile version and
+    the vocabularies. Fragments with another key are never read again.
+    '''
+    organization = dataset_dict.get('organization') or {}
+    publisher = {}
+    if organization.get('id'):
+        try:
+            org_dict = organization_cache[organization['id']]
+        except KeyError:
+            org_dict = {}
+        publisher = dict((field, org_dict.get(field)) for field in PUBLISHER_FIELDS)
+    return _hash((
+        dataset_dict.get('metadata_modified'),
+        PROFILE_VERSION,
+        vocabulary_index.fingerprint,
+        sorted(organization.items()),
+        sorted(publisher.items()),
+    ))
+
+
+def render_key(dataset_dict, profiles):
+    '''
+    Returns a key of everything the rendering of `dataset_dict` with
+    `profiles` depends on: it changes when the rendered dataset may change.
+    It starts with the `content_key`, followed by the variant: the language,
+    the blank node mode, the profiles and the catalog URI.
+    '''
+    variant = _hash((
+        catalog_language(),
+        blank_nodes.mode,
+        [profile.__name__ for profile in profiles],
+        catalog_uri(),
+    ))
+    return '{0}-{1}'.format(content_key(dataset_dict), variant)
+
+
+class Fragment(object):
+
+    __slots__ = ('namespaces', 'body', 'path')
+
+    def __init__(self, namespaces, body, path=None):
+        self.namespaces = namespaces
+        self.body = body
+        self.path = path
+
+    def compressed(self):
+        '''
+        Returns the body as a gzip member, read from the store when possible
+        '''
+        if self.path:
+            try:
+                return _read(self.path + '.gz')
+            except (IOError, OSError):
+                pass
+        return gzip.compress(self.body, COMPRESS_LEVEL)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write(path, data):
+    # Written aside and renamed, so readers never see a partial file
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FragmentStore(object):
+    '''
+    Pre-serialized and precompressed dataset fragments, one directory per
+    dataset under `path`. An empty `path` disables the store.
+    '''
+
+    def __init__(self, path=None, formats=DEFAULT_FORMATS):
+        self.configure(path, formats)
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, path, formats=DEFAULT_FORMATS):
+        self.path = path or None
+        self.formats = set(url_to_rdflib_format(_format) for _format in toolkit.aslist(formats))
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def supports(self, rdflib_format):
+        return self.enabled and rdflib_format in self.formats and rdflib_format in FRAGMENT_FORMATS
+
+    def _dataset_directory(self, dataset_id):
+        return os.path.join(self.path, dataset_id[:2], dataset_id)
+
+    def _fragment_path(self, dataset_dict, rdflib_format, profiles):
+        return os.path.join(
+            self._dataset_directory(dataset_dict['id']),
+            '{0}.{1}'.format(render_key(dataset_dict, profiles), FRAGMENT_FORMATS[rdflib_format]))
+
+    def get(self, dataset_dict, rdflib_format, profiles):
+        '''
+        Returns the stored Fragment of `dataset_dict`, or None on a miss
+        '''
+        path = self._fragment_path(dataset_dict, rdflib_format, profiles)
+        try:
+            data = _read(path)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        header, _sep, body = data.partition(b'\n')
+        self.hits += 1
+        return Fragment([tuple(item) for item in json.loads(header)], body, path)
+
+    def put(self, dataset_dict, rdflib_format, profiles, output):
+        '''
+        Stores the output of rdflib's serializer for `dataset_dict` and
+        returns the Fragment. Other variants of the dataset, eg in another
+        language, are kept, unless they are out of date: rendered before the
+        dataset, its organization, the profile version or the vocabularies
+        changed.
+        '''
+        namespaces, body = split_serialization(output, rdflib_format)
+        if rdflib_format == 'json-ld' and body:
+            body = b',\n' + body
+        fragment = Fragment(namespaces, body)
+        path = self._fragment_path(dataset_dict, rdflib_format, profiles)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write(path, json.dumps(namespaces).encode('utf-8') + b'\n' + body)
+            _write(path + '.gz', gzip.compress(body, COMPRESS_LEVEL))
+            fragment.path = path
+            self._remove_outdated(directory, content_key(dataset_dict))
+        except (IOError, OSError) as e:
+            log.warning('Could not store the fragment of dataset %s: %s', dataset_dict['id'], e)
+        return fragment
+
+    def _remove_outdated(self, directory, key):
+        prefix = key + '-'
+        for name in os.listdir(directory):
+            if name.startswith(prefix) or name.startswith('.tmp-'):
+                continue
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                # Removed by another process meanwhile
+                pass
+
+    def invalidate(self, dataset_id):
+        if not self.enabled or not dataset_id:
+            return
+        shutil.rmtree(self._dataset_directory(dataset_id), ignore_errors=True)
+
+    def fragment(self, serializer, dataset_dict, catalog_ref, rdflib_format):
+        '''
+        Returns the Fragment of `dataset_dict`, rendering and storing it with
+        `serializer` (a StreamingCatalogSerializer) if it is not stored yet
+        '''
+        profiles = serializer._profiles
+        fragment = self.get(dataset_dict, rdflib_format, profiles)
+        if fragment is None:
+            graph = serializer.graph_from_catalog_entries(
+                [dataset_dict], catalog_ref, serializer.g.namespace_manager)
+            output = graph.serialize(format=rdflib_format, encoding='utf-8')
+            fragment = self.put(dataset_dict, rdflib_format, profiles, output)
+        return fragment
+
+
+fragment_store = FragmentStore()
+
+
+def _prefix_lines(namespaces, declared):
+    lines = []
+    for prefix, namespace in namespaces:
+        if declared.get(prefix) != namespace:
+            declared[prefix] = namespace
+            lines.append('@prefix {0}: <{1}> .\n'.format(prefix, namespace).encode('utf-8'))
+    return b''.join(lines)
+
+
+def _xml_root(namespaces):
+    declared = {}
+    for prefix, namespace in namespaces:
+        if declared.setdefault(prefix, namespace) != namespace:
+            raise FragmentConflict(prefix)
+    return b'<rdf:RDF\n' + b''.join(
+        '  xmlns:{0}="{1}"\n'.format(prefix, namespace).encode('utf-8')
+        for prefix, namespace in sorted(declared.items())) + b'>\n'
+
+
+def assemble(header, fragments, rdflib_format, compress=False):
+    '''
+    Yields the serialized catalog made of the `header` Fragment and the
+    dataset `fragments`, as bytes, or as gzip members if `compress` is set.
+
+    For RDF/XML, `fragments` must be a list, as the namespaces of all of them
+    are declared in the root element: raises a FragmentConflict if two of them
+    bind a prefix to different namespaces. The other formats can assemble any
+    iterable of fragments.
+    '''
+    def generated(data):
+        return gzip.compress(data, COMPRESS_LEVEL) if compress and data else data
+
+    def stored(fragment):
+        return fragment.compressed() if compress else fragment.body
+
+    if rdflib_format in ('turtle', 'n3'):
+        declared = {}
+        yield generated(_prefix_lines(header.namespaces, declared) + b'\n' + header.body)
+        for fragment in fragments:
+            prefixes = _prefix_lines(fragment.namespaces, declared)
+            if prefixes:
+                yield generated(prefixes + b'\n')
+            yield stored(fragment)
+
+    elif rdflib_format == 'json-ld':
+        yield generated(b'[\n' + header.body + b'\n')
+        for fragment in fragments:
+            yield stored(fragment)
+        yield generated(b'\n]\n')
+
+    elif rdflib_format == 'pretty-xml':
+        namespaces = list(header.namespaces)
+        for fragment in fragments:
+            namespaces.extend(fragment.namespaces)
+        yield generated(_XML_DECLARATION + _xml_root(namespaces) + header.body)
+        for fragment in fragments:
+            yield stored(fragment)
+        yield generated(b'</rdf:RDF>\n')
+
+    else:
+        yield generated(header.body)
+        for fragment in fragments:
+            yield stored(fragment)
+
+
+def iter_catalog(serializer, dataset_dicts, _format, pagination_info=None, catalog_dict=None,
+                 compress=False):
+    '''
+    Yields the catalog of `dataset_dicts` serialized in `_format`, assembled
+    from the fragment store. The fragments of datasets that are not stored
+    yet are rendered with `serializer` (a StreamingCatalogSerializer).
+
+    The static part of the catalog is serialized once per process, see
+    `graph_from_catalog_header`. Its `dct:modified` and the pagination are
+    serialized on each call, and follow it as one more fragment.
+
+    The header is rendered before the first chunk is yielded, and for RDF/XML
+    every fragment as well, so a FragmentConflict is raised before any output.
+    '''
+    rdflib_format = url_to_rdflib_format(_format)
+
+    catalog_ref, static_output = serializer.graph_from_catalog_header(rdflib_format, catalog_dict)
+    if pagination_info:
+        serializer._add_pagination_triples(pagination_info)
+    namespaces, body = split_serialization(
+        serializer.g.serialize(format=rdflib_format, encoding='utf-8'), rdflib_format)
+    if static_output is None:
+        header, dynamic = Fragment(namespaces, body), []
+    else:
+        header = Fragment(*split_serialization(static_output, rdflib_format))
+        if rdflib_format == 'json-ld' and body:
+            body = b',\n' + body
+        dynamic = [Fragment(namespaces, body)]
+
+    fragments = itertools.chain(dynamic, (
+        fragment_store.fragment(serializer, dataset_dict, catalog_ref, rdflib_format)
+        for dataset_dict in dataset_dicts))
+    if rdflib_format == 'pretty-xml':
+        fragments = list(fragments)
+
+    chunks = assemble(header, fragments, rdflib_format, compress=compress)
+    first = next(chunks)
+
+    def _chunks():
+        yield first
+        for chunk in chunks:
+            yield chunk
+
+    return _chunks()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Background re-rendering of edited datasets.
+
+When a dataset is created or updated, or an organization's publisher details
+change, a job is put on CKAN's job queue to render the datasets into the
+fragment store, in every stored format, so the next catalog request finds
+them there instead of rendering them itself.
+
+Jobs are enqueued once the edit is committed, so they never render the
+previous version. They have a fixed id per dataset or organization: a change
+to a dataset that already has a job waiting is merged into that job, which
+re-reads the dataset when it runs.
+"""
+import logging
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+import ckan.model as model
+import ckan.plugins.toolkit as toolkit
+from ckan.lib import jobs
+
+from ckanext.dcat.processors import RDF_PROFILES_CONFIG_OPTION, DEFAULT_RDF_PROFILES
+from ckanext.dcat.profiles.base import CleanedURIRef
+
+from ckanext.dcat_be_napits.fragments import fragment_store, PUBLISHER_FIELDS
+from ckanext.dcat_be_napits.streaming import (
+    StreamingCatalogSerializer,
+    iter_catalog_datasets,
+    STREAMING_PROFILES,
+)
+from ckanext.dcat_be_napits.utils import catalog_uri, uri_scope
+
+log = logging.getLogger(__name__)
+
+# Key of the jobs waiting for the commit in `Session.info`
+PENDING_KEY = 'dcat_be_napits_render_jobs'
+
+# rq statuses of a job that has not started yet
+WAITING_STATUSES = ('queued', 'deferred', 'scheduled')
+
+
+def _profile_sets():
+    '''
+    The profiles of the catalog pages and of the full catalog
+    '''
+    profiles = toolkit.aslist(toolkit.config.get(RDF_PROFILES_CONFIG_OPTION)) or DEFAULT_RDF_PROFILES
+    profile_sets = [profiles]
+    if profiles != STREAMING_PROFILES:
+        profile_sets.append(STREAMING_PROFILES)
+    return profile_sets
+
+
+def render_datasets(fq):
+    '''
+    Renders the catalog datasets matching Solr filter `fq` into the fragment
+    store. Fragments that are stored already are left alone. Returns the
+    number of datasets.
+    '''
+    if not fragment_store.enabled:
+        return 0
+    serializers = [StreamingCatalogSerializer(profiles=profiles) for profiles in _profile_sets()]
+    catalog_ref = CleanedURIRef(catalog_uri())
+    count = 0
+    with uri_scope():
+        for dataset_dict in iter_catalog_datasets(fq=fq):
+            for serializer in serializers:
+                for rdflib_format in fragment_store.formats:
+                    if fragment_store.supports(rdflib_format):
+                        fragment_store.fragment(serializer, dataset_dict, catalog_ref, rdflib_format)
+            count += 1
+    return count
+
+
+def render_dataset(dataset_id):
+    '''
+    Job rendering dataset `dataset_id`
+    '''
+    render_datasets('id:"{0}"'.format(dataset_id))
+
+
+def render_organization(organization_id):
+    '''
+    Job rendering the datasets of organization `organization_id`
+    '''
+    count = render_datasets('owner_org:"{0}"'.format(organization_id))
+    log.debug('Rendered %d datasets of organization %s', count, organization_id)
+
+
+def publisher_changed(old_org_dict, organization):
+    '''
+    Whether `organization` (a model.Group) differs from `old_org_dict` in a
+    field the profiles render for the publisher. Without an `old_org_dict`
+    to compare with, it might have.
+    '''
+    if old_org_dict is None:
+        return True
+    extras = organization.extras or {}
+    for field in PUBLISHER_FIELDS:
+        value = organization.title if field == 'title' else extras.get(field)
+        if (value or None) != (old_org_dict.get(field) or None):
+            return True
+    return False
+
+
+class RenderQueue(object):
+    '''
+    Enqueues the re-render jobs of edited datasets and organizations with
+    `backend`, `ckan.lib.jobs` or a stand-in with the same `enqueue` and
+    `job_from_id` functions.
+
+    `at_front` puts the jobs ahead of the other jobs of the queue.
+    '''
+
+    def __init__(self, backend=jobs):
+        self.backend = backend
+        self.enabled = False
+        self.queue = jobs.DEFAULT_QUEUE_NAME
+        self.at_front = False
+        self.merged = 0
+
+    def configure(self, enabled, queue=None, at_front=False):
+        self.enabled = enabled
+        self.queue = queue or jobs.DEFAULT_QUEUE_NAME
+        self.at_front = at_front
+        if enabled and not event.contains(model.Session, 'after_commit', self._after_commit):
+            event.listen(model.Session, 'after_commit', self._after_commit)
+            event.listen(model.Session, 'after_rollback', self._after_rollback)
+
+    def _pending(self, session=None):
+        return (session or model.Session).info.setdefault(PENDING_KEY, OrderedDict())
+
+    def dataset_changed(self, dataset_id):
+        if self.enabled and dataset_id:
+            self._pending()[('dataset', dataset_id)] = (render_dataset, dataset_id)
+
+    def organization_changed(self, organization_id):
+        if self.enabled and organization_id:
+            self._pending()[('organization', organization_id)] = (render_organization, organization_id)
+
+    def _after_commit(self, session):
+        pending = session.info.pop(PENDING_KEY, None)
+        for (kind, object_id), (fn, arg) in (pending or {}).items():
+            try:
+                self.enqueue(fn, arg, 'dcat_be_napits-{0}-{1}'.format(kind, object_id))
+            except Exception:
+                # The edit went through, the fragments will be rendered on request
+                log.exception('Could not enqueue the render job of %s %s', kind, object_id)
+
+    def _after_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
+
+    def flush(self):
+        '''
+        Enqueues the jobs of the current session without waiting for a commit
+        '''
+        self._after_commit(model.Session())
+
+    def enqueue(self, fn, arg, job_id):
+        '''
+        Enqueues `fn(arg)` as job `job_id`, unless that job is still waiting
+        to run. Returns the job.
+        '''
+        try:
+            job = self.backend.job_from_id(job_id)
+        except KeyError:
+            job = None
+        if job is not None and job.get_status() in WAITING_STATUSES:
+            self.merged += 1
+            return job
+        return self.backend.enqueue(
+            fn, args=[arg], title='DCAT render {0}'.format(arg), queue=self.queue,
+            rq_kwargs={'job_id': job_id, 'at_front': self.at_front})
+
+
+render_queue = RenderQueue()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+import logging
+from urllib.parse import urlencode
+
+from dateutil.parser import parse as parse_date
+from flask import has_request_context
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.dcat.logic import _search_ckan_datasets, _pagination_info, DATASETS_PER_PAGE
+from ckanext.dcat.processors import RDF_PROFILES_CONFIG_OPTION, DEFAULT_RDF_PROFILES
+from ckanext.dcat.utils import url_to_rdflib_format, DCAT_EXPOSE_SUBCATALOGS
+
+from ckanext.dcat_be_napits.cache import organization_cache
+from ckanext.dcat_be_napits.changes import (
+    serialize_changes_page,
+    encode_cursor,
+    keyset_fq,
+    CATALOG_FQ_LIST,
+)
+from ckanext.dcat_be_napits.export_jobs import export_jobs, export_dict, COMPLETE
+from ckanext.dcat_be_napits.fragments import fragment_store, iter_catalog, FragmentConflict
+from ckanext.dcat_be_napits.profiles.euro_dcat_ap_2 import SUPPORTED_LANGUAGES_MAP
+from ckanext.dcat_be_napits.streaming import StreamingCatalogSerializer
+from ckanext.dcat_be_napits.utils import catalog_uri, language_scope, uri_scope
+
+log = logging.getLogger(__name__)
+
+
+def uses_fragment_store(_format):
+    '''
+    Whether catalog pages in `_format` are assembled from the fragment store.
+    Subcatalogs group the datasets per harvest source, which fragments don't.
+    '''
+    return (fragment_store.supports(url_to_rdflib_format(_format or 'xml'))
+            and not toolkit.asbool(toolkit.config.get(DCAT_EXPOSE_SUBCATALOGS, False)))
+
+
+def _items_per_page():
+    return int(toolkit.config.get('ckanext.dcat.datasets_per_page', DATASETS_PER_PAGE))
+
+
+def _uses_keyset_pagination(data_dict):
+    '''
+    Pages requested by number keep the upstream offset pagination, so
+    existing links keep working
+    '''
+    return (not data_dict.get('page')
+            and toolkit.asbool(toolkit.config.get('ckanext.dcat_be_napits.keyset_pagination', True)))
+
+
+def _keyset_cursors(data_dict):
+    '''
+    Returns the `cursor` and `before` args of a keyset paginated catalog page.
+    The upstream view doesn't pass them on, so they are read from the request.
+    '''
+    keys = ('cursor', 'before')
+    if not any(data_dict.get(key) for key in keys) and has_request_context():
+        return tuple(toolkit.request.args.get(key) for key in keys)
+    return tuple(data_dict.get(key) for key in keys)
+
+
+def catalog_language_arg(data_dict):
+    '''
+    Returns the `lang` arg, the only language the literals of the catalog
+    are rendered in, or None for all of them. Like the cursors, it is read
+    from the request if the upstream view didn't pass it on.
+    '''
+    lang = data_dict.get('lang')
+    if not lang and has_request_context():
+        lang = toolkit.request.args.get('lang')
+    if lang and lang not in SUPPORTED_LANGUAGES_MAP:
+        raise toolkit.ValidationError({'lang': ['Unsupported language, use one of {0}'.format(
+            ', '.join(SUPPORTED_LANGUAGES_MAP))]})
+    return lang or None
+
+
+def _catalog_search_dict(data_dict):
+    '''
+    The `package_search` params of the upstream catalog query, without the
+    paging
+    '''
+    fq_list = list(CATALOG_FQ_LIST)
+    modified_since = data_dict.get('modified_since')
+    if modified_since:
+        try:
+            modified_since = parse_date(modified_since).isoformat() + 'Z'
+        except (ValueError, AttributeError, OverflowError):
+            raise toolkit.ValidationError('Wrong modified date format. Use ISO-8601 format')
+        fq_list.append('metadata_modified:[{0} TO NOW]'.format(modified_since))
+    return {
+        'q': data_dict.get('q') or '*:*',
+        'fq': data_dict.get('fq') or '',
+        'fq_list': fq_list,
+    }
+
+
+def _search_keyset_page(context, data_dict, cursor=None, before=None):
+    '''
+    Returns the datasets of a catalog page, newest first, that follow the
+    dataset `cursor` points to, or precede the one `before` points to, and
+    whether there are pages after and before it.
+
+    Filtering on `(metadata_modified, id)` instead of skipping the previous
+    pages keeps deep pages as cheap as the first one.
+    '''
+    rows = _items_per_page()
+    search_dict = _catalog_search_dict(data_dict)
+    search_dict['rows'] = rows + 1
+
+    if before:
+        # Walk back in ascending order, then restore the catalog order
+        search_dict['fq_list'].append(keyset_fq(before))
+        search_dict['sort'] = 'metadata_modified asc, id asc'
+        results = toolkit.get_action('package_search')(dict(context), search_dict)['results']
+        return list(reversed(results[:rows])), True, len(results) > rows
+
+    if cursor:
+        search_dict['fq_list'].append(keyset_fq(cursor, descending=True))
+    search_dict['sort'] = 'metadata_modified desc, id desc'
+    results = toolkit.get_action('package_search')(dict(context), search_dict)['results']
+    return results[:rows], len(results) > rows, bool(cursor)
+
+
+def _keyset_page_url(**cursor_args):
+    params = [(key, value) for key, value in toolkit.request.args.items()
+              if key in ('modified_since', 'profiles', 'q', 'fq', 'lang')]
+    params.extend((key, value) for key, value in cursor_args.items() if value)
+    url = '{0}{1}'.format(catalog_uri(), toolkit.request.path)
+    return '{0}?{1}'.format(url, urlencode(params)) if params else url
+
+
+def _keyset_pagination_info(context, data_dict, dataset_dicts, has_next, has_previous, cursor, before):
+    '''
+    Same as the upstream `_pagination_info`, with cursor links. There is no
+    link to the last page.
+    '''
+    search_dict = dict(_catalog_search_dict(data_dict), rows=0)
+    count = toolkit.get_action('package_search')(dict(context), search_dict)['count']
+    if count == 0:
+        return {}
+
+    pagination_info = {
+        'count': count,
+        'items_per_page': _items_per_page(),
+        'current': _keyset_page_url(cursor=cursor, before=before),
+        'first': _keyset_page_url(),
+    }
+    if has_next and dataset_dicts:
+        pagination_info['next'] = _keyset_page_url(cursor=encode_cursor(dataset_dicts[-1]))
+    if has_previous and dataset_dicts:
+        pagination_info['previous'] = _keyset_page_url(before=encode_cursor(dataset_dicts[0]))
+    return pagination_info
+
+
+def _serialize_catalog_page(context, data_dict):
+    '''
+    Same as the upstream catalog actions, but renders the page in one batch:
+    the publishers are loaded in one go and each URI is computed once.
+    Pages not requested by number are paginated with a keyset cursor.
+    '''
+    lang = catalog_language_arg(data_dict)
+    if _uses_keyset_pagination(data_dict):
+        cursor, before = _keyset_cursors(data_dict)
+        dataset_dicts, has_next, has_previous = _search_keyset_page(context, data_dict, cursor, before)
+        pagination_info = _keyset_pagination_info(
+            context, data_dict, dataset_dicts, has_next, has_previous, cursor, before)
+    else:
+        query = _search_ckan_datasets(context, data_dict)
+        dataset_dicts = query['results']
+        pagination_info = _pagination_info(query, data_dict)
+
+    organization_cache.prefetch(dataset_dicts)
+
+    # The same profiles as RDFSerializer, which the streaming serializer
+    # doesn't default to
+    profiles = (data_dict.get('profiles')
+                or toolkit.aslist(toolkit.config.get(RDF_PROFILES_CONFIG_OPTION))
+                or DEFAULT_RDF_PROFILES)
+
+    if uses_fragment_store(data_dict.get('format')):
+        serializer = StreamingCatalogSerializer(profiles=profiles)
+        with uri_scope(), language_scope(lang):
+            try:
+                return b''.join(iter_catalog(serializer, dataset_dicts, data_dict.get('format') or 'xml',
+                                             pagination_info=pagination_info)).decode('utf-8')
+            except FragmentConflict as e:
+                log.warning('Fragments bind prefix %s to different namespaces, serializing the page', e)
+
+    serializer = StreamingCatalogSerializer(profiles=profiles)
+
+    with uri_scope(), language_scope(lang):
+        return serializer.serialize_catalog({}, dataset_dicts,
+                                            _format=data_dict.get('format'),
+                                            pagination_info=pagination_info)
+
+
+@toolkit.chained_action
+@toolkit.side_effect_free
+def dcat_catalog_show(original_action, context, data_dict):
+
+    toolkit.check_access('dcat_catalog_show', context, data_dict)
+
+    return _serialize_catalog_page(context, data_dict)
+
+
+@toolkit.chained_action
+@toolkit.side_effect_free
+def dcat_catalog_search(original_action, context, data_dict):
+
+    toolkit.check_access('dcat_catalog_search', context, data_dict)
+
+    return _serialize_catalog_page(context, data_dict)
+
+
+@toolkit.side_effect_free
+def dcat_be_napits_catalog_changes(context, data_dict):
+    '''
+    Returns the datasets and catalog records modified after `since`, and
+    tombstones of the datasets deleted since then, serialized in `format`,
+    with literals in all languages or in `lang` only. Pages are linked with
+    an opaque `cursor`.
+    '''
+    toolkit.check_access('dcat_catalog_show', context, data_dict)
+
+    with language_scope(catalog_language_arg(data_dict)):
+        return serialize_changes_page(context, data_dict)
+
+
+def _export_dict(state):
+    export = export_dict(state)
+    if state['status'] == COMPLETE:
+        export['download_url'] = toolkit.url_for(
+            'dcat_be_napits.download_export', export_id=state['id'], _external=True)
+    return export
+
+
+def dcat_be_napits_export_start(context, data_dict):
+    '''
+    Starts an export of the whole catalog in the background, in `format`
+    (`ttl` or `nt`), with literals in all languages or in `lang` only, and
+    returns it, see `dcat_be_napits_export_show`. An export of the same
+    catalog that is still running, or complete and up to date, is returned
+    instead of a new one, and resumed if its worker died.
+    '''
+    toolkit.check_access('dcat_catalog_show', context, data_dict)
+    if not export_jobs.enabled:
+        raise toolkit.ValidationError({'export': ['Background exports are not enabled']})
+    lang = catalog_language_arg(data_dict)
+    try:
+        state = export_jobs.start(data_dict.get('format') or 'ttl', lang)
+    except ValueError as e:
+        raise toolkit.ValidationError({'format': [str(e)]})
+    return _export_dict(state)
+
+
+@toolkit.side_effect_free
+def dcat_be_napits_export_show(context, data_dict):
+    '''
+    Returns the export `id`: its `status` (queued, running, complete or
+    failed), the datasets `done` out of `total`, the `bytes` written and the
+    `size` of the compressed file, and once complete its `download_url`.
+    '''
+    toolkit.check_access('dcat_catalog_show', context, data_dict)
+    state = export_jobs.get(toolkit.get_or_bust(data_dict, 'id'))
+    if state is None:
+        raise toolkit.ObjectNotFound('Export not found')
+    return _export_dict(state)
+
+
+def get_actions():
+    return {
+        'dcat_catalog_show': dcat_catalog_show,
+        'dcat_catalog_search': dcat_catalog_search,
+        'dcat_be_napits_catalog_changes': dcat_be_napits_catalog_changes,
+        'dcat_be_napits_export_start': dcat_be_napits_export_start,
+        'dcat_be_napits_export_show': dcat_be_napits_export_show,
+    }
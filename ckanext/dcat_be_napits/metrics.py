@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from ckanext.dcat_be_napits.cache import dataset_graph_cache
+from ckanext.dcat_be_napits.fragments import fragment_store
+from ckanext.dcat_be_napits.vocabulary import vocabulary_index
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LOG_INTERVAL = 0
+
+METRIC_PREFIX = 'dcat_be_napits_profile'
+
+
+class _Stage(object):
+    '''
+    Times a profile stage and counts the triples it adds to `graph`
+    '''
+    __slots__ = ('metrics', 'name', 'graph', 'started', 'triples')
+
+    def __init__(self, metrics, name, graph):
+        self.metrics = metrics
+        self.name = name
+        self.graph = graph
+
+    def __enter__(self):
+        self.triples = len(self.graph)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.started
+        if exc_type is None:
+            self.metrics.record(self.name, elapsed, len(self.graph) - self.triples)
+
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+_no_stage = _NoStage()
+
+
+class ProfileMetrics(object):
+    '''
+    Process-wide, aggregated timings of the stages of the dataset profiles.
+
+    For every stage, keeps how often it ran, the total time it took and the
+    net number of triples it added (cleanup stages remove triples). Disabled
+    by default: `stage()` then returns a no-op context manager.
+    '''
+
+    def __init__(self, enabled=False, log_interval=DEFAULT_LOG_INTERVAL):
+        self.enabled = enabled
+        self.log_interval = log_interval
+        self._stages = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_log = time.time()
+
+    def configure(self, enabled, log_interval=DEFAULT_LOG_INTERVAL):
+        self.enabled = enabled
+        self.log_interval = log_interval
+
+    def stage(self, name, graph):
+        '''
+        Returns a context manager recording stage `name`, which works on `graph`:
+
+            with profile_metrics.stage('contact_point', self.g):
+                ...
+        '''
+        if not self.enabled:
+            return _no_stage
+        return _Stage(self, name, graph)
+
+    def record(self, name, seconds, triples):
+        with self._lock:
+            count, total_seconds, total_triples = self._stages.get(name, (0, 0.0, 0))
+            self._stages[name] = (count + 1, total_seconds + seconds, total_triples + triples)
+        if self.log_interval and time.time() - self._last_log > self.log_interval:
+            self._last_log = time.time()
+            self.log_summary()
+
+    def snapshot(self):
+        '''
+        Returns `{stage: (count, seconds, triples)}`
+        '''
+        with self._lock:
+            return OrderedDict(self._stages)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def summary(self):
+        '''
+        Returns a one line summary of the stages, slowest first
+        '''
+        stages = sorted(self.snapshot().items(), key=lambda item: -item[1][1])
+        total = sum(seconds for _count, seconds, _triples in dict(stages).values()) or 1
+        return ', '.join(
+            '{0}: {1:.3f}s ({2:.0%}, {3:.2f}ms/run, {4:+d} triples)'.format(
+                name, seconds, seconds / total, 1000 * seconds / count, triples)
+            for name, (count, seconds, triples) in stages)
+
+    def log_summary(self):
+        log.info('Profile stages: %s', self.summary() or 'nothing recorded')
+
+    def prometheus(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format
+        '''
+        stages = self.snapshot()
+        lines = []
+
+        def metric(name, _type, _help, samples):
+            lines.append('# HELP {0}_{1} {2}'.format(METRIC_PREFIX, name, _help))
+            lines.append('# TYPE {0}_{1} {2}'.format(METRIC_PREFIX, name, _type))
+            for labels, value in samples:
+                lines.append('{0}_{1}{2} {3}'.format(METRIC_PREFIX, name, labels, value))
+
+        metric('stage_runs_total', 'counter', 'Number of times a stage ran',
+               [('{{stage="{0}"}}'.format(name), count) for name, (count, _s, _t) in stages.items()])
+        metric('stage_seconds_total', 'counter', 'Time spent in a stage',
+               [('{{stage="{0}"}}'.format(name), repr(seconds)) for name, (_c, seconds, _t) in stages.items()])
+        metric('stage_triples', 'gauge', 'Net number of triples added by a stage',
+               [('{{stage="{0}"}}'.format(name), triples) for name, (_c, _s, triples) in stages.items()])
+        metric('graph_cache_hits_total', 'counter', 'Datasets served from the graph cache',
+               [('', dataset_graph_cache.hits)])
+        metric('graph_cache_misses_total', 'counter', 'Datasets rendered because they were not cached',
+               [('', dataset_graph_cache.misses)])
+        metric('graph_cache_entries', 'gauge', 'Datasets in the graph cache',
+               [('', len(dataset_graph_cache))])
+        metric('fragment_store_hits_total', 'counter', 'Dataset fragments read from the fragment store',
+               [('', fragment_store.hits)])
+        metric('fragment_store_misses_total', 'counter', 'Dataset fragments rendered because they were not stored',
+               [('', fragment_store.misses)])
+        metric('vocabulary_unknown_total', 'counter', 'Values not found in their controlled vocabulary',
+               [('{{scheme="{0}"}}'.format(scheme), count) for scheme, count in sorted(vocabulary_index.unknown.items())])
+        return '\n'.join(lines) + '\n'
+
+
+profile_metrics = ProfileMetrics()
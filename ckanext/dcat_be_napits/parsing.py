@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of large catalogs, eg the MobilityDCAT-AP catalogs of other NAPs.
+
+ckanext-dcat's RDFParser loads the whole catalog into one in-memory graph
+before the profiles read its datasets: a few GB for a catalog of tens of
+thousands of datasets. The StreamingCatalogParser loads it into a TripleFile
+instead, an rdflib store kept in a temporary SQLite database, then parses
+the datasets one at a time. The lookups of the profiles go to the indexes of
+the database, and only the dataset being parsed is in memory.
+
+N-Triples are read line by line. rdflib's Turtle parser reads the whole
+document before it emits the triples, but its triples still go straight to
+the database.
+"""
+import os
+import json
+import sqlite3
+import logging
+import tempfile
+from functools import lru_cache
+
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.store import Store
+
+from ckanext.dcat.processors import RDFParser, RDFParserException
+from ckanext.dcat.utils import url_to_rdflib_format
+
+log = logging.getLogger(__name__)
+
+STREAMING_PROFILES = ['euro_mobility_dcat_ap']
+
+# Triples written to the database at a time
+BATCH_SIZE = 10000
+
+_COLUMNS = ('s', 'p', 'o')
+
+
+def _encode(term):
+    # Terms are stored as text, the first character telling their kind
+    if isinstance(term, URIRef):
+        return '<' + str(term)
+    if isinstance(term, BNode):
+        return '_' + str(term)
+    if isinstance(term, Literal):
+        return '"' + json.dumps([str(term), term.language or '', str(term.datatype or '')], ensure_ascii=False)
+    raise TypeError('Can not store {0!r}'.format(term))
+
+
+@lru_cache(maxsize=100000)
+def _decode(value):
+    kind, value = value[0], value[1:]
+    if kind == '<':
+        return URIRef(value)
+    if kind == '_':
+        return BNode(value)
+    text, lang, datatype = json.loads(value)
+    return Literal(text, lang=lang or None, datatype=URIRef(datatype) if datatype else None)
+
+
+class TripleFile(Store):
+    '''
+    rdflib store keeping the triples in an SQLite database, indexed on
+    subject, predicate-object and object. The database is a temporary file,
+    deleted by `close()`, unless a `path` is given.
+    '''
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, path=None, configuration=None, identifier=None):
+        super(TripleFile, self).__init__(configuration, identifier)
+        self._temporary = path is None
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix='dcat_be_napits-', suffix='.sqlite')
+            os.close(handle)
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode = OFF')
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute('CREATE TABLE IF NOT EXISTS triples (s TEXT, p TEXT, o TEXT, PRIMARY KEY (s, p, o)) WITHOUT ROWID')
+        self._db.execute('CREATE INDEX IF NOT EXISTS triples_po ON triples (p, o)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS triples_o ON triples (o)')
+        self._pending = []
+        self._namespaces = {}
+        self._prefixes = {}
+
+    def add(self, triple, context=None, quoted=False):
+        self._pending.append(tuple(_encode(term) for term in triple))
+        if len(self._pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the triples added since the last flush to the database
+        '''
+        if self._pending:
+            with self._db:
+                self._db.executemany('INSERT OR IGNORE INTO triples VALUES (?, ?, ?)', self._pending)
+            self._pending = []
+
+    def _where(self, triple_pattern):
+        clauses, values = [], []
+        for column, term in zip(_COLUMNS, triple_pattern):
+            if term is not None:
+                clauses.append(column + ' = ?')
+                values.append(_encode(term))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), values
+
+    def triples(self, triple_pattern, context=None):
+        self.flush()
+        where, values = self._where(triple_pattern)
+        for row in self._db.execute('SELECT s, p, o FROM triples' + where, values):
+            yield tuple(_decode(value) for value in row), iter(())
+
+    def remove(self, triple_pattern, context=None):
+        self.flush()
+        where, values = self._where(triple_pattern)
+        with self._db:
+            self._db.execute('DELETE FROM triples' + where, values)
+
+    def __len__(self, context=None):
+        self.flush()
+        return self._db.execute('SELECT COUNT(*) FROM triples').fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        bound_namespace = self._namespaces.get(prefix)
+        bound_prefix = self._prefixes.get(namespace)
+        if not override and (bound_namespace is not None or bound_prefix is not None):
+            return
+        if bound_prefix is not None:
+            del self._namespaces[bound_prefix]
+        if bound_namespace is not None:
+            del self._prefixes[bound_namespace]
+        self._namespaces[prefix] = namespace
+        self._prefixes[namespace] = prefix
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace)
+
+    def namespaces(self):
+        return iter(list(self._namespaces.items()))
+
+    def close(self, commit_pending_transaction=False):
+        self._pending = []
+        self._db.close()
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class StreamingCatalogParser(RDFParser):
+    '''
+    An RDFParser for catalogs too large to be held in memory: the catalog is
+    kept in a TripleFile and `datasets()` parses one dataset at a time.
+    Call `close()`, or use it as a context manager, to delete the file.
+
+        with StreamingCatalogParser() as parser:
+            parser.parse_file('catalog.nt', 'nt')
+            for dataset_dict in parser.datasets():
+                ...
+    '''
+
+    def __init__(self, profiles=None, **kwargs):
+        super(StreamingCatalogParser, self).__init__(profiles=profiles or STREAMING_PROFILES, **kwargs)
+        self.g = Graph(store=TripleFile())
+
+    def _rdflib_format(self, _format):
+        _format = url_to_rdflib_format(_format)
+        if not _format or _format == 'pretty-xml':
+            _format = 'xml'
+        return _format
+
+    def parse(self, data, _format=None):
+        '''
+        Same as upstream, the triples go to the TripleFile
+        '''
+        super(StreamingCatalogParser, self).parse(data, _format)
+        self.g.store.flush()
+
+    def parse_file(self, source, _format=None):
+        '''
+        Parses the file at path `source`, or file object, without reading
+        it in memory first (except for Turtle and RDF/XML). Can be called
+        for each page of a paginated catalog.
+        '''
+        try:
+            self.g.parse(source=source, format=self._rdflib_format(_format))
+        except (SyntaxError, ValueError, TypeError) as e:
+            raise RDFParserException(e)
+        self.g.store.flush()
+        log.debug('Parsed %s, %d triples in the catalog', source, len(self.g))
+
+    def close(self):
+        self.g.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def parse_catalog(source, _format='nt', profiles=None):
+    '''
+    Yields the dataset dicts of the catalog file `source`, one at a time
+    '''
+    with StreamingCatalogParser(profiles=profiles) as parser:
+        parser.parse_file(source, _format)
+        for dataset_dict in parser.datasets():
+            yield dataset_dict
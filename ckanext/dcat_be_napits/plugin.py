@@ -1,10 +1,44 @@
+import logging
+import datetime
+
+import ckan.model as model
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 
+from ckanext.dcat_be_napits.cache import (
+    dataset_graph_cache,
+    organization_cache,
+    DEFAULT_GRAPH_CACHE_SIZE,
+    DEFAULT_GRAPH_CACHE_MAX_AGE,
+    DEFAULT_ORG_CACHE_MAX_AGE,
+)
+from ckanext.dcat_be_napits.metrics import profile_metrics, DEFAULT_LOG_INTERVAL
+from ckanext.dcat_be_napits.fragments import fragment_store, DEFAULT_FORMATS as DEFAULT_FRAGMENT_FORMATS
+from ckanext.dcat_be_napits.vocabulary import vocabulary_index
+from ckanext.dcat_be_napits.buffer import scratch_graphs
+from ckanext.dcat_be_napits.canonical import blank_nodes
+from ckanext.dcat_be_napits.jobs import render_queue, publisher_changed
+from ckanext.dcat_be_napits.export_jobs import (
+    export_jobs,
+    DEFAULT_TIMEOUT as DEFAULT_EXPORT_TIMEOUT,
+    DEFAULT_MAX_AGE as DEFAULT_EXPORT_MAX_AGE,
+)
+from ckanext.dcat_be_napits.logic import action
+from ckanext.dcat_be_napits import cli, conditional, views
+
+log = logging.getLogger(__name__)
+
 
 class DCATBeNAPITSPlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IConfigurer)
-    
+    plugins.implements(plugins.IConfigurable)
+    plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IBlueprint)
+    plugins.implements(plugins.IClick)
+    plugins.implements(plugins.IMiddleware, inherit=True)
+    plugins.implements(plugins.IPackageController, inherit=True)
+    plugins.implements(plugins.IOrganizationController, inherit=True)
+
 
     # IConfigurer
 
@@ -13,4 +47,103 @@ class DCATBeNAPITSPlugin(plugins.SingletonPlugin):
         toolkit.add_public_directory(config_, "public")
         toolkit.add_resource("assets", "dcat-be-napits")
 
-    
+    # IConfigurable
+
+    def configure(self, config_):
+        dataset_graph_cache.configure(
+            max_size=toolkit.asint(config_.get("ckanext.dcat_be_napits.graph_cache.size", DEFAULT_GRAPH_CACHE_SIZE)),
+            max_age=toolkit.asint(config_.get("ckanext.dcat_be_napits.graph_cache.max_age", DEFAULT_GRAPH_CACHE_MAX_AGE)),
+        )
+        organization_cache.configure(
+            max_age=toolkit.asint(config_.get("ckanext.dcat_be_napits.org_cache.max_age", DEFAULT_ORG_CACHE_MAX_AGE)),
+        )
+        profile_metrics.configure(
+            enabled=toolkit.asbool(config_.get("ckanext.dcat_be_napits.metrics.enabled", False)),
+            log_interval=toolkit.asint(config_.get("ckanext.dcat_be_napits.metrics.log_interval", DEFAULT_LOG_INTERVAL)),
+        )
+        fragment_store.configure(
+            path=config_.get("ckanext.dcat_be_napits.fragment_store.path"),
+            formats=config_.get("ckanext.dcat_be_napits.fragment_store.formats", DEFAULT_FRAGMENT_FORMATS),
+        )
+        vocabulary_index.configure(
+            path=config_.get("ckanext.dcat_be_napits.vocabularies.index"),
+            drop_unknown=toolkit.asbool(config_.get("ckanext.dcat_be_napits.vocabularies.drop_unknown", False)),
+        )
+        scratch_graphs.configure(
+            buffered=toolkit.asbool(config_.get("ckanext.dcat_be_napits.triple_buffer", False)),
+        )
+        blank_nodes.configure(config_.get("ckanext.dcat_be_napits.blank_nodes", "fresh"))
+        render_in_background = toolkit.asbool(config_.get("ckanext.dcat_be_napits.render_queue.enabled", False))
+        if render_in_background and not fragment_store.enabled:
+            log.warning("The render queue renders into the fragment store, which is disabled")
+            render_in_background = False
+        render_queue.configure(
+            enabled=render_in_background,
+            queue=config_.get("ckanext.dcat_be_napits.render_queue.name"),
+            at_front=toolkit.asbool(config_.get("ckanext.dcat_be_napits.render_queue.at_front", False)),
+        )
+        export_jobs.configure(
+            path=config_.get("ckanext.dcat_be_napits.exports.path"),
+            queue=config_.get("ckanext.dcat_be_napits.exports.queue"),
+            workers=toolkit.asint(config_.get("ckanext.dcat_be_napits.exports.workers", 1)),
+            timeout=toolkit.asint(config_.get("ckanext.dcat_be_napits.exports.timeout", DEFAULT_EXPORT_TIMEOUT)),
+            max_age=toolkit.asint(config_.get("ckanext.dcat_be_napits.exports.max_age", DEFAULT_EXPORT_MAX_AGE)),
+        )
+
+    # IActions
+
+    def get_actions(self):
+        return action.get_actions()
+
+    # IBlueprint
+
+    def get_blueprint(self):
+        return views.get_blueprints()
+
+    # IClick
+
+    def get_commands(self):
+        return cli.get_commands()
+
+    # IMiddleware
+
+    def make_middleware(self, app, config_):
+        app.before_request(conditional.before_request)
+        app.after_request(conditional.after_request)
+        return app
+
+    # IPackageController
+
+    def after_dataset_create(self, context, pkg_dict):
+        render_queue.dataset_changed(pkg_dict.get("id"))
+
+    def after_dataset_update(self, context, pkg_dict):
+        dataset_graph_cache.invalidate(pkg_dict.get("id"))
+        fragment_store.invalidate(pkg_dict.get("id"))
+        render_queue.dataset_changed(pkg_dict.get("id"))
+
+    def after_dataset_delete(self, context, pkg_dict):
+        dataset_graph_cache.invalidate(pkg_dict.get("id"))
+        fragment_store.invalidate(pkg_dict.get("id"))
+
+    # IOrganizationController
+
+    # `edit` and `delete` are shared with IPackageController, which calls them
+    # with the package entity
+
+    def edit(self, entity):
+        # Rendered datasets embed their publisher's details
+        if getattr(entity, "is_organization", False):
+            if publisher_changed(organization_cache.cached(entity.id), entity):
+                render_queue.organization_changed(entity.id)
+            organization_cache.invalidate(entity.id)
+            dataset_graph_cache.invalidate_organization(entity.id)
+
+    def delete(self, entity):
+        if getattr(entity, "is_organization", False):
+            organization_cache.invalidate(entity.id)
+            dataset_graph_cache.invalidate_organization(entity.id)
+        elif isinstance(entity, model.Package):
+            # CKAN keeps `metadata_modified` on delete; stamp it so the
+            # changes feed lists the dataset's tombstone
+            entity.metadata_modified = datetime.datetime.utcnow()
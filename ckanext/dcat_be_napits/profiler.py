@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Render cost of each dataset of the catalog.
+
+Renders datasets one by one through `EuropeanMobilityDCATAPProfile`, without
+the dataset graph cache, and records for each one the render time, the
+triples it produces, the size of its serializations and its peak memory. The
+report lists the most expensive datasets, a histogram of the render times
+and how the cost grows with the fields that drive it: the number of
+resources, of regions covered and of translated values.
+"""
+import gc
+import math
+import time
+import random
+import tracemalloc
+from collections import namedtuple
+
+from rdflib import Graph
+
+from ckanext.dcat.profiles.base import CleanedURIRef
+
+from ckanext.dcat_be_napits.profiles import EuropeanMobilityDCATAPProfile
+from ckanext.dcat_be_napits.utils import dataset_uri, uri_scope
+
+DEFAULT_FORMATS = ['turtle', 'nt', 'pretty-xml', 'json-ld']
+
+DatasetCost = namedtuple('DatasetCost', [
+    'id', 'name', 'seconds', 'serialize_seconds', 'triples', 'bytes', 'peak_memory', 'features'])
+
+
+def _translated_values(data_dict):
+    return sum(
+        sum(1 for value in values.values() if value)
+        for key, values in data_dict.items()
+        if key.endswith('_translated') and isinstance(values, dict))
+
+
+def dataset_features(dataset_dict):
+    '''
+    Returns the fields of `dataset_dict` that the render cost depends on
+    '''
+    resources = dataset_dict.get('resources') or []
+    return {
+        'resources': len(resources),
+        'regions_covered': len(dataset_dict.get('regions_covered') or []),
+        'translated_values': _translated_values(dataset_dict) + sum(
+            _translated_values(resource_dict) for resource_dict in resources),
+    }
+
+
+def _render(dataset_dict, profile_class):
+    graph = Graph()
+    profile = profile_class(graph)
+    with uri_scope():
+        dataset_ref = CleanedURIRef(dataset_uri(dataset_dict))
+    # Straight to the render, the dataset graph cache would hide its cost
+    for triple in profile._render_dataset_triples(dataset_dict, dataset_ref):
+        graph.add(triple)
+    return graph
+
+
+def profile_dataset(dataset_dict, formats=None, profile_class=EuropeanMobilityDCATAPProfile,
+                    trace_memory=True):
+    '''
+    Renders `dataset_dict` and serializes it in `formats` (rdflib formats),
+    and returns its DatasetCost. With `trace_memory`, the dataset is
+    rendered a second time under tracemalloc for the peak memory.
+    '''
+    formats = formats or DEFAULT_FORMATS
+    gc.collect()
+    started = time.perf_counter()
+    graph = _render(dataset_dict, profile_class)
+    rendered = time.perf_counter()
+    sizes = dict((_format, len(graph.serialize(format=_format, encoding='utf-8'))) for _format in formats)
+    serialized = time.perf_counter()
+    triples = len(graph)
+    del graph
+
+    peak_memory = None
+    if trace_memory:
+        # Timed apart: tracing slows the render down several times
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        graph = _render(dataset_dict, profile_class)
+        for _format in formats:
+            graph.serialize(format=_format, encoding='utf-8')
+        peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+        del graph
+        if not tracing:
+            tracemalloc.stop()
+
+    return DatasetCost(
+        id=dataset_dict.get('id'),
+        name=dataset_dict.get('name'),
+        seconds=rendered - started,
+        serialize_seconds=serialized - rendered,
+        triples=triples,
+        bytes=sizes,
+        peak_memory=peak_memory,
+        features=dataset_features(dataset_dict),
+    )
+
+
+def sample(dataset_dicts, size, seed=None):
+    '''
+    Returns `size` datasets picked at random from the iterable `dataset_dicts`,
+    in catalog order, reading it once
+    '''
+    rng = random.Random(seed)
+    picked = []
+    for index, dataset_dict in enumerate(dataset_dicts):
+        if index < size:
+            picked.append((index, dataset_dict))
+        else:
+            slot = rng.randint(0, index)
+            if slot < size:
+                picked[slot] = (index, dataset_dict)
+    return [dataset_dict for _, dataset_dict in sorted(picked, key=lambda item: item[0])]
+
+
+def _correlation(xs, ys):
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance_x = sum((x - mean_x) ** 2 for x in xs)
+    variance_y = sum((y - mean_y) ** 2 for y in ys)
+    if not variance_x or not variance_y:
+        return None, None
+    return covariance / math.sqrt(variance_x * variance_y), covariance / variance_x
+
+
+def cost_drivers(costs):
+    '''
+    Returns `(feature, correlation, seconds per unit)` for each feature, the
+    correlation of the feature with the render time and the render time each
+    unit of it adds (least squares). Both are None for a feature that doesn't
+    vary over `costs`.
+    '''
+    if len(costs) < 2:
+        return []
+    seconds = [cost.seconds for cost in costs]
+    drivers = []
+    for feature in costs[0].features:
+        correlation, slope = _correlation([cost.features[feature] for cost in costs], seconds)
+        drivers.append((feature, correlation, slope))
+    return drivers
+
+
+def histogram(values, buckets=10):
+    '''
+    Returns `(lower bound, upper bound, count)` buckets for `values`, on a
+    log scale: render times span orders of magnitude
+    '''
+    values = [value for value in values if value > 0]
+    if not values:
+        return []
+    low, high = math.log10(min(values)), math.log10(max(values))
+    width = (high - low) / buckets or 1
+    counts = [0] * buckets
+    for value in values:
+        counts[min(int((math.log10(value) - low) / width), buckets - 1)] += 1
+    return [(10 ** (low + i * width), 10 ** (low + (i + 1) * width), count) for i, count in enumerate(counts)]
+
+
+def _size(value):
+    for unit in ('B', 'kB', 'MB'):
+        if value < 1000:
+            return '{0:.0f}{1}'.format(value, unit)
+        value /= 1000.0
+    return '{0:.0f}GB'.format(value)
+
+
+def report(costs, top=10, width=40):
+    '''
+    Returns the report of `costs` as a list of lines
+    '''
+    if not costs:
+        return ['No datasets']
+    costs = sorted(costs, key=lambda cost: cost.seconds, reverse=True)
+    formats = list(costs[0].bytes)
+    features = list(costs[0].features)
+    total = sum(cost.seconds for cost in costs)
+
+    lines = ['{0} datasets rendered in {1:.2f}s, median {2:.1f}ms, slowest {3:.1f}ms'.format(
+        len(costs), total, costs[len(costs) // 2].seconds * 1000, costs[0].seconds * 1000)]
+    share = sum(cost.seconds for cost in costs[:top]) / total if total else 0
+    lines.append('The {0} slowest take {1:.0%} of the render time'.format(min(top, len(costs)), share))
+
+    lines.append('')
+    columns = ['ms', 'serialize ms', 'triples'] + formats + ['peak'] + features
+    widths = [max(10, len(column)) for column in columns]
+    lines.append('{0:<40} '.format('dataset') + ' '.join(
+        column.rjust(width) for column, width in zip(columns, widths)))
+    for cost in costs[:top]:
+        values = ['{0:.1f}'.format(cost.seconds * 1000), '{0:.1f}'.format(cost.serialize_seconds * 1000),
+                  str(cost.triples)]
+        values += [_size(cost.bytes[_format]) for _format in formats]
+        values.append(_size(cost.peak_memory) if cost.peak_memory is not None else '-')
+        values += [str(cost.features[feature]) for feature in features]
+        lines.append('{0:<40} '.format((cost.name or cost.id or '')[:40]) + ' '.join(
+            value.rjust(width) for value, width in zip(values, widths)))
+
+    # Empty when no render took measurable time
+    buckets = histogram([cost.seconds for cost in costs])
+    if buckets:
+        lines.append('')
+        lines.append('Render time')
+        most = max(count for _, _, count in buckets)
+        for low, high, count in buckets:
+            lines.append('  {0:>9.1f} - {1:>9.1f}ms {2:>6} {3}'.format(
+                low * 1000, high * 1000, count, '#' * int(math.ceil(count * width / float(most)))))
+
+    lines.append('')
+    lines.append('Cost drivers')
+    for feature, correlation, slope in cost_drivers(costs):
+        if correlation is None:
+            lines.append('  {0:<20} constant'.format(feature))
+        else:
+            lines.append('  {0:<20} correlation {1:>5.2f}, {2:.3f}ms per unit'.format(
+                feature, correlation, slope * 1000))
+    return lines
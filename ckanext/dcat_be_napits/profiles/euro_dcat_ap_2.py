@@ -5,6 +5,7 @@ from rdflib.namespace import Namespace
 
 import ckantoolkit as toolkit
 from ckanext.dcat.profiles.base import URIRefOrLiteral, CleanedURIRef
+from ckanext.dcat.profiles.base import namespaces as dcat_namespaces
 from ckanext.dcat.profiles.base import (
     CNT,
     CR,
@@ -27,10 +28,21 @@ from ckanext.dcat.profiles.base import (
     GEOJSON_IMT,
 )
 
-from ckanext.dcat.utils import resource_uri, catalog_uri
 from ckanext.dcat.profiles.euro_dcat_ap_2 import EuropeanDCATAP2Profile as CkanEuropeanDCATAP2Profile
 
-from ckanext.dcat_be_napits.utils import catalog_record_uri, publisher_uri_organization_fallback
+from ckanext.dcat_be_napits.utils import (
+    catalog_language,
+    catalog_record_uri,
+    catalog_uri,
+    project_language,
+    publisher_uri_organization_fallback,
+    resource_uri,
+    uri_scope,
+)
+from ckanext.dcat_be_napits.buffer import scratch_graphs
+from ckanext.dcat_be_napits.canonical import blank_nodes
+from ckanext.dcat_be_napits.cache import organization_cache
+from ckanext.dcat_be_napits.metrics import profile_metrics
 
 ORG = Namespace("http://www.w3.org/ns/org#")
 
@@ -45,8 +57,34 @@ SUPPORTED_LANGUAGES_MAP = {
     'de': 'http://publications.europa.eu/resource/authority/language/DEU'
 }
 
+# Built once, as the profiles look them up for every dataset
+SUPPORTED_LANGUAGE_REFS = dict((lang, URIRef(uri)) for lang, uri in SUPPORTED_LANGUAGES_MAP.items())
+EMPTY_MULTILANG_LITERALS = tuple(Literal("", lang=lang) for lang in SUPPORTED_LANGUAGES_MAP)
+
+CONTACT_POINT_ITEMS = [
+    ('contact_point_name', VCARD.fn, None, Literal),
+]
+LICENSE_ITEMS = [
+    ('license_text_translated', RDFS.label, None, URIRef),
+]
+RIGHTS_ITEMS = [
+    ('conditions_access', DCT.type, None, URIRef),
+    ('conditions_usage', DCT.type, None, URIRef),
+    ('additional_info_access_usage_translated', RDFS.label, None, Literal),
+]
+
 PREFIX_TEL = "tel:"
 
+# Static catalog metadata, see `graph_from_catalog`
+CATALOG_DESCRIPTION = "Transportdata.be is the national access point for all mobility related data in Belgium."
+CATALOG_ISSUED = date(2020, 2, 14)
+CATALOG_LICENSE_TYPE = "http://publications.europa.eu/resource/authority/licence/CC0"
+CATALOG_THEME_TAXONOMY = "http://publications.europa.eu/resource/authority/data-theme"
+CATALOG_PUBLISHER_UUID = "6df0157c-6022-408f-8c7d-991b9c79466f"  # no reference in DB. Just hardcoded here.
+CATALOG_PUBLISHER_NAME = "The Belgian National Geographic Institute on behalf of the Belgian ITS steering committee"
+CATALOG_PUBLISHER_ADDRESS = "https://transportdata.be/organization/82e1025c-4db4-4a9c-95f6-e474db508f3f/address"
+CATALOG_PUBLISHER_MBOX = "mailto:contact@transportdata.be"
+
 class EuropeanDCATAP2Profile(CkanEuropeanDCATAP2Profile):
     """
     Some elements don't get converted correctly by ckan dcat upstream.
@@ -54,6 +92,9 @@ class EuropeanDCATAP2Profile(CkanEuropeanDCATAP2Profile):
     Correct them here
     """
 
+    # Shared with the upstream profiles, which fill it on a miss
+    _org_cache = organization_cache
+
     def _add_tel(self, tel):
         """
         Ensures that the phone number has an URIRef-compatible tel: prefix.
@@ -85,61 +126,106 @@ class EuropeanDCATAP2Profile(CkanEuropeanDCATAP2Profile):
         Upstream CKAN DCAT doesn't check for empty strings in multilang fields (https://github.com/ckan/ckanext-dcat/blob/dd3b1e8deaea92d8a789e3227882203a47ce650f/ckanext/dcat/profiles/base.py#L1086)
         clean up empty strings in RDF here
         """
-        for locale in SUPPORTED_LANGUAGES_MAP.keys():
-            for subject, predicate, object in self.g.triples((None, None, Literal("", lang=locale))):
+        for empty_literal in EMPTY_MULTILANG_LITERALS:
+            for subject, predicate, object in self.g.triples((None, None, empty_literal)):
                 self.g.remove((subject, predicate, object))
 
-    def graph_from_dataset(self, dataset_dict, dataset_ref):
-        super(EuropeanDCATAP2Profile, self).graph_from_dataset(dataset_dict, dataset_ref)
-
+    def _bind_namespaces(self):
+        """
+        Binds the prefixes used by this profile and the upstream profiles
+        """
+        for prefix, namespace in dcat_namespaces.items():
+            self.g.bind(prefix, namespace)
         for prefix, namespace in namespaces.items():
             self.g.bind(prefix, namespace)
 
-        # semanctics: form field info for contact details says
-        # "The "contact point", describes an organisation, if applicable a person, which is responsible for the creation and maintenance of the metadata. This person or organization is the single point of contact for the present metadata set. "
-        contact_point = BNode()
-        self.g.add((contact_point, RDF.type, VCARD.Kind))
-        self.g.add((dataset_ref, DCAT.contactPoint, contact_point))
+    def _bind_profile_namespaces(self):
+        """
+        Binds this profile's own prefixes, once per namespace manager: a batch
+        renders every dataset of a page with the same one
+        """
+        namespace_manager = self.g.namespace_manager
+        if getattr(self, '_bound_namespace_manager', None) is not namespace_manager:
+            for prefix, namespace in self._profile_namespaces().items():
+                self.g.bind(prefix, namespace)
+            self._bound_namespace_manager = namespace_manager
 
-        items =[
-            ('contact_point_name', VCARD.fn, None, Literal),
-        ]
-        self._add_triples_from_dict(dataset_dict, contact_point, items)
-        self._add_triple_from_dict(dataset_dict, contact_point, VCARD.hasEmail, 'contact_point_email', _type=URIRef, value_modifier=self._add_mailto)
-        self._add_triple_from_dict(dataset_dict, contact_point, VCARD.hasTelephone, 'contact_point_tel', _type=URIRef, value_modifier=self._add_tel)
+    def _profile_namespaces(self):
+        return namespaces
 
-        # TODO what to do with license info at dataset level vs distribution level. DCAT only has distribution level.
-        # example: https://transportdata.be/api/3/action/package_show?id=address-points-belgium-best-address
-        for resource_dict in dataset_dict.get("resources", []):
-            distribution_ref = CleanedURIRef(resource_uri(resource_dict))
-
-            if resource_dict.get('license_type') or any(resource_dict.get('license_text_translated').values()):
-                license_document = BNode()
-                self.g.add((license_document, RDF.type, DCT.LicenseDocument))
-                self.g.add((distribution_ref, DCT.license, license_document))
-                items =[
-                    ('license_text_translated', RDFS.label, None, URIRef),
-                ]
-                self._add_triples_from_dict(resource_dict, license_document, items)
-                self._add_triple_from_dict(resource_dict, license_document, DCT.type, 'license_type', _type=URIRef, value_modifier=self._clean_license_type_uri)
-
-            rights_statement = BNode()
-            self.g.add((rights_statement, RDF.type, DCT.RightsStatement))
-            self.g.add((distribution_ref, DCT.rights, rights_statement))
-            items =[
-                ('conditions_access', DCT.type, None, URIRef),
-                ('conditions_usage', DCT.type, None, URIRef),
-                ('additional_info_access_usage_translated', RDFS.label, None, Literal),
-            ]
-            self._add_triples_from_dict(resource_dict, rights_statement, items)
-
-        # Fix inherited location: is bounding box, not geometry
+    def _fix_geometry_as_bbox(self):
+        """
+        Inherited location is a bounding box, not a geometry
+        """
         # TODO: make filter more specific
         for subject, predicate, object in self.g.triples((None, LOCN.geometry, None)):
             self.g.remove((subject, predicate, object))
             self.g.add((subject, DCAT.bbox, object))
 
-        self._clean_empty_multilang_strings()
+    def _render_dataset_triples(self, dataset_dict, dataset_ref):
+        """
+        Renders the dataset into a scratch graph and returns its triples.
+        The scratch graph shares the catalog graph's namespace bindings.
+        Rendering each dataset on its own keeps the post-processing passes
+        proportional to the dataset, instead of re-scanning every dataset
+        already added to a catalog graph.
+        """
+        catalog_graph = self.g
+        self.g = scratch_graphs.new(catalog_graph.namespace_manager)
+        try:
+            with uri_scope():
+                self._graph_from_dataset_napits(dataset_dict, dataset_ref)
+            with profile_metrics.stage('cleanup', self.g):
+                self._fix_geometry_as_bbox()
+                self._clean_empty_multilang_strings()
+                if catalog_language():
+                    project_language(self.g, catalog_language())
+            return tuple(blank_nodes.stabilize(self.g, dataset_ref))
+        finally:
+            self.g = catalog_graph
+
+    def graph_from_dataset(self, dataset_dict, dataset_ref):
+        for triple in self._render_dataset_triples(dataset_dict, dataset_ref):
+            self.g.add(triple)
+
+    def _graph_from_dataset_napits(self, dataset_dict, dataset_ref):
+        """
+        Adds this profile's dataset triples on top of the upstream ones.
+        Subclasses extend this instead of `graph_from_dataset`.
+        """
+        with profile_metrics.stage('upstream', self.g):
+            super(EuropeanDCATAP2Profile, self).graph_from_dataset(dataset_dict, dataset_ref)
+
+        self._bind_profile_namespaces()
+
+        with profile_metrics.stage('contact_point', self.g):
+            # semanctics: form field info for contact details says
+            # "The "contact point", describes an organisation, if applicable a person, which is responsible for the creation and maintenance of the metadata. This person or organization is the single point of contact for the present metadata set. "
+            contact_point = BNode()
+            self.g.add((contact_point, RDF.type, VCARD.Kind))
+            self.g.add((dataset_ref, DCAT.contactPoint, contact_point))
+
+            self._add_triples_from_dict(dataset_dict, contact_point, CONTACT_POINT_ITEMS)
+            self._add_triple_from_dict(dataset_dict, contact_point, VCARD.hasEmail, 'contact_point_email', _type=URIRef, value_modifier=self._add_mailto)
+            self._add_triple_from_dict(dataset_dict, contact_point, VCARD.hasTelephone, 'contact_point_tel', _type=URIRef, value_modifier=self._add_tel)
+
+        # TODO what to do with license info at dataset level vs distribution level. DCAT only has distribution level.
+        # example: https://transportdata.be/api/3/action/package_show?id=address-points-belgium-best-address
+        with profile_metrics.stage('license_rights', self.g):
+            for resource_dict in dataset_dict.get("resources", []):
+                distribution_ref = CleanedURIRef(resource_uri(resource_dict))
+
+                if resource_dict.get('license_type') or any(resource_dict.get('license_text_translated').values()):
+                    license_document = BNode()
+                    self.g.add((license_document, RDF.type, DCT.LicenseDocument))
+                    self.g.add((distribution_ref, DCT.license, license_document))
+                    self._add_triples_from_dict(resource_dict, license_document, LICENSE_ITEMS)
+                    self._add_triple_from_dict(resource_dict, license_document, DCT.type, 'license_type', _type=URIRef, value_modifier=self._clean_license_type_uri)
+
+                rights_statement = BNode()
+                self.g.add((rights_statement, RDF.type, DCT.RightsStatement))
+                self.g.add((distribution_ref, DCT.rights, rights_statement))
+                self._add_triples_from_dict(resource_dict, rights_statement, RIGHTS_ITEMS)
 
         # from pprint import pprint
         # pprint(dataset_dict)
@@ -148,13 +234,18 @@ class EuropeanDCATAP2Profile(CkanEuropeanDCATAP2Profile):
 
     def _dataset_languages(self, dataset_dict):
         """
-        Method for determinine the languages used in dataset *metadata*
+        Method for determinine the languages used in dataset *metadata*.
+        Returns the language URIRefs, only the catalog's if it is rendered in
+        one language the dataset has.
         """
         key = 'notes_translated' #  We use the available languages for dataset description as metric
         languages = []
         for lang, value in dataset_dict[key].items():
             if value:
-                languages.append(SUPPORTED_LANGUAGES_MAP[lang])
+                languages.append(SUPPORTED_LANGUAGE_REFS[lang])
+        projected = SUPPORTED_LANGUAGE_REFS.get(catalog_language())
+        if projected in languages:
+            return [projected]
         return languages
 
     def _generate_ngi_catalog_publisher(self):
@@ -165,29 +256,43 @@ class EuropeanDCATAP2Profile(CkanEuropeanDCATAP2Profile):
         We can reuse the NGI address though.
         """
         catalog_pub_graph = Graph()
-        catalog_pub_uuid = "6df0157c-6022-408f-8c7d-991b9c79466f"  # no reference in DB. Just hardcoded here.
         uri = '{0}/organization/{1}'.format(catalog_uri().rstrip('/'),
-                                            catalog_pub_uuid)
-        name = Literal("The Belgian National Geographic Institute on behalf of the Belgian ITS steering committee", lang="en")
+                                            CATALOG_PUBLISHER_UUID)
+        name = Literal(CATALOG_PUBLISHER_NAME, lang="en")
         catalog_pub = catalog_pub_graph.resource(uri)
         catalog_pub.add(RDF.type, FOAF.Organization)
         catalog_pub.add(FOAF.name, name)
-        catalog_pub.add(LOCN.address, URIRef("https://transportdata.be/organization/82e1025c-4db4-4a9c-95f6-e474db508f3f/address"))
-        catalog_pub.add(FOAF.mbox, URIRef("mailto:contact@transportdata.be"))
+        catalog_pub.add(LOCN.address, URIRef(CATALOG_PUBLISHER_ADDRESS))
+        catalog_pub.add(FOAF.mbox, URIRef(CATALOG_PUBLISHER_MBOX))
         return catalog_pub_graph, catalog_pub
 
+    def _last_catalog_modification(self):
+        """
+        Same as upstream, without loading the whole latest dataset
+        """
+        result = toolkit.get_action('package_search')({'ignore_auth': True}, {
+            'sort': 'metadata_modified desc',
+            'fl': ['metadata_modified'],
+            'rows': 1,
+        })
+        if result and result.get('results'):
+            return result['results'][0]['metadata_modified']
+        return None
+
     def graph_from_catalog(self, catalog_dict, catalog_ref):
         super(EuropeanDCATAP2Profile, self).graph_from_catalog(catalog_dict, catalog_ref)
 
         # TODO: from upstream, DCT.description should come from ckan.site_description config.
-        self.g.add((catalog_ref, DCT.description, Literal("Transportdata.be is the national access point for all mobility related data in Belgium.", lang="en")))
+        self.g.add((catalog_ref, DCT.description, Literal(CATALOG_DESCRIPTION, lang="en")))
 
         # DCT.language uses locale default, which is "en". Should be dct:LinguisticSystem controlled voc
         # language used in the user interface of the mobility data portal
         for lang in self.g.objects(catalog_ref, DCT.language):
             self.g.remove((catalog_ref, DCT.language, lang))
-        for lang in SUPPORTED_LANGUAGES_MAP.values():
-            self.g.add((catalog_ref, DCT.language, URIRef(lang)))
+        # Only the catalog's language when it is rendered in one
+        for lang, uri in SUPPORTED_LANGUAGES_MAP.items():
+            if catalog_language() in (None, lang):
+                self.g.add((catalog_ref, DCT.language, URIRef(uri)))
 
         # Add Catalog publisher
         ngi_its_graph, ngi_its = self._generate_ngi_catalog_publisher()
@@ -197,19 +302,24 @@ class EuropeanDCATAP2Profile(CkanEuropeanDCATAP2Profile):
 
         license_document = BNode()
         self.g.add((license_document, RDF.type, DCT.LicenseDocument))
-        self.g.add((license_document, DCT.type, URIRef("http://publications.europa.eu/resource/authority/licence/CC0")))
+        self.g.add((license_document, DCT.type, URIRef(CATALOG_LICENSE_TYPE)))
         self.g.add((catalog_ref, DCT.license, license_document))
 
-        self.g.add((catalog_ref, DCT.issued, Literal(date(2020, 2, 14))))
+        self.g.add((catalog_ref, DCT.issued, Literal(CATALOG_ISSUED)))
 
-        self.g.add((catalog_ref, DCAT.themeTaxonomy, URIRef("http://publications.europa.eu/resource/authority/data-theme")))
+        self.g.add((catalog_ref, DCAT.themeTaxonomy, URIRef(CATALOG_THEME_TAXONOMY)))
+
+        if catalog_language():
+            project_language(self.g, catalog_language())
 
     def graph_from_catalog_record(self, dataset_dict, dataset_ref, catalog_record_ref):
         super(EuropeanDCATAP2Profile, self).graph_from_catalog_record(dataset_dict, dataset_ref, catalog_record_ref)
         g = self.g
 
-        for prefix, namespace in namespaces.items():
-            g.bind(prefix, namespace)
+        self._bind_profile_namespaces()
 
+        catalog_record_ref = URIRef(catalog_record_ref)
         for lang in self._dataset_languages(dataset_dict):
-            g.add((URIRef(catalog_record_ref), DCT.language, URIRef(lang)))
+            g.add((catalog_record_ref, DCT.language, lang))
+        if catalog_language():
+            project_language(g, catalog_language(), catalog_record_ref)
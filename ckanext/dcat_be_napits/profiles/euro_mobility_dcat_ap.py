@@ -1,4 +1,4 @@
-from rdflib import Literal, URIRef, BNode
+from rdflib import Literal, URIRef, BNode, Graph
 from rdflib.namespace import Namespace
 import json
 
@@ -25,9 +25,31 @@ from ckanext.dcat.profiles.base import (
     SPDX,
     GEOJSON_IMT,
 )
-from ckanext.dcat.utils import resource_uri
 from .euro_dcat_ap_2 import EuropeanDCATAP2Profile
-from ckanext.dcat_be_napits.utils import publisher_uri_organization_address
+from ckanext.dcat_be_napits.utils import (
+    catalog_language,
+    catalog_record_uri,
+    dataset_uri,
+    publisher_uri_organization_address,
+    resource_uri,
+    uri_scope,
+)
+from ckanext.dcat_be_napits.canonical import blank_nodes
+from ckanext.dcat_be_napits.cache import (
+    catalog_graph_cache,
+    catalog_header_key,
+    dataset_graph_cache,
+    organization_cache,
+)
+from ckanext.dcat_be_napits.metrics import profile_metrics
+from ckanext.dcat_be_napits.vocabulary import (
+    vocabulary_index,
+    EPSG_SCHEME,
+    GEOREFERENCING_METHOD_SCHEME,
+    LANGUAGE_SCHEME,
+    MOBILITY_THEME_SCHEME,
+    TRANSPORT_MODE_SCHEME,
+)
 
 MOBILITYDCATAP = Namespace("https://w3id.org/mobilitydcat-ap#")
 ORG = Namespace("http://www.w3.org/ns/org#")
@@ -49,6 +71,55 @@ EURO_SCHEME_URI_NUTS = "http://data.europa.eu/nuts"
 EURO_SCHEME_URI_COUNTRY = "http://publications.europa.eu/resource/authority/country"
 CONCEPT_URI_BEL = "http://publications.europa.eu/resource/authority/country/BEL"
 
+PUBLISHER_ITEMS = [
+    ('title', FOAF.name, None, Literal),
+    ('do_website', FOAF.workplaceHomepage, None, URIRef),
+]
+PUBLISHER_ADDRESS_ITEMS = [
+    ('country', LOCN.adminUnitL1, None, Literal),
+    ('administrative_area', LOCN.adminUnitL2, None, Literal),
+    ('postal_code', LOCN.postCode, None, Literal),
+    ('city', LOCN.postName, None, Literal),
+    ('street_address', LOCN.thoroughfare, None, Literal),
+]
+PUBLISHER_PERSON_ITEMS = [
+    ('publisher_firstname', FOAF.firstName, None, Literal),
+    ('publisher_surname', FOAF.surname, None, Literal),
+]
+DISTRIBUTION_ITEMS = [
+    ('acc_int', MOBILITYDCATAP.applicationLayerProtocol, None, URIRef),
+    ('acc_con', MOBILITYDCATAP.communicationMethod, None, URIRef),
+    ('acc_gra', MOBILITYDCATAP.grammar, None, URIRef),
+    ('acc_mod', MOBILITYDCATAP.mobilityDataStandard, None, URIRef),
+    ('acc_desc', MOBILITYDCATAP.dataFormatNotes, None, Literal),
+    ('acc_enc', CNT.characterEncoding, None, Literal),
+    ('description_resource_translated', DCT.description, None, Literal),
+]
+UPLOADED_DISTRIBUTION_ITEMS = DISTRIBUTION_ITEMS + [
+    ('url', DCAT.downloadURL, None, URIRef),
+]
+CATALOG_RECORD_ITEMS = [
+    ('metadata_created', DCT.created, None, Literal),
+]
+NUTS_SCHEME_REF = URIRef(EURO_SCHEME_URI_NUTS)
+
+# Dataset fields holding a list of URIs, see `parse_dataset`
+DATASET_LIST_ITEMS = [
+    ('fluent_tags', MOBILITYDCATAP.transportMode),
+    ('georeferencing_method', MOBILITYDCATAP.georeferencingMethod),
+    ('nap_type', DCATAP.applicableLegislation),
+    ('reference_system', DCT.conformsTo),
+]
+
+# Dataset properties whose values come from a controlled vocabulary
+VOCABULARY_PROPERTIES = [
+    (MOBILITYDCATAP.mobilityTheme, MOBILITY_THEME_SCHEME),
+    (MOBILITYDCATAP.transportMode, TRANSPORT_MODE_SCHEME),
+    (MOBILITYDCATAP.georeferencingMethod, GEOREFERENCING_METHOD_SCHEME),
+    (DCT.conformsTo, EPSG_SCHEME),
+    (DCT.language, LANGUAGE_SCHEME),
+]
+
 class EuropeanMobilityDCATAPProfile(EuropeanDCATAP2Profile):
     """
 https://mobilitydcat-ap.github.io/mobilityDCAT-AP/releases/index.html
@@ -86,150 +157,239 @@ https://mobilitydcat-ap.github.io/mobilityDCAT-AP/releases/index.html
                 fixed_uris.append(uri)
         return fixed_uris
 
-    def graph_from_dataset(self, dataset_dict, dataset_ref):
-
-        super(EuropeanMobilityDCATAPProfile, self).graph_from_dataset(dataset_dict, dataset_ref)
-
+    def _bind_namespaces(self):
+        super(EuropeanMobilityDCATAPProfile, self)._bind_namespaces()
         for prefix, namespace in namespaces.items():
             self.g.bind(prefix, namespace)
 
+    def _profile_namespaces(self):
+        return namespaces
 
-        org_id = dataset_dict["organization"]["id"]
-        org_dict = self._org_cache[org_id]
-
-        # dcat2 already introduces org as publisher
-        org_ref = next(self.g.objects(dataset_ref, DCT.publisher))
-
-        self.g.add((org_ref, RDF.type, FOAF.Organization))
-        items =[
-            ('title', FOAF.name, None, Literal),
-            ('do_website', FOAF.workplaceHomepage, None, URIRef),
-        ]
-        self._add_triples_from_dict(org_dict, org_ref, items)
-        self.g.add((org_ref, FOAF.mbox, URIRef(self._add_mailto(org_dict['do_email']))))
-        self.g.add((org_ref, FOAF.phone, URIRef(self._add_tel(org_dict['do_tel']))))
-        org_dict['display_title'] = self._suffix_to_fluent_multilang(org_dict, 'display_title', ['en', 'nl', 'fr', 'de'])
-        self._add_triple_from_dict(org_dict, org_ref, FOAF.name, 'display_title')
-
-        org_address = CleanedURIRef(publisher_uri_organization_address(dataset_dict))
-        self.g.add((org_address, RDF.type, LOCN.Address))
-        self.g.add((org_ref, LOCN.address, org_address))
-
-        items =[
-            ('country', LOCN.adminUnitL1, None, Literal),
-            ('administrative_area', LOCN.adminUnitL2, None, Literal),
-            ('postal_code', LOCN.postCode, None, Literal),
-            ('city', LOCN.postName, None, Literal),
-            ('street_address', LOCN.thoroughfare, None, Literal),
-        ]
-        self._add_triples_from_dict(org_dict, org_address, items)
-
-        publisher_person = BNode()
-        self.g.add((publisher_person, RDF.type, FOAF.Person))
-
-        publisher_name = f"{dataset_dict['publisher_firstname']} {dataset_dict['publisher_surname']}".strip()
-        self.g.add((publisher_person, FOAF.name, Literal(publisher_name)))
-        items =[
-            ('publisher_firstname', FOAF.firstName, None, Literal),
-            ('publisher_surname', FOAF.surname, None, Literal),
-        ]
-        self._add_triples_from_dict(dataset_dict, publisher_person, items)
-
-        # Cardinality for dct:publisher is 1..1
-        # Connect publishing person to publishing org as org:memberOf
-        # https://mobilitydcat-ap.github.io/mobilityDCAT-AP/releases/index.html#agent-roles
-        self.g.add((publisher_person, ORG.memberOf, org_ref))
-
-        # MobilityDCAT specified to remove dcat:keyword
-        for subject, predicate, _object in self.g.triples((dataset_ref, DCAT.keyword, None)):
-            self.g.remove((subject, predicate, _object))
-
-        if 'mobility_theme' in dataset_dict:
-            hierarchic_themes = json.loads(dataset_dict['mobility_theme'])
-            for broader_theme, narrower_themes in hierarchic_themes.items():
-                self.g.add((dataset_ref, MOBILITYDCATAP.mobilityTheme, CleanedURIRef(broader_theme)))
-                if narrower_themes:
-                    for theme in narrower_themes:
-                        self._add_list_triple(dataset_ref, MOBILITYDCATAP.mobilityTheme, theme, URIRefOrLiteral)
-
-        if 'fluent_tags' in dataset_dict:
-            # TODO: adapt once nonsensical key-name has been changed.
-            # semantic meaning is transportation mode
-            self._add_triple_from_dict(dataset_dict, dataset_ref, MOBILITYDCATAP.transportMode, 'fluent_tags', list_value=True, _type=URIRef)
-
-        if 'network_coverage' in dataset_dict and len(dataset_dict['network_coverage']):
-            # Empty list, or list with only 1 item (that in turn contains the real list ...)
-            # TODO: fix strip once data serialization is fixed at source
-            network_coverage = dataset_dict['network_coverage'][0].strip("{}")
-            # TODO: 2 elements in prod DB have double mustache nesting. Those are considered broken data. Migrate those out
-            # _add_list_triple covers legacy comma separated lists
-            self._add_list_triple(dataset_ref, MOBILITYDCATAP.networkCoverage, network_coverage, URIRefOrLiteral)
-
-        if 'georeferencing_method' in dataset_dict:
-            self._add_triple_from_dict(dataset_dict, dataset_ref, MOBILITYDCATAP.georeferencingMethod, 'georeferencing_method', list_value=True, _type=URIRef)
-
-        if 'nap_type' in dataset_dict:
-            # TODO: Literal. Should be skos:Concept (ELI identifier)
-            self._add_triple_from_dict(dataset_dict, dataset_ref, DCATAP.applicableLegislation, 'nap_type', list_value=True, _type=Literal)
-
-        if 'reference_system' in dataset_dict:
-            # Somewhat unexpected interpretation of dct:conformsTo by MobilityDCAT, but according to spec
-            self._add_triple_from_dict(dataset_dict, dataset_ref, DCT.conformsTo, 'reference_system', list_value=True, _type=URIRef, value_modifier=self._fix_epsg_uri)
-
-        if 'qual_ass_translated' in dataset_dict:
-            for lang, val in dataset_dict['qual_ass_translated'].items():
-                if not val:
-                    continue
-                quality_annotation = BNode()
-                self.g.add((quality_annotation, RDF.type, DQV.QualityAnnotation))
-                self.g.add((dataset_ref, DQV.hasQualityAnnotation, quality_annotation))
-                body = BNode()
-                self.g.add((body, RDF.type, OA.TextualBody))
-                self.g.add((body, RDF.value, Literal(val)))
-                self.g.add((body, DC["format"], Literal("text/plain")))
-                self.g.add((body, DC.language, Literal(lang)))
-                self.g.add((quality_annotation, OA.hasBody, body))
-
-        for region in dataset_dict['regions_covered']:
-            location = BNode()
-            self.g.add((dataset_ref, DCT.spatial, location))
-            self.g.add((location, RDF.type, DCT.Location))
-            self.g.add((location, SKOS.inScheme, URIRef(EURO_SCHEME_URI_NUTS)))
-            self.g.add((location, DCT.identifier, URIRef(region)))
+    def graph_from_dataset(self, dataset_dict, dataset_ref):
+        """
+        Serves the dataset's triples from `dataset_graph_cache` when possible.
+        """
+        cached_triples = dataset_graph_cache.get(dataset_dict)
+        if cached_triples is not None:
+            self._bind_namespaces()
+            for triple in cached_triples:
+                self.g.add(triple)
+            return
+
+        triples = self._render_dataset_triples(dataset_dict, dataset_ref)
+        for triple in triples:
+            self.g.add(triple)
+        dataset_graph_cache.set(dataset_dict, triples)
+
+    def graph_from_datasets(self, dataset_dicts, catalog_ref=None):
+        """
+        Adds a batch of datasets, eg a catalog page, with their catalog
+        records, linked to `catalog_ref` if given. Returns the dataset refs.
+
+        The triples are the same as with `graph_from_dataset` and
+        `graph_from_catalog_record` for every dataset, but the setup happens
+        once per batch: the organizations are loaded in one go, each URI is
+        computed once and the namespaces are bound once.
+        """
+        organization_cache.prefetch(dataset_dicts)
+        self._bind_namespaces()
+        self._bind_profile_namespaces()
+
+        dataset_refs = []
+        with uri_scope():
+            for dataset_dict in dataset_dicts:
+                dataset_ref = URIRef(dataset_uri(dataset_dict))
+                self.graph_from_dataset(dataset_dict, dataset_ref)
+                catalog_record_ref = CleanedURIRef(catalog_record_uri(dataset_dict))
+                self.graph_from_catalog_record(dataset_dict, dataset_ref, catalog_record_ref)
+                if catalog_ref is not None:
+                    self.g.add((catalog_ref, DCAT.dataset, dataset_ref))
+                    self.g.add((catalog_ref, DCAT.record, URIRef(catalog_record_ref)))
+                dataset_refs.append(dataset_ref)
+        return dataset_refs
+
+    def _graph_from_dataset_napits(self, dataset_dict, dataset_ref):
+
+        super(EuropeanMobilityDCATAPProfile, self)._graph_from_dataset_napits(dataset_dict, dataset_ref)
+
+        with profile_metrics.stage('publisher', self.g):
+            org_id = dataset_dict["organization"]["id"]
+            # Copied, the cached dict is shared by every render in the process
+            org_dict = dict(self._org_cache[org_id])
+
+            # dcat2 already introduces org as publisher
+            org_ref = next(self.g.objects(dataset_ref, DCT.publisher))
+
+            self.g.add((org_ref, RDF.type, FOAF.Organization))
+            self._add_triples_from_dict(org_dict, org_ref, PUBLISHER_ITEMS)
+            self.g.add((org_ref, FOAF.mbox, URIRef(self._add_mailto(org_dict['do_email']))))
+            self.g.add((org_ref, FOAF.phone, URIRef(self._add_tel(org_dict['do_tel']))))
+            org_dict['display_title'] = self._suffix_to_fluent_multilang(org_dict, 'display_title', ['en', 'nl', 'fr', 'de'])
+            self._add_triple_from_dict(org_dict, org_ref, FOAF.name, 'display_title')
+
+            org_address = CleanedURIRef(publisher_uri_organization_address(dataset_dict))
+            self.g.add((org_address, RDF.type, LOCN.Address))
+            self.g.add((org_ref, LOCN.address, org_address))
+
+            self._add_triples_from_dict(org_dict, org_address, PUBLISHER_ADDRESS_ITEMS)
+
+            publisher_person = BNode()
+            self.g.add((publisher_person, RDF.type, FOAF.Person))
+
+            publisher_name = f"{dataset_dict['publisher_firstname']} {dataset_dict['publisher_surname']}".strip()
+            self.g.add((publisher_person, FOAF.name, Literal(publisher_name)))
+            self._add_triples_from_dict(dataset_dict, publisher_person, PUBLISHER_PERSON_ITEMS)
+
+            # Cardinality for dct:publisher is 1..1
+            # Connect publishing person to publishing org as org:memberOf
+            # https://mobilitydcat-ap.github.io/mobilityDCAT-AP/releases/index.html#agent-roles
+            self.g.add((publisher_person, ORG.memberOf, org_ref))
+
+        with profile_metrics.stage('mobility_themes', self.g):
+            # MobilityDCAT specified to remove dcat:keyword
+            for subject, predicate, _object in self.g.triples((dataset_ref, DCAT.keyword, None)):
+                self.g.remove((subject, predicate, _object))
+
+            if 'mobility_theme' in dataset_dict:
+                hierarchic_themes = json.loads(dataset_dict['mobility_theme'])
+                for broader_theme, narrower_themes in hierarchic_themes.items():
+                    self.g.add((dataset_ref, MOBILITYDCATAP.mobilityTheme, CleanedURIRef(broader_theme)))
+                    if narrower_themes:
+                        for theme in narrower_themes:
+                            self._add_list_triple(dataset_ref, MOBILITYDCATAP.mobilityTheme, theme, URIRefOrLiteral)
+
+            if 'fluent_tags' in dataset_dict:
+                # TODO: adapt once nonsensical key-name has been changed.
+                # semantic meaning is transportation mode
+                self._add_triple_from_dict(dataset_dict, dataset_ref, MOBILITYDCATAP.transportMode, 'fluent_tags', list_value=True, _type=URIRef)
+
+            if 'network_coverage' in dataset_dict and len(dataset_dict['network_coverage']):
+                # Empty list, or list with only 1 item (that in turn contains the real list ...)
+                # TODO: fix strip once data serialization is fixed at source
+                network_coverage = dataset_dict['network_coverage'][0].strip("{}")
+                # TODO: 2 elements in prod DB have double mustache nesting. Those are considered broken data. Migrate those out
+                # _add_list_triple covers legacy comma separated lists
+                self._add_list_triple(dataset_ref, MOBILITYDCATAP.networkCoverage, network_coverage, URIRefOrLiteral)
+
+            if 'georeferencing_method' in dataset_dict:
+                self._add_triple_from_dict(dataset_dict, dataset_ref, MOBILITYDCATAP.georeferencingMethod, 'georeferencing_method', list_value=True, _type=URIRef)
+
+            if 'nap_type' in dataset_dict:
+                # TODO: Literal. Should be skos:Concept (ELI identifier)
+                self._add_triple_from_dict(dataset_dict, dataset_ref, DCATAP.applicableLegislation, 'nap_type', list_value=True, _type=Literal)
+
+            if 'reference_system' in dataset_dict:
+                # Somewhat unexpected interpretation of dct:conformsTo by MobilityDCAT, but according to spec
+                self._add_triple_from_dict(dataset_dict, dataset_ref, DCT.conformsTo, 'reference_system', list_value=True, _type=URIRef, value_modifier=self._fix_epsg_uri)
+
+        with profile_metrics.stage('quality_annotations', self.g):
+            if 'qual_ass_translated' in dataset_dict:
+                annotations = dict((lang, val) for lang, val in dataset_dict['qual_ass_translated'].items() if val)
+                if catalog_language() in annotations:
+                    annotations = {catalog_language(): annotations[catalog_language()]}
+                for lang, val in annotations.items():
+                    quality_annotation = BNode()
+                    self.g.add((quality_annotation, RDF.type, DQV.QualityAnnotation))
+                    self.g.add((dataset_ref, DQV.hasQualityAnnotation, quality_annotation))
+                    body = BNode()
+                    self.g.add((body, RDF.type, OA.TextualBody))
+                    self.g.add((body, RDF.value, Literal(val)))
+                    self.g.add((body, DC["format"], Literal("text/plain")))
+                    self.g.add((body, DC.language, Literal(lang)))
+                    self.g.add((quality_annotation, OA.hasBody, body))
+
+        with profile_metrics.stage('spatial', self.g):
+            for region in dataset_dict['regions_covered']:
+                location = BNode()
+                self.g.add((dataset_ref, DCT.spatial, location))
+                self.g.add((location, RDF.type, DCT.Location))
+                self.g.add((location, SKOS.inScheme, NUTS_SCHEME_REF))
+                self.g.add((location, DCT.identifier, URIRef(region)))
 
         # dataset_dict['countries_covered'] not included in dct:spatial
         # Handling of international organizations/datasets for all delegated
         # regulations (MMTIS, RTTI, SRTI, SSTP) needs clearing out.
 
-        for resource_dict in dataset_dict.get("resources", []):
-            distribution_ref = CleanedURIRef(resource_uri(resource_dict))
-            items =[
-                ('acc_int', MOBILITYDCATAP.applicationLayerProtocol, None, URIRef),
-                ('acc_con', MOBILITYDCATAP.communicationMethod, None, URIRef),
-                ('acc_gra', MOBILITYDCATAP.grammar, None, URIRef),
-                ('acc_mod', MOBILITYDCATAP.mobilityDataStandard, None, URIRef),
-                ('acc_desc', MOBILITYDCATAP.dataFormatNotes, None, Literal),
-                ('acc_enc', CNT.characterEncoding, None, Literal),
-                ('description_resource_translated', DCT.description, None, Literal),
-            ]
-            if resource_dict['url_type'] == 'upload':
-                items.append(('url', DCAT.downloadURL, None, URIRef))
-
-            self._add_triples_from_dict(resource_dict, distribution_ref, items)
-
-            # MobilityDCAT specifies to remove these
-            for subject, predicate, _object in self.g.triples((distribution_ref, DCAT.byteSize, None)):
-                self.g.remove((subject, predicate, _object))
-            for subject, predicate, _object in self.g.triples((distribution_ref, DCAT.mediaType, None)):
-                self.g.remove((subject, predicate, _object))
+        with profile_metrics.stage('distributions', self.g):
+            for resource_dict in dataset_dict.get("resources", []):
+                distribution_ref = CleanedURIRef(resource_uri(resource_dict))
+                if resource_dict['url_type'] == 'upload':
+                    items = UPLOADED_DISTRIBUTION_ITEMS
+                else:
+                    items = DISTRIBUTION_ITEMS
+                self._add_triples_from_dict(resource_dict, distribution_ref, items)
+
+                # MobilityDCAT specifies to remove these
+                for subject, predicate, _object in self.g.triples((distribution_ref, DCAT.byteSize, None)):
+                    self.g.remove((subject, predicate, _object))
+                for subject, predicate, _object in self.g.triples((distribution_ref, DCAT.mediaType, None)):
+                    self.g.remove((subject, predicate, _object))
+
+        if vocabulary_index:
+            with profile_metrics.stage('vocabularies', self.g):
+                for predicate, scheme in VOCABULARY_PROPERTIES:
+                    self._validate_vocabulary_values(dataset_ref, predicate, scheme)
+                for location in self.g.objects(dataset_ref, DCT.spatial):
+                    self._validate_vocabulary_values(location, DCT.identifier, EURO_SCHEME_URI_NUTS)
 
+        return
 
+    def _validate_vocabulary_values(self, subject, predicate, scheme):
+        """
+        Replaces the URI values of `predicate` by their canonical form in the
+        vocabulary index, and drops the ones `scheme` doesn't contain if
+        configured so.
+        """
+        for value in list(self.g.objects(subject, predicate)):
+            if not isinstance(value, URIRef):
+                continue
+            canonical = vocabulary_index.validate(scheme, str(value))
+            if canonical != str(value):
+                self.g.remove((subject, predicate, value))
+                if canonical is not None:
+                    self.g.add((subject, predicate, URIRef(canonical)))
 
-        self._clean_empty_multilang_strings()
+    def graph_from_catalog(self, catalog_dict, catalog_ref):
+        """
+        Adds the static triples of the catalog, from `catalog_graph_cache`
+        when possible, and its `dct:modified`
+        """
+        for triple in self.static_catalog_triples(catalog_dict, catalog_ref):
+            self.g.add(triple)
+        self.graph_from_catalog_modified(catalog_ref)
 
-        return
+    def static_catalog_triples(self, catalog_dict, catalog_ref):
+        """
+        Returns the triples of the catalog that don't change with the
+        datasets: all of them but `dct:modified`. They are built once per
+        process, and again when the catalog URI or the site config change.
+        """
+        key = catalog_header_key(catalog_ref, catalog_dict)
+        triples = catalog_graph_cache.get(key)
+        if triples is None:
+            catalog_graph = self.g
+            self.g = Graph(namespace_manager=catalog_graph.namespace_manager)
+            try:
+                self._graph_from_catalog_napits(catalog_dict, catalog_ref)
+                self.g.remove((catalog_ref, DCT.modified, None))
+                triples = tuple(blank_nodes.stabilize(self.g, catalog_ref))
+            finally:
+                self.g = catalog_graph
+            catalog_graph_cache.set(key, triples)
+        else:
+            self._bind_namespaces()
+        return triples
+
+    def graph_from_catalog_modified(self, catalog_ref):
+        """
+        Adds the `dct:modified` of the catalog, the last modification of its
+        datasets
+        """
+        modified = self._last_catalog_modification()
+        if modified:
+            self._add_date_triple(catalog_ref, DCT.modified, modified)
 
-    def graph_from_catalog(self, catalog_dict, catalog_ref):
+    def _graph_from_catalog_napits(self, catalog_dict, catalog_ref):
         super(EuropeanMobilityDCATAPProfile, self).graph_from_catalog(catalog_dict, catalog_ref)
 
         location = BNode()
@@ -241,7 +401,88 @@ https://mobilitydcat-ap.github.io/mobilityDCAT-AP/releases/index.html
     def graph_from_catalog_record(self, dataset_dict, dataset_ref, catalog_record_ref):
         super(EuropeanMobilityDCATAPProfile, self).graph_from_catalog_record(dataset_dict, dataset_ref, catalog_record_ref)
 
-        items =[
-            ('metadata_created', DCT.created, None, Literal),
-        ]
-        self._add_date_triples_from_dict(dataset_dict, catalog_record_ref, items)
+        self._add_date_triples_from_dict(dataset_dict, catalog_record_ref, CATALOG_RECORD_ITEMS)
+
+    def parse_dataset(self, dataset_dict, dataset_ref):
+        """
+        Reads the MobilityDCAT-AP properties back into the fields of the
+        transportdata schema, on top of what upstream parses
+        """
+        dataset_dict = super(EuropeanMobilityDCATAPProfile, self).parse_dataset(dataset_dict, dataset_ref)
+
+        themes = self._mobility_theme_hierarchy(dataset_ref)
+        if themes:
+            dataset_dict['mobility_theme'] = json.dumps(themes)
+
+        for key, predicate in DATASET_LIST_ITEMS:
+            values = sorted(self._object_value_list(dataset_ref, predicate))
+            if values:
+                dataset_dict[key] = values
+
+        network_coverage = sorted(self._object_value_list(dataset_ref, MOBILITYDCATAP.networkCoverage))
+        if network_coverage:
+            # Same shape as stored, see `_graph_from_dataset_napits`
+            dataset_dict['network_coverage'] = ['{' + ','.join(network_coverage) + '}']
+
+        annotations = {}
+        for quality_annotation in self.g.objects(dataset_ref, DQV.hasQualityAnnotation):
+            for body in self.g.objects(quality_annotation, OA.hasBody):
+                value = self._object_value(body, RDF.value)
+                if value:
+                    annotations[self._object_value(body, DC.language) or self._default_lang] = value
+        if annotations:
+            dataset_dict['qual_ass_translated'] = annotations
+
+        regions = []
+        for location in self.g.objects(dataset_ref, DCT.spatial):
+            identifier = self._object(location, DCT.identifier)
+            if identifier is not None and ((location, SKOS.inScheme, NUTS_SCHEME_REF) in self.g
+                                           or str(identifier).startswith(EURO_SCHEME_URI_NUTS)):
+                regions.append(str(identifier))
+        dataset_dict['regions_covered'] = sorted(regions)
+
+        publisher_ref = self._object(dataset_ref, DCT.publisher)
+        if publisher_ref is not None:
+            for person in self.g.subjects(ORG.memberOf, publisher_ref):
+                if (person, RDF.type, FOAF.Person) in self.g:
+                    dataset_dict['publisher_firstname'] = self._object_value(person, FOAF.firstName)
+                    dataset_dict['publisher_surname'] = self._object_value(person, FOAF.surname)
+                    break
+
+        distributions = dict((str(distribution), distribution) for distribution in self._distributions(dataset_ref))
+        for resource_dict in dataset_dict.get('resources', []):
+            distribution = distributions.get(resource_dict.get('distribution_ref') or resource_dict.get('uri'))
+            if distribution is None:
+                continue
+            for key, predicate, _, _type in UPLOADED_DISTRIBUTION_ITEMS:
+                if key == 'url':
+                    continue
+                if key.endswith('_translated'):
+                    value = dict((lang, text) for lang, text in
+                                 self._object_value_multilingual(distribution, predicate).items() if text)
+                else:
+                    value = self._object_value(distribution, predicate)
+                if value:
+                    resource_dict[key] = value
+
+        return dataset_dict
+
+    def _mobility_theme_hierarchy(self, dataset_ref):
+        """
+        The mobility themes of the dataset as stored: the broader themes,
+        each with its narrower ones. Themes are broader unless the graph
+        says they're narrower (`skos:broader`) than another theme of the
+        dataset.
+        """
+        themes = set(self.g.objects(dataset_ref, MOBILITYDCATAP.mobilityTheme))
+        hierarchy = {}
+        narrower = {}
+        for theme in themes:
+            broader = [broader for broader in self.g.objects(theme, SKOS.broader) if broader in themes]
+            if broader:
+                narrower[theme] = min(broader)
+        for theme in sorted(themes - set(narrower)):
+            hierarchy[str(theme)] = []
+        for theme, broader in sorted(narrower.items()):
+            hierarchy.setdefault(str(broader), []).append(str(theme))
+        return hierarchy
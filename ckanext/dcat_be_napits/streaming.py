@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of the whole catalog.
+
+The catalog header is rendered and written first, then every dataset and its
+catalog record are rendered into their own small graph, serialized and
+dropped, so memory use does not grow with the number of datasets. The
+datasets are not kept in `dataset_graph_cache` either.
+"""
+import logging
+
+from rdflib import Graph, URIRef
+
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.dcat.processors import RDFSerializer
+from ckanext.dcat.profiles.base import CleanedURIRef, DCAT
+from ckanext.dcat.utils import url_to_rdflib_format, CONTENT_TYPES as DCAT_CONTENT_TYPES, DCAT_EXPOSE_SUBCATALOGS
+
+from ckanext.dcat_be_napits.buffer import scratch_graphs
+from ckanext.dcat_be_napits.cache import (
+    catalog_graph_cache,
+    catalog_header_key,
+    graph_cache_bypass,
+    organization_cache,
+)
+from ckanext.dcat_be_napits.canonical import canonical_ntriples, stable_blank_nodes
+from ckanext.dcat_be_napits.utils import catalog_record_uri, catalog_uri, dataset_uri, solr_quote, uri_scope
+
+log = logging.getLogger(__name__)
+
+STREAMING_PROFILES = ['euro_mobility_dcat_ap']
+
+# rdflib formats that can be written one graph at a time and concatenated
+STREAMING_FORMATS = ['nt', 'turtle']
+
+CONTENT_TYPES = dict(DCAT_CONTENT_TYPES, nt='application/n-triples')
+
+DATASETS_PER_BATCH = 500
+
+
+def streaming_format(_format):
+    '''
+    Returns the rdflib format for `_format`, or raises a ValueError if it can
+    not be streamed
+    '''
+    rdflib_format = url_to_rdflib_format(_format or 'ttl')
+    if rdflib_format not in STREAMING_FORMATS:
+        raise ValueError('Format {0} can not be streamed'.format(_format))
+    return rdflib_format
+
+
+def after_id_fq(dataset_id):
+    '''
+    Returns the Solr filter on the datasets following dataset id `dataset_id`
+    '''
+    return 'id:{{{0} TO *]'.format(solr_quote(dataset_id))
+
+
+def iter_catalog_datasets(context=None, batch_size=DATASETS_PER_BATCH, fq=None):
+    '''
+    Yields all the datasets of the catalog, as the DCAT catalog endpoints
+    list them, or the ones matching Solr filter `fq`. The organizations of
+    each batch are prefetched.
+
+    Batches are paged on the dataset id rather than with `start`, so Solr
+    doesn't skip an ever deeper offset, and datasets created or deleted
+    meanwhile don't shift the later batches.
+    '''
+    context = context or {'ignore_auth': True}
+    fq_list = ['-dataset_type:harvest', '-dataset_type:showcase']
+    if fq:
+        fq_list.append(fq)
+    last_id = None
+    while True:
+        query = toolkit.get_action('package_search')(dict(context), {
+            'q': '*:*',
+            'fq_list': fq_list + ([after_id_fq(last_id)] if last_id else []),
+            'sort': 'id asc',
+            'rows': batch_size,
+        })
+        dataset_dicts = query['results']
+        if not dataset_dicts:
+            return
+        organization_cache.prefetch(dataset_dicts)
+        for dataset_dict in dataset_dicts:
+            yield dataset_dict
+        if len(dataset_dicts) < batch_size:
+            return
+        last_id = dataset_dicts[-1]['id']
+
+
+class StreamingCatalogSerializer(RDFSerializer):
+    '''
+    An RDFSerializer that writes the catalog one dataset at a time
+
+    Only serializations that stay valid when concatenated are supported:
+    N-Triples and Turtle. Turtle prefixes are declared the first time a chunk
+    uses them; all chunks share one namespace manager, so a prefix always
+    stands for the same namespace.
+    '''
+
+    def __init__(self, profiles=None, compatibility_mode=False):
+        super(StreamingCatalogSerializer, self).__init__(
+            profiles=profiles or STREAMING_PROFILES, compatibility_mode=compatibility_mode)
+        self._declared_prefixes = {}
+
+    def graph_from_catalog_record(self, dataset_dict, dataset_ref):
+        '''
+        Given a CKAN dataset dict, adds its dcat:CatalogRecord to the graph
+
+        Returns the reference to the catalog record.
+        '''
+        catalog_record_ref = CleanedURIRef(catalog_record_uri(dataset_dict))
+
+        for profile_class in self._profiles:
+            profile = profile_class(self.g, compatibility_mode=self.compatibility_mode)
+            if hasattr(profile, 'graph_from_catalog_record'):
+                profile.graph_from_catalog_record(dataset_dict, dataset_ref, catalog_record_ref)
+
+        return catalog_record_ref
+
+    def graph_from_catalog_entries(self, dataset_dicts, catalog_ref, namespace_manager=None):
+        '''
+        Renders the datasets and catalog records of `dataset_dicts` into a new
+        graph, linked to the catalog `catalog_ref`, and returns it
+        '''
+        previous_graph = self.g
+        self.g = scratch_graphs.new(namespace_manager)
+        try:
+            if len(self._profiles) == 1 and hasattr(self._profiles[0], 'graph_from_datasets'):
+                profile = self._profiles[0](self.g, compatibility_mode=self.compatibility_mode)
+                profile.graph_from_datasets(dataset_dicts, catalog_ref)
+                return self.g
+            with uri_scope():
+                for dataset_dict in dataset_dicts:
+                    dataset_ref = self.graph_from_dataset(dataset_dict)
+                    self.g.add((catalog_ref, DCAT.dataset, dataset_ref))
+                    catalog_record_ref = self.graph_from_catalog_record(dataset_dict, dataset_ref)
+                    self.g.add((catalog_ref, DCAT.record, URIRef(catalog_record_ref)))
+            return self.g
+        finally:
+            self.g = previous_graph
+
+    def serialize_catalog(self, catalog_dict=None, dataset_dicts=None, _format='xml', pagination_info=None):
+        '''
+        Same as upstream, but renders the datasets in one batch, together
+        with their catalog records. Subcatalogs are left to upstream.
+        '''
+        if toolkit.asbool(toolkit.config.get(DCAT_EXPOSE_SUBCATALOGS, False)):
+            return super(StreamingCatalogSerializer, self).serialize_catalog(
+                catalog_dict, dataset_dicts, _format=_format, pagination_info=pagination_info)
+
+        catalog_ref = self.graph_from_catalog(catalog_dict)
+        if dataset_dicts:
+            for triple in self.graph_from_catalog_entries(dataset_dicts, catalog_ref, self.g.namespace_manager):
+                self.g.add(triple)
+        if pagination_info:
+            self._add_pagination_triples(pagination_info)
+
+        return self.g.serialize(format=url_to_rdflib_format(_format or 'xml'))
+
+    def merge_chunk(self, output, _format):
+        '''
+        Prepares a serialized graph to be appended to the output
+
+        For Turtle, the prefixes that are already declared with the same
+        namespace are dropped. The other ones are kept, so a prefix that a
+        graph binds to another namespace is redeclared before it is used.
+        '''
+        if _format != 'turtle':
+            return output
+
+        lines = output.split(b'\n')
+        prefixes = []
+        while lines and lines[0].startswith(b'@prefix'):
+            prefix = lines.pop(0)
+            name = prefix.split()[1]
+            if self._declared_prefixes.get(name) != prefix:
+                self._declared_prefixes[name] = prefix
+                prefixes.append(prefix)
+        body = b'\n'.join(lines).strip(b'\n')
+        return b'\n'.join(prefixes + [b'', body, b'', b''])
+
+    def _serialize_chunk(self, graph, _format):
+        return self.merge_chunk(graph.serialize(format=_format, encoding='utf-8'), _format)
+
+    def graph_from_catalog_header(self, _format, catalog_dict=None):
+        '''
+        Same as `graph_from_catalog`, but only the `dct:modified` of the
+        catalog is added to the graph: the rest of the catalog is returned
+        serialized in `_format` (an rdflib format), after the catalog ref.
+        It is serialized once per process for each format and cached in
+        `catalog_graph_cache`, so each response only serializes what changes.
+
+        Profiles that don't tell the static triples apart add the whole
+        catalog to the graph, and None is returned instead.
+        '''
+        if len(self._profiles) != 1 or not hasattr(self._profiles[0], 'static_catalog_triples'):
+            return self.graph_from_catalog(catalog_dict), None
+
+        catalog_ref = CleanedURIRef(catalog_uri())
+        profile = self._profiles[0](self.g, compatibility_mode=self.compatibility_mode)
+        triples = profile.static_catalog_triples(catalog_dict, catalog_ref)
+        key = (catalog_header_key(catalog_ref, catalog_dict), _format)
+        output = catalog_graph_cache.get(key)
+        if output is None:
+            graph = Graph(namespace_manager=self.g.namespace_manager)
+            for triple in triples:
+                graph.add(triple)
+            output = graph.serialize(format=_format, encoding='utf-8')
+            catalog_graph_cache.set(key, output)
+        profile.graph_from_catalog_modified(catalog_ref)
+        return catalog_ref, output
+
+    def serialize_catalog_header(self, _format, catalog_dict=None, canonical=False):
+        '''
+        Renders the catalog itself and returns it serialized in `_format` (an
+        rdflib format). Chunks passed to `merge_chunk` afterwards can follow it.
+
+        If `canonical`, the catalog is returned as canonical N-Triples.
+        '''
+        self._declared_prefixes = {}
+        if canonical:
+            catalog_ref = self.graph_from_catalog(catalog_dict)
+            return canonical_ntriples(stable_blank_nodes(self.g, catalog_ref))
+        catalog_ref, static_output = self.graph_from_catalog_header(_format, catalog_dict)
+        if static_output is None:
+            return self._serialize_chunk(self.g, _format)
+        return self.merge_chunk(static_output, _format) + self._serialize_chunk(self.g, _format)
+
+    def serialize_canonical_entry(self, dataset_dict, catalog_ref):
+        '''
+        Renders a dataset and its catalog record and returns them as
+        canonical N-Triples: sorted, with blank nodes named after the
+        dataset, so the bytes only change when the dataset's DCAT does
+        '''
+        graph = self.graph_from_catalog_entries([dataset_dict], catalog_ref, self.g.namespace_manager)
+        with uri_scope():
+            dataset_ref = CleanedURIRef(dataset_uri(dataset_dict))
+        return canonical_ntriples(stable_blank_nodes(graph, dataset_ref))
+
+    def stream_catalog(self, dataset_dicts, _format='ttl', catalog_dict=None, canonical=False):
+        '''
+        Yields the serialized catalog in chunks of bytes: first the catalog
+        itself, then one chunk per dataset together with its catalog record.
+
+        `dataset_dicts` can be any iterable, eg `iter_catalog_datasets()`.
+        With `canonical`, each chunk is canonical N-Triples, see
+        `serialize_canonical_entry`; only N-Triples can be canonical.
+        '''
+        _format = streaming_format(_format)
+        if canonical and _format != 'nt':
+            raise ValueError('Only N-Triples can be canonical')
+
+        yield self.serialize_catalog_header(_format, catalog_dict, canonical=canonical)
+        catalog_ref = CleanedURIRef(catalog_uri())
+
+        count = 0
+        with graph_cache_bypass():
+            for dataset_dict in dataset_dicts:
+                if canonical:
+                    yield self.serialize_canonical_entry(dataset_dict, catalog_ref)
+                else:
+                    graph = self.graph_from_catalog_entries(
+                        [dataset_dict], catalog_ref, self.g.namespace_manager)
+                    yield self._serialize_chunk(graph, _format)
+                count += 1
+
+        log.debug('Streamed a catalog of %d datasets', count)
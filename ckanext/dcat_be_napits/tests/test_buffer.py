@@ -0,0 +1,51 @@
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+
+from ckanext.dcat.profiles.base import DCAT, DCT, LOCN
+
+from ckanext.dcat_be_napits.buffer import TripleBuffer
+
+DATASET = URIRef("https://example.org/dataset/ds-1")
+
+
+def _graph():
+    g = Graph(store=TripleBuffer())
+    location = BNode()
+    g.add((DATASET, DCT.title, Literal("Traffic", lang="en")))
+    g.add((DATASET, DCT.title, Literal("", lang="nl")))
+    g.add((DATASET, DCT.spatial, location))
+    g.add((location, LOCN.geometry, Literal("POLYGON ((0 0, 1 0, 1 1, 0 0))")))
+    return g
+
+
+def test_patterns():
+    g = _graph()
+    g.add((DATASET, DCT.title, Literal("Traffic", lang="en")))
+
+    assert len(g) == 4
+    assert len(list(g.objects(DATASET, DCT.title))) == 2
+    assert (None, LOCN.geometry, None) in g
+    assert list(g.subjects(DCT.title, Literal("", lang="nl"))) == [DATASET]
+    assert not list(g.triples((URIRef("https://example.org/other"), None, None)))
+
+
+def test_remove_while_iterating():
+    g = _graph()
+
+    for subject, predicate, _object in g.triples((None, LOCN.geometry, None)):
+        g.remove((subject, predicate, _object))
+        g.add((subject, DCAT.bbox, _object))
+    g.remove((None, None, Literal("", lang="nl")))
+
+    assert len(g) == 3
+    assert (None, LOCN.geometry, None) not in g
+    assert (None, DCAT.bbox, None) in g
+
+
+def test_same_graph_as_the_default_store():
+    g = _graph()
+    expected = Graph()
+    for triple in g:
+        expected.add(triple)
+
+    assert isomorphic(Graph().parse(data=g.serialize(format="turtle"), format="turtle"), expected)
@@ -0,0 +1,79 @@
+import pytest
+
+from ckan.tests import factories
+
+from ckanext.dcat_be_napits.cache import DatasetGraphCache, OrganizationCache
+
+
+def _dataset(id_, modified="2024-01-01T00:00:00", org_id="org-1"):
+    return {"id": id_, "metadata_modified": modified, "organization": {"id": org_id}}
+
+
+def test_graph_cache_hit_and_stale_entry():
+    cache = DatasetGraphCache(max_size=10, max_age=0)
+    cache.set(_dataset("a"), [("s", "p", "o")])
+
+    assert cache.get(_dataset("a")) == (("s", "p", "o"),)
+    assert cache.get(_dataset("a", modified="2024-02-01T00:00:00")) is None
+    assert len(cache) == 0
+
+
+def test_graph_cache_evicts_least_recently_used():
+    cache = DatasetGraphCache(max_size=2, max_age=0)
+    cache.set(_dataset("a"), [])
+    cache.set(_dataset("b"), [])
+    cache.get(_dataset("a"))
+    cache.set(_dataset("c"), [])
+
+    assert cache.get(_dataset("b")) is None
+    assert cache.get(_dataset("a")) == ()
+
+
+def test_graph_cache_invalidation():
+    cache = DatasetGraphCache(max_size=10, max_age=0)
+    cache.set(_dataset("a", org_id="org-1"), [])
+    cache.set(_dataset("b", org_id="org-2"), [])
+    cache.set(_dataset("c", org_id="org-2"), [])
+
+    cache.invalidate("a")
+    cache.invalidate_organization("org-2")
+
+    assert len(cache) == 0
+
+
+def test_graph_cache_disabled():
+    cache = DatasetGraphCache(max_size=0)
+    cache.set(_dataset("a"), [])
+
+    assert cache.get(_dataset("a")) is None
+
+
+def test_org_cache_invalidation():
+    cache = OrganizationCache(max_age=0)
+    cache["org-1"] = {"id": "org-1"}
+
+    assert "org-1" in cache
+    cache.invalidate("org-1")
+    assert "org-1" not in cache
+
+
+@pytest.mark.usefixtures("clean_db")
+def test_org_cache_prefetch():
+    org = factories.Organization()
+    dataset = factories.Dataset(owner_org=org["id"])
+    cache = OrganizationCache()
+
+    cache.prefetch([dataset])
+
+    assert org["id"] in cache
+    assert cache[org["id"]]["name"] == org["name"]
+
+
+@pytest.mark.usefixtures("clean_db")
+def test_org_cache_loads_missing_organization():
+    org = factories.Organization()
+    cache = OrganizationCache()
+
+    assert cache[org["id"]]["name"] == org["name"]
+    with pytest.raises(KeyError):
+        cache["not-an-org"]
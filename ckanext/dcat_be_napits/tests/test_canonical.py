@@ -0,0 +1,48 @@
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+
+from ckanext.dcat.profiles.base import DCAT, DCT, FOAF, RDF, VCARD
+
+from ckanext.dcat_be_napits.canonical import canonical_ntriples, stable_blank_nodes
+
+DATASET = URIRef("https://example.org/dataset/ds-1")
+DISTRIBUTION = URIRef("https://example.org/dataset/ds-1/resource/res-1")
+
+
+def _render(rights=("Free", "Open")):
+    # Same dataset as the profiles render it, with new blank nodes each time
+    g = Graph()
+    contact_point = BNode()
+    g.add((DATASET, DCAT.contactPoint, contact_point))
+    g.add((contact_point, RDF.type, VCARD.Kind))
+    g.add((contact_point, VCARD.fn, Literal("NGI")))
+    g.add((DATASET, DCAT.distribution, DISTRIBUTION))
+    for text in rights:
+        rights_statement = BNode()
+        g.add((DISTRIBUTION, DCT.rights, rights_statement))
+        g.add((rights_statement, RDF.type, DCT.RightsStatement))
+        g.add((rights_statement, DCT.description, Literal(text, lang="en")))
+    # Not referred to by anything
+    person = BNode()
+    g.add((person, RDF.type, FOAF.Person))
+    g.add((person, FOAF.name, Literal("Jane")))
+    return g
+
+
+def test_canonical_output_is_stable():
+    first = canonical_ntriples(stable_blank_nodes(_render(), DATASET))
+    second = canonical_ntriples(stable_blank_nodes(_render(rights=("Open", "Free")), DATASET))
+
+    assert first == second
+    assert first.splitlines() == sorted(first.splitlines())
+    assert canonical_ntriples(stable_blank_nodes(_render(rights=("Free",)), DATASET)) != first
+
+
+def test_stable_blank_nodes_keep_the_graph():
+    g = _render()
+    stable = Graph()
+    for triple in stable_blank_nodes(g, DATASET):
+        stable.add(triple)
+
+    assert isomorphic(stable, g)
+    assert len(set(stable.subjects(RDF.type, DCT.RightsStatement))) == 2
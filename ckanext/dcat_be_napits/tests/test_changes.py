@@ -0,0 +1,55 @@
+import pytest
+from rdflib import URIRef
+
+from ckan.plugins import toolkit
+from ckanext.dcat.profiles.base import ADMS, DCAT
+
+from ckanext.dcat_be_napits.changes import (
+    CHANGE_TYPE,
+    ChangesSerializer,
+    decode_cursor,
+    encode_cursor,
+    keyset_fq,
+)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"id": "ds-1", "metadata_modified": "2024-03-01T10:00:00.123456"})
+
+    assert decode_cursor(cursor) == ("2024-03-01T10:00:00.123456Z", "ds-1")
+
+
+def test_invalid_cursor():
+    with pytest.raises(toolkit.ValidationError):
+        decode_cursor("not a cursor")
+
+
+def test_keyset_fq_breaks_ties_on_id():
+    cursor = encode_cursor({"id": "ds-1", "metadata_modified": "2024-03-01T10:00:00"})
+
+    assert keyset_fq(cursor) == (
+        '(metadata_modified:{2024-03-01T10:00:00Z TO *] OR '
+        '(metadata_modified:"2024-03-01T10:00:00Z" AND id:{"ds-1" TO *]))'
+    )
+
+
+def test_keyset_fq_descending():
+    cursor = encode_cursor({"id": "ds-1", "metadata_modified": "2024-03-01T10:00:00"})
+
+    assert keyset_fq(cursor, descending=True) == (
+        '(metadata_modified:[* TO 2024-03-01T10:00:00Z} OR '
+        '(metadata_modified:"2024-03-01T10:00:00Z" AND id:[* TO "ds-1"}))'
+    )
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_tombstone():
+    serializer = ChangesSerializer()
+    catalog_ref = URIRef("https://example.org")
+    dataset_dict = {"id": "ds-1", "state": "deleted", "metadata_modified": "2024-03-01T10:00:00"}
+
+    record_ref = serializer.graph_from_tombstone(dataset_dict, catalog_ref)
+
+    assert (catalog_ref, DCAT.record, record_ref) in serializer.g
+    assert (record_ref, ADMS.status, CHANGE_TYPE.deleted) in serializer.g
+    assert not list(serializer.g.triples((catalog_ref, DCAT.dataset, None)))
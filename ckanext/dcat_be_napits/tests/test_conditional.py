@@ -0,0 +1,55 @@
+import pytest
+
+from ckan.plugins import toolkit
+from ckan.tests import factories, helpers
+
+
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+def test_dataset_endpoint_answers_304_when_unchanged(app):
+    dataset = factories.Dataset()
+    url = toolkit.url_for("dcat.read_dataset", _id=dataset["name"], _format="ttl")
+
+    response = app.get(url)
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert app.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+def test_catalog_validator_changes_with_datasets(app):
+    factories.Dataset()
+    url = toolkit.url_for("dcat.read_catalog", _format="ttl")
+    etag = app.get(url).headers["ETag"]
+
+    factories.Dataset()
+
+    response = app.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+def test_catalog_ignores_if_modified_since_after_a_deletion(app):
+    deleted = factories.Dataset()
+    factories.Dataset()
+    url = toolkit.url_for("dcat.read_catalog", _format="ttl")
+    last_modified = app.get(url).headers["Last-Modified"]
+
+    helpers.call_action("package_delete", id=deleted["id"])
+
+    response = app.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+
+
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+def test_dataset_endpoint_answers_if_modified_since(app):
+    dataset = factories.Dataset()
+    url = toolkit.url_for("dcat.read_dataset", _id=dataset["name"], _format="ttl")
+    last_modified = app.get(url).headers["Last-Modified"]
+
+    assert app.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
@@ -0,0 +1,87 @@
+import gzip
+
+import pytest
+
+from ckanext.dcat_be_napits import export_jobs
+from ckanext.dcat_be_napits.export_jobs import COMPLETE, QUEUED, RUNNING, ExportJobs
+from ckanext.dcat_be_napits.tests.test_jobs import InProcessQueue
+
+DATASETS = [{"id": "ds-{0:02d}".format(i)} for i in range(7)]
+
+HEADER = b"<catalog> <title> \"Catalog\" .\n"
+
+
+class WorkerKilled(BaseException):
+    '''
+    The worker dies, the export doesn't get to record a failure
+    '''
+
+
+class Serializer(object):
+
+    def serialize_catalog_header(self, _format):
+        return HEADER
+
+
+@pytest.fixture
+def exports(tmp_path, monkeypatch):
+    exports = ExportJobs(backend=InProcessQueue())
+    exports.configure(str(tmp_path), chunk_size=2)
+    exports.killed_after = None
+
+    def datasets(fq=None):
+        after = fq.split('"')[1] if fq else ""
+        return [dataset_dict for dataset_dict in DATASETS if dataset_dict["id"] > after]
+
+    def render_chunks(chunks, _format, serializer, workers=1):
+        for index, chunk in enumerate(chunks):
+            if index == exports.killed_after:
+                raise WorkerKilled()
+            yield chunk, b"".join("<{0}> <title> \"x\" .\n".format(d["id"]).encode("utf-8") for d in chunk[0])
+
+    monkeypatch.setattr(export_jobs, "export_jobs", exports)
+    monkeypatch.setattr(export_jobs, "_catalog_version", lambda: [1, "2024-01-01T00:00:00", len(DATASETS)])
+    monkeypatch.setattr(export_jobs, "_count_datasets", lambda cursor=None: len(datasets(export_jobs._after(cursor))))
+    monkeypatch.setattr(export_jobs, "iter_catalog_datasets", datasets)
+    monkeypatch.setattr(export_jobs, "iter_chunks", lambda dataset_dicts, size: (
+        (dataset_dicts[i:i + size], {}) for i in range(0, len(dataset_dicts), size)))
+    monkeypatch.setattr(export_jobs, "render_chunks", render_chunks)
+    monkeypatch.setattr(export_jobs, "StreamingCatalogSerializer", Serializer)
+    return exports
+
+
+def test_export_resumes_after_its_worker_died(exports):
+    state = exports.start("nt")
+    assert state["status"] == QUEUED
+    assert exports.start("nt")["id"] == state["id"]
+
+    exports.killed_after = 2
+    with pytest.raises(WorkerKilled):
+        exports.backend.work()
+    exports.backend.job_from_id("dcat_be_napits-export-" + state["id"]).status = "failed"
+
+    # Reading the state doesn't resume it, starting the export again does
+    assert exports.get(state["id"])["status"] == RUNNING
+    state = exports.start("nt")
+    assert state["status"] == QUEUED
+    assert state["done"] == 4
+
+    exports.killed_after = None
+    exports.backend.work()
+    state = exports.get(state["id"])
+
+    assert state["status"] == COMPLETE
+    assert (state["done"], state["total"], state["resumed"]) == (7, 7, 1)
+    with open(exports.file_path(state), "rb") as f:
+        lines = gzip.decompress(f.read()).splitlines(True)
+    assert lines[0] == HEADER
+    assert [line.split(b">")[0] for line in lines[1:]] == [b"<" + d["id"].encode("utf-8") for d in DATASETS]
+
+    # Complete and up to date, so it is not exported again
+    assert exports.start("nt")["id"] == state["id"]
+    assert exports.start("ttl")["id"] != state["id"]
+
+
+def test_unknown_export(exports):
+    assert exports.get("0" * 32) is None
+    assert exports.get("../secrets") is None
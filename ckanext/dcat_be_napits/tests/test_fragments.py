@@ -0,0 +1,101 @@
+import gzip
+
+import pytest
+
+from ckanext.dcat_be_napits.fragments import (
+    Fragment,
+    FragmentConflict,
+    FragmentStore,
+    assemble,
+    split_serialization,
+)
+from ckanext.dcat_be_napits.utils import language_scope
+
+
+def test_split_turtle():
+    output = b"@prefix dct: <http://purl.org/dc/terms/> .\n\n<a> dct:title \"A\" .\n\n"
+
+    namespaces, body = split_serialization(output, "turtle")
+
+    assert namespaces == [("dct", "http://purl.org/dc/terms/")]
+    assert body == b"<a> dct:title \"A\" .\n\n"
+
+
+def test_assemble_turtle_declares_prefixes_once():
+    header = Fragment([("dct", "http://purl.org/dc/terms/")], b"<c> dct:title \"C\" .\n\n")
+    fragments = [
+        Fragment([("dct", "http://purl.org/dc/terms/")], b"<a> dct:title \"A\" .\n\n"),
+        Fragment([("ns1", "http://example.org/")], b"<b> ns1:p \"B\" .\n\n"),
+    ]
+
+    output = b"".join(assemble(header, fragments, "turtle"))
+
+    assert output.count(b"@prefix dct:") == 1
+    assert b"@prefix ns1: <http://example.org/> .\n\n<b>" in output
+
+
+def test_assemble_compressed_is_one_gzip_stream():
+    header = Fragment([], b"<c> <p> \"C\" .\n")
+    fragments = [Fragment([], b"<a> <p> \"A\" .\n"), Fragment([], b"<b> <p> \"B\" .\n")]
+
+    output = b"".join(assemble(header, fragments, "nt"))
+    compressed = b"".join(assemble(header, fragments, "nt", compress=True))
+
+    assert gzip.decompress(compressed) == output
+
+
+def test_assemble_xml_conflicting_prefixes():
+    header = Fragment([("ns1", "http://example.org/")], b"")
+    fragments = [Fragment([("ns1", "http://example.com/")], b"")]
+
+    with pytest.raises(FragmentConflict):
+        b"".join(assemble(header, fragments, "pretty-xml"))
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_store_misses_after_dataset_change(tmp_path):
+    store = FragmentStore(str(tmp_path), "ttl")
+    dataset_dict = {"id": "ds-1", "metadata_modified": "2024-01-01T00:00:00"}
+    output = b"@prefix dct: <http://purl.org/dc/terms/> .\n\n<a> dct:title \"A\" .\n\n"
+
+    store.put(dataset_dict, "turtle", [], output)
+    fragment = store.get(dataset_dict, "turtle", [])
+
+    assert fragment.body == b"<a> dct:title \"A\" .\n\n"
+    assert gzip.decompress(fragment.compressed()) == fragment.body
+    assert store.get(dict(dataset_dict, metadata_modified="2024-01-02T00:00:00"), "turtle", []) is None
+
+    store.invalidate("ds-1")
+    assert store.get(dataset_dict, "turtle", []) is None
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_store_keeps_the_variants_of_a_dataset(tmp_path):
+    store = FragmentStore(str(tmp_path), "ttl")
+    dataset_dict = {"id": "ds-1", "metadata_modified": "2024-01-01T00:00:00"}
+
+    for lang in ("nl", "fr"):
+        with language_scope(lang):
+            store.put(dataset_dict, "turtle", [], "<a> dct:title \"{0}\" .\n\n".format(lang).encode("utf-8"))
+
+    for lang in ("nl", "fr"):
+        with language_scope(lang):
+            assert store.get(dataset_dict, "turtle", []).body == "<a> dct:title \"{0}\" .\n\n".format(lang).encode("utf-8")
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_store_removes_out_of_date_fragments(tmp_path):
+    store = FragmentStore(str(tmp_path), "ttl")
+    old = {"id": "ds-1", "metadata_modified": "2024-01-01T00:00:00"}
+    new = dict(old, metadata_modified="2024-01-02T00:00:00")
+    output = b"<a> dct:title \"A\" .\n\n"
+
+    store.put(old, "turtle", [], output)
+    with language_scope("nl"):
+        store.put(new, "turtle", [], output)
+    store.put(new, "turtle", [], output)
+
+    assert store.get(old, "turtle", []) is None
+    with language_scope("nl"):
+        assert store.get(new, "turtle", []) is not None
+    assert len(list((tmp_path / "ds" / "ds-1").iterdir())) == 4
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+from ckanext.dcat_be_napits import jobs
+from ckanext.dcat_be_napits.jobs import RenderQueue, publisher_changed
+
+
+class InProcessQueue(object):
+    '''
+    Stand-in for `ckan.lib.jobs`: keeps the jobs in memory and runs them when
+    `work` is called, in queue order
+    '''
+
+    def __init__(self):
+        self.queued = []
+        self.jobs = {}
+
+    def enqueue(self, fn, args=None, kwargs=None, title=None, queue=None, rq_kwargs=None):
+        rq_kwargs = rq_kwargs or {}
+        job = SimpleNamespace(id=rq_kwargs["job_id"], fn=fn, args=args or [], status="queued")
+        job.get_status = lambda: job.status
+        self.jobs[job.id] = job
+        if rq_kwargs.get("at_front"):
+            self.queued.insert(0, job)
+        else:
+            self.queued.append(job)
+        return job
+
+    def job_from_id(self, id):
+        return self.jobs[id]
+
+    def work(self):
+        while self.queued:
+            job = self.queued.pop(0)
+            job.fn(*job.args)
+            job.status = "finished"
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    rendered = []
+    monkeypatch.setattr(jobs, "render_datasets", lambda fq: rendered.append(fq) or 1)
+    return rendered
+
+
+@pytest.fixture
+def queue():
+    backend = InProcessQueue()
+    render_queue = RenderQueue(backend=backend)
+    render_queue.configure(enabled=True)
+    yield render_queue
+    render_queue._pending().clear()
+
+
+def test_changes_to_a_dataset_are_merged(queue, rendered):
+    queue.dataset_changed("ds-1")
+    queue.dataset_changed("ds-1")
+    queue.flush()
+    queue.dataset_changed("ds-1")
+    queue.flush()
+
+    assert len(queue.backend.queued) == 1
+    assert queue.merged == 1
+
+    queue.backend.work()
+    assert rendered == ['id:"ds-1"']
+
+    # Once the job ran, the next change gets a new one
+    queue.dataset_changed("ds-1")
+    queue.flush()
+    assert len(queue.backend.queued) == 1
+
+
+def test_at_front(queue, rendered):
+    queue.dataset_changed("ds-1")
+    queue.flush()
+    queue.configure(enabled=True, at_front=True)
+    queue.organization_changed("org-1")
+    queue.flush()
+
+    queue.backend.work()
+
+    assert rendered == ['owner_org:"org-1"', 'id:"ds-1"']
+
+
+def test_disabled_queue_enqueues_nothing(rendered):
+    queue = RenderQueue(backend=InProcessQueue())
+
+    queue.dataset_changed("ds-1")
+    queue.flush()
+
+    assert not queue.backend.queued
+
+
+def test_publisher_changed():
+    organization = SimpleNamespace(title="NGI", extras={"city": "Brussels", "display_title_en": "NGI"})
+    old_org_dict = {"title": "NGI", "city": "Brussels", "display_title_en": "NGI", "description": "Old"}
+
+    assert not publisher_changed(old_org_dict, organization)
+    assert publisher_changed(dict(old_org_dict, city="Ghent"), organization)
+    assert publisher_changed(None, organization)
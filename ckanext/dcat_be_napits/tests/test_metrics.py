@@ -0,0 +1,24 @@
+from rdflib import Graph, URIRef
+
+from ckanext.dcat_be_napits.metrics import ProfileMetrics
+
+
+def test_stage_records_time_and_triples():
+    metrics = ProfileMetrics(enabled=True)
+    g = Graph()
+
+    with metrics.stage("contact_point", g):
+        g.add((URIRef("http://a"), URIRef("http://p"), URIRef("http://b")))
+
+    count, seconds, triples = metrics.snapshot()["contact_point"]
+    assert (count, triples) == (1, 1)
+    assert 'dcat_be_napits_profile_stage_runs_total{stage="contact_point"} 1' in metrics.prometheus()
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = ProfileMetrics()
+
+    with metrics.stage("contact_point", Graph()):
+        pass
+
+    assert not metrics.snapshot()
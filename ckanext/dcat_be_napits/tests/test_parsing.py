@@ -0,0 +1,85 @@
+import json
+import os
+
+from rdflib import BNode, Graph, Literal, URIRef
+from rdflib.namespace import XSD
+
+from ckanext.dcat.profiles.base import DCT
+
+from ckanext.dcat_be_napits.parsing import StreamingCatalogParser, TripleFile
+
+DATASET = URIRef("https://example.org/dataset/ds-1")
+
+CATALOG = """
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix dcat: <http://www.w3.org/ns/dcat#> .
+@prefix dct: <http://purl.org/dc/terms/> .
+@prefix dqv: <http://www.w3.org/ns/dqv#> .
+@prefix oa: <https://www.w3.org/ns/oa#> .
+@prefix dc: <http://purl.org/dc/elements/1.1/> .
+@prefix cnt: <http://www.w3.org/2011/content#> .
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix mobilitydcatap: <https://w3id.org/mobilitydcat-ap#> .
+
+<https://example.org/dataset/ds-1> a dcat:Dataset ;
+    dct:title "Road works"@en ;
+    mobilitydcatap:mobilityTheme <https://w3id.org/mobilitydcat-ap/mobility-theme/road-network-and-traffic>,
+        <https://w3id.org/mobilitydcat-ap/mobility-theme/road-works> ;
+    mobilitydcatap:transportMode <https://w3id.org/mobilitydcat-ap/transport-mode/car> ;
+    mobilitydcatap:networkCoverage <https://w3id.org/mobilitydcat-ap/network-coverage/motorway> ;
+    mobilitydcatap:georeferencingMethod <https://w3id.org/mobilitydcat-ap/georeferencing-method/geocoordinates> ;
+    dqv:hasQualityAnnotation [ a dqv:QualityAnnotation ;
+        oa:hasBody [ a oa:TextualBody ; rdf:value "Checked" ; dc:language "en" ] ] ;
+    dct:spatial [ a dct:Location ;
+        skos:inScheme <http://data.europa.eu/nuts> ;
+        dct:identifier <http://data.europa.eu/nuts/code/BE2> ] ;
+    dcat:distribution <https://example.org/dataset/ds-1/resource/res-1> .
+
+<https://w3id.org/mobilitydcat-ap/mobility-theme/road-works>
+    skos:broader <https://w3id.org/mobilitydcat-ap/mobility-theme/road-network-and-traffic> .
+
+<https://example.org/dataset/ds-1/resource/res-1> a dcat:Distribution ;
+    dcat:accessURL <https://example.org/feed> ;
+    mobilitydcatap:mobilityDataStandard <https://w3id.org/mobilitydcat-ap/mobility-data-standard/datex-II> ;
+    cnt:characterEncoding "UTF-8" .
+"""
+
+
+def test_triple_file():
+    store = TripleFile()
+    g = Graph(store=store)
+    location = BNode()
+    g.add((DATASET, DCT.title, Literal("Traffic", lang="en")))
+    g.add((DATASET, DCT.title, Literal("Traffic", lang="en")))
+    g.add((DATASET, DCT.issued, Literal("2024-05-01", datatype=XSD.date)))
+    g.add((DATASET, DCT.spatial, location))
+
+    assert len(g) == 3
+    assert g.value(DATASET, DCT.issued) == Literal("2024-05-01", datatype=XSD.date)
+    assert list(g.subjects(DCT.spatial, location)) == [DATASET]
+
+    g.remove((DATASET, DCT.title, None))
+    assert (DATASET, DCT.title, None) not in g
+
+    store.close()
+    assert not os.path.exists(store.path)
+
+
+def test_parse_mobility_properties():
+    with StreamingCatalogParser() as parser:
+        parser.parse(CATALOG, "ttl")
+        dataset_dicts = list(parser.datasets())
+
+    assert len(dataset_dicts) == 1
+    dataset_dict = dataset_dicts[0]
+    assert json.loads(dataset_dict["mobility_theme"]) == {
+        "https://w3id.org/mobilitydcat-ap/mobility-theme/road-network-and-traffic": [
+            "https://w3id.org/mobilitydcat-ap/mobility-theme/road-works"],
+    }
+    assert dataset_dict["fluent_tags"] == ["https://w3id.org/mobilitydcat-ap/transport-mode/car"]
+    assert dataset_dict["network_coverage"] == ["{https://w3id.org/mobilitydcat-ap/network-coverage/motorway}"]
+    assert dataset_dict["qual_ass_translated"] == {"en": "Checked"}
+    assert dataset_dict["regions_covered"] == ["http://data.europa.eu/nuts/code/BE2"]
+    resource_dict = dataset_dict["resources"][0]
+    assert resource_dict["acc_mod"] == "https://w3id.org/mobilitydcat-ap/mobility-data-standard/datex-II"
+    assert resource_dict["acc_enc"] == "UTF-8"
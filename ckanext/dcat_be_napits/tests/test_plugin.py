@@ -47,10 +47,13 @@ To temporary patch the CKAN configuration for the duration of a test you can use
     def test_some_action():
         pass
 """
-import ckanext.dcat-be-napits.plugin as plugin
+import pytest
 
+from ckan.plugins import plugin_loaded
 
-@pytest.mark.ckan_config("ckan.plugins", "dcat-be-napits")
+
+# The extension chains actions of the dcat plugin
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
 @pytest.mark.usefixtures("with_plugins")
 def test_plugin():
-    assert plugin_loaded("dcat-be-napits")
+    assert plugin_loaded("dcat_be_napits")
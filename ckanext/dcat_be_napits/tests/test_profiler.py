@@ -0,0 +1,49 @@
+from ckanext.dcat_be_napits.profiler import DatasetCost, cost_drivers, dataset_features, histogram, report, sample
+
+
+def _cost(seconds, resources, regions):
+    return DatasetCost("ds", "ds", seconds, 0, 0, {}, None,
+                       {"resources": resources, "regions_covered": regions})
+
+
+def test_dataset_features():
+    dataset_dict = {
+        "notes_translated": {"en": "Traffic", "nl": "Verkeer", "fr": ""},
+        "regions_covered": ["BE1", "BE2"],
+        "resources": [{"description_resource_translated": {"en": "Feed"}}, {}],
+    }
+
+    assert dataset_features(dataset_dict) == {"resources": 2, "regions_covered": 2, "translated_values": 3}
+
+
+def test_sample():
+    picked = sample(iter(range(100)), 10, seed=1)
+
+    assert len(picked) == 10
+    assert picked == sorted(picked)
+    assert picked == sample(range(100), 10, seed=1)
+    assert sample(range(5), 10) == [0, 1, 2, 3, 4]
+
+
+def test_cost_drivers():
+    costs = [_cost(0.01 + 0.002 * resources, resources, 2) for resources in (1, 3, 100, 7)]
+
+    drivers = dict((feature, (correlation, slope)) for feature, correlation, slope in cost_drivers(costs))
+
+    assert round(drivers["resources"][0], 6) == 1
+    assert round(drivers["resources"][1], 6) == 0.002
+    assert drivers["regions_covered"] == (None, None)
+
+
+def test_histogram():
+    buckets = histogram([0.01, 0.01, 0.1, 1.0], buckets=2)
+
+    assert [count for _, _, count in buckets] == [2, 2]
+    assert histogram([]) == []
+
+
+def test_report_without_measurable_render_times():
+    lines = report([_cost(0, 1, 1), _cost(0, 2, 1)])
+
+    assert "Render time" not in lines
+    assert "Cost drivers" in lines
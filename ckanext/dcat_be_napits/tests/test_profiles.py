@@ -0,0 +1,37 @@
+import pytest
+from rdflib import Graph, URIRef
+from rdflib.compare import isomorphic
+
+from ckanext.dcat.profiles.base import DCAT, CleanedURIRef
+
+from benchmarks.datasets import catalog
+from ckanext.dcat_be_napits.cache import graph_cache_bypass, organization_cache
+from ckanext.dcat_be_napits.profiles import EuropeanMobilityDCATAPProfile
+from ckanext.dcat_be_napits.utils import catalog_record_uri, dataset_uri
+
+
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+@pytest.mark.usefixtures("with_plugins")
+def test_batch_renders_the_same_triples_as_each_dataset():
+    org_dicts, dataset_dicts = catalog(12, organizations=3)
+    for org_dict in org_dicts:
+        organization_cache[org_dict["id"]] = org_dict
+    catalog_ref = URIRef("https://example.org/catalog")
+
+    with graph_cache_bypass():
+        batch = Graph()
+        EuropeanMobilityDCATAPProfile(batch).graph_from_datasets(dataset_dicts, catalog_ref)
+
+        single = Graph()
+        for dataset_dict in dataset_dicts:
+            profile = EuropeanMobilityDCATAPProfile(single)
+            dataset_ref = URIRef(dataset_uri(dataset_dict))
+            catalog_record_ref = CleanedURIRef(catalog_record_uri(dataset_dict))
+            profile.graph_from_dataset(dataset_dict, dataset_ref)
+            profile.graph_from_catalog_record(dataset_dict, dataset_ref, catalog_record_ref)
+            single.add((catalog_ref, DCAT.dataset, dataset_ref))
+            single.add((catalog_ref, DCAT.record, URIRef(catalog_record_ref)))
+
+    assert len(batch) == len(single)
+    assert isomorphic(batch, single)
@@ -0,0 +1,118 @@
+import pytest
+from rdflib import Literal, URIRef
+
+from ckanext.dcat.profiles.base import DCT
+
+from ckanext.dcat_be_napits.cache import catalog_graph_cache, catalog_header_key, dataset_graph_cache
+from ckanext.dcat_be_napits import streaming
+from ckanext.dcat_be_napits.streaming import StreamingCatalogSerializer, iter_catalog_datasets
+
+
+def test_merge_chunk_declares_turtle_prefixes_once():
+    serializer = StreamingCatalogSerializer()
+    first = b"@prefix dct: <http://purl.org/dc/terms/> .\n\n<a> dct:title \"A\" .\n"
+    second = b"@prefix dct: <http://purl.org/dc/terms/> .\n@prefix ns1: <http://example.org/> .\n\n<b> ns1:p \"B\" .\n"
+    third = b"@prefix ns1: <http://example.com/> .\n\n<c> ns1:p \"C\" .\n"
+
+    assert serializer.merge_chunk(first, "turtle").startswith(b"@prefix dct:")
+    assert serializer.merge_chunk(second, "turtle").startswith(b"@prefix ns1: <http://example.org/>")
+    # A prefix bound to another namespace is declared again
+    assert serializer.merge_chunk(third, "turtle").startswith(b"@prefix ns1: <http://example.com/>")
+
+
+def test_merge_chunk_keeps_ntriples():
+    serializer = StreamingCatalogSerializer()
+    chunk = b"<a> <b> <c> .\n"
+
+    assert serializer.merge_chunk(chunk, "nt") == chunk
+
+
+class StaticHeaderProfile(object):
+
+    def __init__(self, graph, compatibility_mode=False):
+        self.g = graph
+
+    def static_catalog_triples(self, catalog_dict, catalog_ref):
+        return ((catalog_ref, DCT.title, Literal("Catalog")),)
+
+    def graph_from_catalog_modified(self, catalog_ref):
+        self.g.add((catalog_ref, DCT.modified, Literal("2024-01-01")))
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_catalog_header_is_serialized_once():
+    catalog_graph_cache.clear()
+    first = StreamingCatalogSerializer()
+    first._profiles = [StaticHeaderProfile]
+    second = StreamingCatalogSerializer()
+    second._profiles = [StaticHeaderProfile]
+
+    catalog_ref, output = first.graph_from_catalog_header("nt")
+    assert second.graph_from_catalog_header("nt")[1] is output
+
+    assert b"Catalog" in output and b"2024-01-01" not in output
+    # Only what changes between requests is left in the graph
+    assert list(second.g) == [(catalog_ref, DCT.modified, Literal("2024-01-01"))]
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_catalog_header_key_follows_the_site_config(ckan_config, monkeypatch):
+    catalog_ref = URIRef("https://example.org")
+    key = catalog_header_key(catalog_ref)
+
+    assert catalog_header_key(catalog_ref) == key
+    monkeypatch.setitem(ckan_config, "ckan.site_title", "Another title")
+    assert catalog_header_key(catalog_ref) != key
+    assert catalog_header_key(URIRef("https://example.com")) != key
+
+
+class CachingProfile(StaticHeaderProfile):
+
+    def graph_from_datasets(self, dataset_dicts, catalog_ref=None):
+        for dataset_dict in dataset_dicts:
+            triples = dataset_graph_cache.get(dataset_dict)
+            if triples is None:
+                triples = ((URIRef(dataset_dict["id"]), DCT.title, Literal("Dataset")),)
+                dataset_graph_cache.set(dataset_dict, triples)
+            for triple in triples:
+                self.g.add(triple)
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_stream_catalog_bypasses_the_graph_cache():
+    dataset_graph_cache.clear()
+    serializer = StreamingCatalogSerializer()
+    serializer._profiles = [CachingProfile]
+    dataset_dicts = [{"id": "https://example.org/ds-{0}".format(i), "metadata_modified": "2024-01-01T00:00:00"}
+                     for i in range(3)]
+
+    output = b"".join(serializer.stream_catalog(dataset_dicts, _format="nt"))
+
+    assert output.count(b"Dataset") == 3
+    assert len(dataset_graph_cache) == 0
+    # Other renders still fill it
+    serializer.graph_from_catalog_entries(dataset_dicts[:1], URIRef("https://example.org"))
+    assert len(dataset_graph_cache) == 1
+    dataset_graph_cache.clear()
+
+
+def test_iter_catalog_datasets_pages_on_the_dataset_id(monkeypatch):
+    dataset_ids = ["ds-{0}".format(i) for i in range(7)]
+    searches = []
+
+    def package_search(context, data_dict):
+        searches.append(data_dict)
+        after = [fq.split('"')[1] for fq in data_dict["fq_list"] if fq.startswith("id:")]
+        results = [{"id": dataset_id} for dataset_id in dataset_ids if not after or dataset_id > after[0]]
+        return {"count": len(results), "results": results[:data_dict["rows"]]}
+
+    monkeypatch.setattr(streaming.toolkit, "get_action", lambda name: package_search)
+    datasets = iter_catalog_datasets(batch_size=3)
+
+    seen = [next(datasets)["id"] for _ in range(3)]
+    # Deleting a dataset that was already yielded doesn't shift the next batch
+    dataset_ids.remove("ds-0")
+    seen += [dataset_dict["id"] for dataset_dict in datasets]
+
+    assert seen == ["ds-{0}".format(i) for i in range(7)]
+    assert all("start" not in data_dict for data_dict in searches)
@@ -0,0 +1,62 @@
+import pytest
+from rdflib import Graph, Literal, URIRef
+
+from ckanext.dcat.profiles.base import DCT
+
+from ckanext.dcat_be_napits.utils import (
+    catalog_language,
+    catalog_record_uri,
+    language_scope,
+    project_language,
+    uri_factory,
+    uri_scope,
+)
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_catalog_record_uri_from_dataset_uri():
+    dataset_dict = {"id": "ds-1"}
+
+    assert catalog_record_uri(dataset_dict) == "https://example.org/catalog-record/ds-1"
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_catalog_record_uri_fallback_is_stable():
+    dataset_dict = {"id": "ds-1", "uri": "https://other.org/datasets/ds-1"}
+
+    uri = catalog_record_uri(dataset_dict)
+
+    assert uri.startswith("https://example.org/catalog-record/")
+    assert catalog_record_uri(dict(dataset_dict)) == uri
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_uri_scope_memoizes():
+    dataset_dict = {"id": "ds-1"}
+
+    with uri_scope() as factory:
+        with uri_scope() as nested:
+            assert nested is factory
+        uri = uri_factory().dataset_uri(dataset_dict)
+        dataset_dict["uri"] = "https://other.org/datasets/ds-1"
+        assert uri_factory().dataset_uri(dataset_dict) == uri
+
+    assert uri_factory().dataset_uri(dataset_dict) == "https://other.org/datasets/ds-1"
+
+
+def test_project_language_keeps_untagged_and_fallback_literals():
+    dataset = URIRef("https://example.org/dataset/ds-1")
+    g = Graph()
+    g.add((dataset, DCT.title, Literal("Verkeer", lang="nl")))
+    g.add((dataset, DCT.title, Literal("Traffic", lang="en")))
+    g.add((dataset, DCT.description, Literal("Only in English", lang="en")))
+    g.add((dataset, DCT.identifier, Literal("ds-1")))
+
+    with language_scope("nl"):
+        assert catalog_language() == "nl"
+        project_language(g, catalog_language())
+    assert catalog_language() is None
+
+    assert set(g.objects(dataset, DCT.title)) == {Literal("Verkeer", lang="nl")}
+    assert set(g.objects(dataset, DCT.description)) == {Literal("Only in English", lang="en")}
+    assert (dataset, DCT.identifier, Literal("ds-1")) in g
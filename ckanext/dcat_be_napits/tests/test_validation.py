@@ -0,0 +1,68 @@
+import pytest
+from rdflib import BNode, Graph, Literal, URIRef
+
+from ckanext.dcat.profiles.base import DCAT, DCT, RDF
+
+from ckanext.dcat_be_napits import validation
+from ckanext.dcat_be_napits.utils import dataset_uri
+
+pyshacl = pytest.importorskip("pyshacl")
+
+DATASET_DICTS = [
+    {"id": "ds-1", "name": "ds-1", "metadata_modified": "2024-05-01T10:00:00"},
+    {"id": "ds-2", "name": "ds-2", "metadata_modified": "2024-05-01T10:00:00"},
+]
+
+
+class GraphSerializer(object):
+    '''
+    Renders ds-1 with a distribution without access URL, ds-2 without title
+    '''
+    _profiles = []
+
+    def graph_from_catalog_entries(self, dataset_dicts, catalog_ref):
+        g = Graph()
+        for dataset_dict in dataset_dicts:
+            dataset_ref = URIRef(dataset_uri(dataset_dict))
+            g.add((catalog_ref, DCAT.dataset, dataset_ref))
+            g.add((dataset_ref, RDF.type, DCAT.Dataset))
+            if dataset_dict["id"] == "ds-1":
+                g.add((dataset_ref, DCT.title, Literal("Traffic", lang="en")))
+                distribution = URIRef(str(dataset_ref) + "/resource/res-1")
+                g.add((dataset_ref, DCAT.distribution, distribution))
+                g.add((distribution, RDF.type, DCAT.Distribution))
+                g.add((dataset_ref, DCT.spatial, BNode()))
+        return g
+
+
+@pytest.mark.ckan_config("ckanext.dcat.base_uri", "https://example.org")
+def test_reports_per_dataset(tmp_path):
+    shapes = tmp_path / "shapes.ttl"
+    shapes.write_text("""
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix dcat: <http://www.w3.org/ns/dcat#> .
+        @prefix dct: <http://purl.org/dc/terms/> .
+        [] a sh:NodeShape ; sh:targetClass dcat:Dataset ; sh:property [ sh:path dct:title ; sh:minCount 1 ] .
+        [] a sh:NodeShape ; sh:targetClass dcat:Distribution ; sh:property [ sh:path dcat:accessURL ; sh:minCount 1 ] .
+    """)
+    loaded = validation.load_shapes([str(shapes)])
+    assert validation.load_shapes([str(shapes)]) is loaded
+
+    reports = validation.validate_chunk((DATASET_DICTS, {}), GraphSerializer(), loaded)
+
+    assert [report["id"] for report in reports] == ["ds-1", "ds-2"]
+    assert [report["conforms"] for report in reports] == [False, False]
+    assert [result["path"] for result in reports[0]["results"]] == ["http://www.w3.org/ns/dcat#accessURL"]
+    assert [result["path"] for result in reports[1]["results"]] == ["http://purl.org/dc/terms/title"]
+
+    assert validation.summary(reports) == (2, 2, [
+        (("http://www.w3.org/ns/dcat#accessURL", "MinCountConstraintComponent"), 1),
+        (("http://purl.org/dc/terms/title", "MinCountConstraintComponent"), 1),
+    ])
+
+
+def test_bundled_shapes_parse():
+    shapes_graph, fingerprint = validation.load_shapes()
+
+    assert len(shapes_graph)
+    assert fingerprint
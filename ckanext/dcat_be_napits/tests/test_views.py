@@ -0,0 +1,25 @@
+import pytest
+from rdflib import Graph
+from rdflib.namespace import DCAT, DCTERMS, RDF
+
+from ckan.plugins import toolkit
+from ckan.tests import factories
+
+from ckanext.dcat_be_napits.fragments import fragment_store
+from ckanext.dcat_be_napits.profiles.euro_dcat_ap_2 import SUPPORTED_LANGUAGE_REFS
+
+
+@pytest.mark.ckan_config("ckan.plugins", "dcat dcat_be_napits")
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_index")
+def test_full_catalog_from_fragments_in_one_language(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(fragment_store, "path", str(tmp_path))
+    monkeypatch.setattr(fragment_store, "formats", {"turtle"})
+    factories.Dataset()
+    url = toolkit.url_for("dcat_be_napits.read_full_catalog", _format="ttl", lang="nl")
+
+    response = app.get(url)
+    graph = Graph().parse(data=response.get_data(), format="turtle")
+
+    assert response.status_code == 200
+    catalog_ref = graph.value(predicate=RDF.type, object=DCAT.Catalog)
+    assert set(graph.objects(catalog_ref, DCTERMS.language)) == {SUPPORTED_LANGUAGE_REFS["nl"]}
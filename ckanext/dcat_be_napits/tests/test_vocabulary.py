@@ -0,0 +1,63 @@
+import pytest
+
+from ckanext.dcat_be_napits.vocabulary import (
+    BUNDLED_VOCABULARIES,
+    LANGUAGE_SCHEME,
+    TRANSPORT_MODE_SCHEME,
+    VocabularyIndex,
+    build_index,
+    read_concepts,
+)
+
+EPSG_VOCABULARY = b"""
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+
+<http://www.opengis.net/def/crs/EPSG/0> a skos:ConceptScheme .
+
+<http://www.opengis.net/def/crs/EPSG/0/4326> a skos:Concept ;
+    skos:prefLabel "WGS 84" .
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    epsg = tmp_path / "epsg.ttl"
+    epsg.write_bytes(EPSG_VOCABULARY)
+    path = str(tmp_path / "vocabularies.idx")
+    build_index(read_concepts([BUNDLED_VOCABULARIES, str(epsg)]), path)
+    index = VocabularyIndex(path)
+    yield index
+    index.close()
+
+
+def test_lookup_and_labels(index):
+    uri = "http://publications.europa.eu/resource/authority/language/NLD"
+
+    assert index.contains(LANGUAGE_SCHEME, uri)
+    assert index.label(uri, "fr") == "néerlandais"
+    assert index.lookup("http://publications.europa.eu/resource/authority/language/XXX") is None
+
+
+def test_aliases_resolve_to_the_concept(index):
+    assert index.canonical("https://www.opengis.net/def/crs/EPSG/0/4326") == \
+        "http://www.opengis.net/def/crs/EPSG/0/4326"
+    assert index.label("http://www.opengis.net/def/crs/EPSG/0/4326/", "en") == "WGS 84"
+
+
+def test_validate_unknown_values(index):
+    unknown = "http://publications.europa.eu/resource/authority/language/XXX"
+
+    assert index.validate(LANGUAGE_SCHEME, unknown) == unknown
+    assert index.unknown[LANGUAGE_SCHEME] == 1
+
+    index.drop_unknown = True
+    assert index.validate(LANGUAGE_SCHEME, unknown) is None
+    # Values of schemes that aren't loaded are kept
+    assert index.validate(TRANSPORT_MODE_SCHEME, "https://example.org/mode") == "https://example.org/mode"
+
+
+def test_without_index():
+    index = VocabularyIndex()
+
+    assert not index
+    assert index.validate(LANGUAGE_SCHEME, "https://example.org/lang") == "https://example.org/lang"
@@ -1,28 +1,187 @@
 # -*- coding: utf-8 -*-
 import uuid
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-from ckanext.dcat.utils import publisher_uri_organization_fallback, dataset_uri, catalog_uri
+from rdflib import Literal
+
+import ckanext.dcat.utils as dcat_utils
 
 log = logging.getLogger(__name__)
 
+# Bump whenever a change to the profiles changes their output, so rendered
+# graphs cached by an older version are not served anymore.
+PROFILE_VERSION = '1'
+
+
+class URIFactory(object):
+    '''
+    Derives the URIs used while rendering, computing each one only once.
+
+    The upstream helpers ask every IDCATURIGenerator plugin for each URI, and
+    the profiles need the same URIs several times per dataset. Entries are
+    keyed on the dataset, resource or organization id; dicts without an id
+    are not memoized.
+    '''
+
+    def __init__(self):
+        self._uris = {}
+
+    def _memoized(self, key, function, *args):
+        if key[1] is None:
+            return function(*args)
+        try:
+            return self._uris[key]
+        except KeyError:
+            uri = self._uris[key] = function(*args)
+            return uri
+
+    def catalog_uri(self):
+        return self._memoized(('catalog', ''), dcat_utils.catalog_uri)
+
+    def dataset_uri(self, dataset_dict):
+        return self._memoized(('dataset', dataset_dict.get('id')), dcat_utils.dataset_uri, dataset_dict)
+
+    def resource_uri(self, resource_dict):
+        return self._memoized(('resource', resource_dict.get('id')), dcat_utils.resource_uri, resource_dict)
+
+    def publisher_uri(self, dataset_dict):
+        # IDCATURIGenerator plugins get the whole dataset, so key on it
+        return self._memoized(('publisher', dataset_dict.get('id')),
+                              dcat_utils.publisher_uri_organization_fallback, dataset_dict)
+
+    def publisher_address_uri(self, dataset_dict):
+        return self._memoized(('publisher_address', dataset_dict.get('id')),
+                              self._publisher_address_uri, dataset_dict)
+
+    def catalog_record_uri(self, dataset_dict):
+        return self._memoized(('catalog_record', dataset_dict.get('id')),
+                              self._catalog_record_uri, dataset_dict)
+
+    def _publisher_address_uri(self, dataset_dict):
+        if dataset_dict.get('organization'):
+            return '{0}/address'.format(self.publisher_uri(dataset_dict))
+
+        return None
+
+    def _catalog_record_uri(self, dataset_dict):
+        _dataset_uri = self.dataset_uri(dataset_dict)
+        if '/dataset/' in _dataset_uri:
+            return _dataset_uri.replace('/dataset/', '/catalog-record/')
+
+        # Name-based, so a dataset keeps the same catalog record URI
+        record_id = uuid.uuid5(uuid.NAMESPACE_URL, dataset_dict.get('id') or _dataset_uri)
+        return '{0}/catalog-record/{1}'.format(self.catalog_uri().rstrip('/'), record_id)
+
+
+_uri_factory = ContextVar('dcat_be_napits_uri_factory', default=None)
+
+
+@contextmanager
+def uri_scope():
+    '''
+    Memoizes the URIs computed within the block, eg while rendering a catalog
+    page. Nested scopes share the outer scope's URIs.
+    '''
+    factory = _uri_factory.get()
+    if factory is not None:
+        yield factory
+        return
+    token = _uri_factory.set(URIFactory())
+    try:
+        yield _uri_factory.get()
+    finally:
+        _uri_factory.reset(token)
+
+
+_catalog_language = ContextVar('dcat_be_napits_catalog_language', default=None)
+
+
+@contextmanager
+def language_scope(lang):
+    '''
+    Renders the language-tagged literals of the block in language `lang`
+    only, eg for a catalog in one language. `None` keeps all languages.
+    '''
+    token = _catalog_language.set(lang)
+    try:
+        yield lang
+    finally:
+        _catalog_language.reset(token)
+
+
+def catalog_language():
+    '''
+    Returns the language of the current `language_scope`, or None
+    '''
+    return _catalog_language.get()
+
+
+def project_language(graph, lang, subject=None):
+    '''
+    Removes the literals of `graph` (of `subject` only, if given) that are
+    tagged with another language than `lang`. A property with no literal in
+    `lang` keeps the ones it has, so mandatory properties don't go missing.
+    '''
+    literals = {}
+    for s, p, o in graph.triples((subject, None, None)):
+        if isinstance(o, Literal) and o.language:
+            literals.setdefault((s, p), []).append(o)
+    for (s, p), objects in literals.items():
+        if any(_literal_language(o) == lang for o in objects):
+            for o in objects:
+                if _literal_language(o) != lang:
+                    graph.remove((s, p, o))
+
+
+def _literal_language(literal):
+    return literal.language.split('-')[0].lower()
+
+
+def uri_factory():
+    '''
+    Returns the URI factory of the current `uri_scope`. Outside of a scope,
+    returns a new factory, so nothing is memoized.
+    '''
+    return _uri_factory.get() or URIFactory()
+
+
+def catalog_uri():
+    return uri_factory().catalog_uri()
+
+
+def dataset_uri(dataset_dict):
+    return uri_factory().dataset_uri(dataset_dict)
+
+
+def resource_uri(resource_dict):
+    return uri_factory().resource_uri(resource_dict)
+
+
+def publisher_uri_organization_fallback(dataset_dict):
+    return uri_factory().publisher_uri(dataset_dict)
+
+
 def publisher_uri_organization_address(dataset_dict):
     '''
     Builds a URI of the form
-    `publisher_uri_organization_address()` + '/address'
+    `publisher_uri_organization_fallback()` + '/address'
     '''
-    if dataset_dict.get('organization'):
-        return '{0}/address'.format(publisher_uri_organization_fallback(dataset_dict))
+    return uri_factory().publisher_address_uri(dataset_dict)
 
-    return None
 
 def catalog_record_uri(dataset_dict):
-    _dataset_uri = dataset_uri(dataset_dict)
-    if '/dataset/' in _dataset_uri:
-        uri = _dataset_uri.replace('/dataset/', '/catalog-record/')
-    else:
-        uri = '{0}/catalog-record/{1}'.format(catalog_uri().rstrip('/'),
-                                       str(uuid.uuid4()))
-        log.warning('Using a random id for catalog record URI')
-
-    return uri
+    '''
+    Builds the catalog record URI from the dataset URI, replacing `/dataset/`
+    by `/catalog-record/`. Otherwise, falls back to `catalog_uri()` +
+    '/catalog-record/' + a name-based UUID of the dataset id.
+    '''
+    return uri_factory().catalog_record_uri(dataset_dict)
+
+
+def solr_quote(value):
+    '''
+    Quotes `value` as a Solr term
+    '''
+    return '"{0}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
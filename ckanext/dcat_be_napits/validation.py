@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+SHACL validation of the rendered catalog.
+
+Like the export, the parent process pages through the datasets and a pool of
+worker processes renders them, a chunk at a time. Each chunk is validated
+against the shapes in one pyshacl run, and the results are split per dataset:
+a result belongs to the datasets its focus node can be reached from (the
+dataset, its distributions, catalog record, publisher...).
+
+The shapes are parsed once, before the workers are forked. The bundled ones
+check the mandatory properties of mobilityDCAT-AP; other shapes, eg the full
+DCAT-AP 2 ones, can be added.
+
+Each report carries a key of what the dataset's validation depends on (its
+render key and the shapes), so an incremental run copies the report of the
+datasets that didn't change since the previous run instead of validating
+them again.
+
+Needs pyshacl (`pip install pyshacl`).
+"""
+import os
+import time
+import hashlib
+import logging
+import multiprocessing
+from collections import Counter, deque
+
+from rdflib import BNode, Graph, URIRef
+from rdflib.namespace import RDF, SH
+
+from ckanext.dcat.profiles.base import CleanedURIRef
+
+from ckanext.dcat_be_napits.cache import dataset_graph_cache, organization_cache
+from ckanext.dcat_be_napits.export import DEFAULT_CHUNK_SIZE, iter_chunks
+from ckanext.dcat_be_napits.fragments import render_key
+from ckanext.dcat_be_napits.streaming import StreamingCatalogSerializer, iter_catalog_datasets
+from ckanext.dcat_be_napits.utils import catalog_record_uri, catalog_uri, dataset_uri, uri_scope
+
+try:
+    import pyshacl
+except ImportError:
+    pyshacl = None
+
+log = logging.getLogger(__name__)
+
+BUNDLED_SHAPES = [os.path.join(os.path.dirname(__file__), 'shapes', 'mobility_dcat_ap.ttl')]
+
+# Parsed shapes graphs and their fingerprint, per list of files
+_shapes = {}
+
+# Serializer and shapes of a worker process, set up by `_init_worker`
+_worker_serializer = None
+_worker_shapes = None
+
+
+def load_shapes(paths=None):
+    '''
+    Returns the shapes graph of the SHACL files `paths` (default: the
+    bundled shapes) and its fingerprint, parsing the files once per process
+    '''
+    paths = tuple(paths or BUNDLED_SHAPES)
+    if paths not in _shapes:
+        graph = Graph()
+        checksum = hashlib.sha1()
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            checksum.update(data)
+            graph.parse(data=data, format='turtle' if path.endswith('.ttl') else None)
+        _shapes[paths] = (graph, checksum.hexdigest())
+    return _shapes[paths]
+
+
+def validation_key(dataset_dict, profiles, shapes_fingerprint):
+    '''
+    Changes when the dataset may validate differently
+    '''
+    return hashlib.sha1('{0} {1}'.format(
+        render_key(dataset_dict, profiles), shapes_fingerprint).encode('utf-8')).hexdigest()
+
+
+def _owners(graph, dataset_dicts, catalog_ref):
+    '''
+    Maps each node of `graph` to the ids of the datasets it can be reached
+    from, starting at the dataset and at its catalog record
+    '''
+    owners = {}
+    with uri_scope():
+        for dataset_dict in dataset_dicts:
+            pending = [CleanedURIRef(dataset_uri(dataset_dict)), CleanedURIRef(catalog_record_uri(dataset_dict))]
+            seen = set()
+            while pending:
+                node = pending.pop()
+                if node in seen or node == catalog_ref:
+                    continue
+                seen.add(node)
+                owners.setdefault(node, set()).add(dataset_dict['id'])
+                pending.extend(_object for _object in graph.objects(node) if isinstance(_object, (URIRef, BNode)))
+    return owners
+
+
+def _local_name(term):
+    if term is None:
+        return None
+    term = str(term)
+    return term.rsplit('#', 1)[-1] if '#' in term else term
+
+
+def _result(results_graph, result):
+    value = results_graph.value(result, SH.value)
+    path = results_graph.value(result, SH.resultPath)
+    return {
+        'focus_node': str(results_graph.value(result, SH.focusNode)),
+        'path': str(path) if isinstance(path, URIRef) else None,
+        'value': str(value) if value is not None else None,
+        'severity': _local_name(results_graph.value(result, SH.resultSeverity)),
+        'constraint': _local_name(results_graph.value(result, SH.sourceConstraintComponent)),
+        'message': str(results_graph.value(result, SH.resultMessage) or ''),
+    }
+
+
+def _init_worker(profiles, shape_paths):
+    global _worker_serializer, _worker_shapes
+    _worker_serializer = StreamingCatalogSerializer(profiles=profiles)
+    _worker_shapes = load_shapes(shape_paths)
+    # Each dataset is rendered once, don't keep its triples around
+    dataset_graph_cache.configure(max_size=0, max_age=0)
+
+
+def validate_chunk(chunk, serializer=None, shapes=None):
+    '''
+    Renders a chunk from `iter_chunks`, validates it and returns a report
+    per dataset
+    '''
+    dataset_dicts, org_dicts = chunk
+    serializer = serializer or _worker_serializer
+    shapes_graph, shapes_fingerprint = shapes or _worker_shapes
+    for org_id, org_dict in org_dicts.items():
+        organization_cache[org_id] = org_dict
+    catalog_ref = CleanedURIRef(catalog_uri())
+    graph = serializer.graph_from_catalog_entries(dataset_dicts, catalog_ref)
+
+    _, results_graph, _ = pyshacl.validate(
+        graph, shacl_graph=shapes_graph, inference='none', allow_warnings=True, allow_infos=True)
+
+    reports = dict((dataset_dict['id'], {
+        'id': dataset_dict['id'],
+        'name': dataset_dict.get('name'),
+        'key': validation_key(dataset_dict, serializer._profiles, shapes_fingerprint),
+        'conforms': True,
+        'results': [],
+    }) for dataset_dict in dataset_dicts)
+    owners = _owners(graph, dataset_dicts, catalog_ref)
+    for result in results_graph.subjects(RDF.type, SH.ValidationResult):
+        focus_node = results_graph.value(result, SH.focusNode)
+        for dataset_id in owners.get(focus_node, ()):
+            report = reports[dataset_id]
+            report['results'].append(_result(results_graph, result))
+            if report['results'][-1]['severity'] == 'Violation':
+                report['conforms'] = False
+    for report in reports.values():
+        report['results'].sort(key=lambda result: (result['focus_node'], result['path'] or '', result['constraint']))
+    return [reports[dataset_dict['id']] for dataset_dict in dataset_dicts]
+
+
+def validate_catalog(dataset_dicts=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, shape_paths=None,
+                     previous=None, profiles=None):
+    '''
+    Validates the whole catalog with `workers` processes and yields a report
+    per dataset. Datasets whose report in `previous` (a dict of reports by
+    dataset id) has the same key are not validated again, their previous
+    report is yielded instead.
+    '''
+    workers = workers or os.cpu_count() or 1
+    previous = previous or {}
+    if dataset_dicts is None:
+        dataset_dicts = iter_catalog_datasets()
+
+    serializer = StreamingCatalogSerializer(profiles=profiles)
+    shapes = load_shapes(shape_paths)
+
+    def changed(dataset_dicts):
+        for dataset_dict in dataset_dicts:
+            report = previous.get(dataset_dict['id'])
+            if report and report['key'] == validation_key(dataset_dict, serializer._profiles, shapes[1]):
+                reused.append(report)
+            else:
+                yield dataset_dict
+
+    started = time.time()
+    reused = []
+    validated = 0
+    chunks = iter_chunks(changed(dataset_dicts), chunk_size)
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from validate_chunk(chunk, serializer, shapes)
+            yield from reused
+            reused[:] = []
+            validated += len(chunk[0])
+    else:
+        # Forked workers inherit the parsed shapes, see `export_catalog`
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, initializer=_init_worker, initargs=(profiles, shape_paths)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((len(chunk[0]), pool.apply_async(validate_chunk, (chunk,))))
+                if len(pending) >= workers * 2:
+                    size, result = pending.popleft()
+                    yield from result.get()
+                    validated += size
+                yield from reused
+                reused[:] = []
+            while pending:
+                size, result = pending.popleft()
+                yield from result.get()
+                validated += size
+    yield from reused
+
+    log.info('Validated %d datasets in %.1fs with %d workers', validated, time.time() - started, workers)
+
+
+def summary(reports, top=10):
+    '''
+    Returns the number of datasets, of invalid ones and the `top` most
+    frequent violations, as `((path, constraint), count)`
+    '''
+    violations = Counter()
+    invalid = 0
+    for report in reports:
+        if not report['conforms']:
+            invalid += 1
+        for result in report['results']:
+            if result['severity'] == 'Violation':
+                violations[(result['path'], result['constraint'])] += 1
+    return len(reports), invalid, violations.most_common(top)
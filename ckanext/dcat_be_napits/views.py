@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import os
+
+from flask import Blueprint, send_file
+
+import ckan.authz as authz
+import ckan.plugins.toolkit as toolkit
+from ckan.common import streaming_response
+
+from ckanext.dcat.utils import url_to_rdflib_format
+
+from ckanext.dcat_be_napits.streaming import (
+    StreamingCatalogSerializer,
+    iter_catalog_datasets,
+    STREAMING_FORMATS,
+    CONTENT_TYPES,
+)
+from ckanext.dcat_be_napits.cache import graph_cache_bypass
+from ckanext.dcat_be_napits.metrics import profile_metrics
+from ckanext.dcat_be_napits.export_jobs import export_jobs, COMPLETE
+from ckanext.dcat_be_napits.fragments import fragment_store, iter_catalog
+from ckanext.dcat_be_napits.logic.action import catalog_language_arg
+from ckanext.dcat_be_napits.utils import language_scope
+
+config = toolkit.config
+
+DEFAULT_FULL_CATALOG_ENDPOINT = "/catalog/full.{_format}"
+DEFAULT_CHANGES_ENDPOINT = "/catalog/changes.{_format}"
+DEFAULT_METRICS_ENDPOINT = "/dcat_be_napits/metrics"
+DEFAULT_EXPORTS_ENDPOINT = "/catalog/exports/{export_id}"
+
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+dcat_be_napits = Blueprint("dcat_be_napits", __name__)
+
+
+def _in_language(chunks, lang):
+    # The response is streamed after the view returned, so the language
+    # scope is entered by the generator itself. `chunks` is called in it,
+    # as some iterators render the catalog header when they are created.
+    # Each dataset is rendered once, so they bypass the graph cache.
+    with language_scope(lang), graph_cache_bypass():
+        yield from chunks()
+
+
+def read_full_catalog(_format):
+    """
+    Streams the whole catalog, datasets and catalog records included
+    """
+    if _format not in CONTENT_TYPES or url_to_rdflib_format(_format) not in STREAMING_FORMATS:
+        toolkit.abort(400, "The full catalog is only available as N-Triples or Turtle")
+    try:
+        toolkit.check_access("dcat_catalog_show", {}, {})
+    except toolkit.NotAuthorized:
+        toolkit.abort(403)
+    try:
+        lang = catalog_language_arg({"lang": toolkit.request.args.get("lang")})
+    except toolkit.ValidationError as e:
+        toolkit.abort(400, str(e))
+    canonical = toolkit.asbool(toolkit.request.args.get("canonical", False))
+    if canonical and url_to_rdflib_format(_format) != "nt":
+        toolkit.abort(400, "The canonical catalog is only available as N-Triples")
+
+    serializer = StreamingCatalogSerializer()
+    if canonical:
+        return streaming_response(
+            _in_language(lambda: serializer.stream_catalog(iter_catalog_datasets(), _format=_format, canonical=True), lang),
+            mimetype=CONTENT_TYPES[_format],
+            with_context=True,
+        )
+    if fragment_store.supports(url_to_rdflib_format(_format)):
+        # Served from the stored fragments, gzipped ones if the client takes them
+        compress = "gzip" in toolkit.request.accept_encodings
+        response = streaming_response(
+            _in_language(lambda: iter_catalog(serializer, iter_catalog_datasets(), _format, compress=compress), lang),
+            mimetype=CONTENT_TYPES[_format],
+            with_context=True,
+        )
+        if compress:
+            response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    return streaming_response(
+        _in_language(lambda: serializer.stream_catalog(iter_catalog_datasets(), _format=_format), lang),
+        mimetype=CONTENT_TYPES[_format],
+        with_context=True,
+    )
+
+
+dcat_be_napits.add_url_rule(
+    config.get(
+        "ckanext.dcat_be_napits.full_catalog_endpoint", DEFAULT_FULL_CATALOG_ENDPOINT
+    ).replace("{_format}", "<_format>"),
+    view_func=read_full_catalog,
+)
+
+
+def read_catalog_changes(_format):
+    """
+    The datasets changed after the `since` arg, for incremental harvesting
+    """
+    if _format not in CONTENT_TYPES:
+        toolkit.abort(400, "Unsupported format")
+    data_dict = {
+        "since": toolkit.request.args.get("since"),
+        "cursor": toolkit.request.args.get("cursor"),
+        "lang": toolkit.request.args.get("lang"),
+        "format": _format,
+    }
+    try:
+        response = toolkit.get_action("dcat_be_napits_catalog_changes")({}, data_dict)
+    except toolkit.ValidationError as e:
+        toolkit.abort(409, str(e))
+    except toolkit.NotAuthorized:
+        toolkit.abort(403)
+    return response, 200, {"Content-Type": CONTENT_TYPES[_format]}
+
+
+dcat_be_napits.add_url_rule(
+    config.get(
+        "ckanext.dcat_be_napits.changes_endpoint", DEFAULT_CHANGES_ENDPOINT
+    ).replace("{_format}", "<_format>"),
+    view_func=read_catalog_changes,
+)
+
+
+def download_export(export_id):
+    """
+    The gzip file of a complete background export
+    """
+    try:
+        toolkit.check_access("dcat_catalog_show", {}, {})
+    except toolkit.NotAuthorized:
+        toolkit.abort(403)
+    state = export_jobs.get(export_id)
+    if state is None or state["status"] != COMPLETE:
+        toolkit.abort(404)
+    path = export_jobs.file_path(state)
+    return send_file(path, mimetype="application/gzip", as_attachment=True, download_name=os.path.basename(path))
+
+
+dcat_be_napits.add_url_rule(
+    config.get(
+        "ckanext.dcat_be_napits.exports_endpoint", DEFAULT_EXPORTS_ENDPOINT
+    ).replace("{export_id}", "<export_id>"),
+    view_func=download_export,
+)
+
+
+def metrics():
+    """
+    The profile stage metrics, in the Prometheus text format. Only served to
+    local scrapers and sysadmins, while the metrics are enabled.
+    """
+    if not profile_metrics.enabled:
+        toolkit.abort(404)
+    if toolkit.request.remote_addr not in LOCAL_ADDRESSES and not authz.is_sysadmin(toolkit.current_user.name):
+        toolkit.abort(403)
+    return profile_metrics.prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+dcat_be_napits.add_url_rule(
+    config.get("ckanext.dcat_be_napits.metrics_endpoint", DEFAULT_METRICS_ENDPOINT),
+    view_func=metrics,
+)
+
+
+def get_blueprints():
+    return [dcat_be_napits]
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the controlled vocabularies the mobility profile renders values of:
+mobility themes, transport modes, georeferencing methods, NUTS regions, the EU
+language and country authority tables and EPSG reference systems.
+
+The index is built offline from SKOS files with
+`ckan dcat-be-napits build-vocabularies` and memory-mapped at startup, so the
+vocabularies are not parsed in every process, and pages are shared between
+the workers. It is an open addressing hash table:
+
+* a header: magic, version, number of slots and of entries, and the length
+  of the metadata that follows
+* the metadata, as JSON: the number of concepts per scheme and a checksum
+* the slots: the 64-bit hash of a URI and the offset and length of its record
+* the records: the URI, its canonical URI, the schemes of the concept and its
+  `skos:prefLabel`s as JSON, separated by NUL bytes
+
+Besides the concept URIs, their variants with the other scheme (`http` /
+`https`) and with or without a trailing slash are indexed as aliases of the
+concept, eg `https://www.opengis.net/def/crs/EPSG/0/4326`.
+
+Only a few entries of the language and country tables are bundled, in the
+`vocabularies` directory. Other vocabularies are passed to the build
+command.
+"""
+import os
+import json
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+from collections import Counter, namedtuple
+
+from rdflib import Graph
+from rdflib.util import guess_format
+
+from ckanext.dcat.profiles.base import RDF, SKOS
+
+log = logging.getLogger(__name__)
+
+BUNDLED_VOCABULARIES = os.path.join(os.path.dirname(__file__), 'vocabularies')
+
+MOBILITY_THEME_SCHEME = 'https://w3id.org/mobilitydcat-ap/mobility-theme'
+TRANSPORT_MODE_SCHEME = 'https://w3id.org/mobilitydcat-ap/transport-mode'
+GEOREFERENCING_METHOD_SCHEME = 'https://w3id.org/mobilitydcat-ap/georeferencing-method'
+NUTS_SCHEME = 'http://data.europa.eu/nuts'
+LANGUAGE_SCHEME = 'http://publications.europa.eu/resource/authority/language'
+COUNTRY_SCHEME = 'http://publications.europa.eu/resource/authority/country'
+EPSG_SCHEME = 'http://www.opengis.net/def/crs/EPSG/0'
+
+MAGIC = b'NAPVOCAB'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIII')
+SLOT = struct.Struct('<QII')
+SEPARATOR = b'\0'
+
+Concept = namedtuple('Concept', ['uri', 'schemes', 'labels'])
+
+
+def _hash(key):
+    # 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+
+def _aliases(uri):
+    '''
+    Returns the variants of `uri` that are indexed as aliases of it
+    '''
+    if uri.startswith('https://'):
+        other_scheme = 'http://' + uri[len('https://'):]
+    elif uri.startswith('http://'):
+        other_scheme = 'https://' + uri[len('http://'):]
+    else:
+        other_scheme = uri
+    aliases = []
+    for variant in (uri, other_scheme):
+        aliases.extend([variant, variant[:-1] if variant.endswith('/') else variant + '/'])
+    return [alias for alias in aliases if alias != uri]
+
+
+def read_concepts(paths):
+    '''
+    Returns `{uri: Concept}` for the `skos:Concept`s in the SKOS files (or
+    directories of files) in `paths`. Concepts without `skos:inScheme` are
+    put in the concept scheme of their file, if it declares exactly one.
+    '''
+    concepts = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if guess_format(name) and not name.startswith('.'))
+        else:
+            files = [path]
+        for file_path in files:
+            g = Graph()
+            g.parse(file_path, format=guess_format(file_path))
+            file_schemes = list(g.subjects(RDF.type, SKOS.ConceptScheme))
+            for concept_ref in g.subjects(RDF.type, SKOS.Concept):
+                schemes = set(str(scheme) for scheme in g.objects(concept_ref, SKOS.inScheme))
+                if not schemes and len(file_schemes) == 1:
+                    schemes.add(str(file_schemes[0]))
+                labels = dict((label.language or '', str(label))
+                              for label in g.objects(concept_ref, SKOS.prefLabel))
+                uri = str(concept_ref)
+                if uri in concepts:
+                    schemes.update(concepts[uri].schemes)
+                    labels = dict(concepts[uri].labels, **labels)
+                concepts[uri] = Concept(uri, tuple(sorted(schemes)), labels)
+    return concepts
+
+
+def build_index(concepts, path):
+    '''
+    Writes the index of `concepts` (`{uri: Concept}`) to `path`. Returns the
+    number of indexed URIs, aliases included.
+    '''
+    entries = dict((uri, concept) for uri, concept in concepts.items())
+    for uri, concept in sorted(concepts.items()):
+        for alias in _aliases(uri):
+            # A concept URI is never shadowed by an alias of another concept
+            entries.setdefault(alias, concept)
+
+    slot_count = 1
+    while slot_count < 2 * len(entries):
+        slot_count *= 2
+    mask = slot_count - 1
+
+    scheme_counts = Counter(scheme for concept in concepts.values() for scheme in concept.schemes)
+    records = bytearray()
+    slots = [None] * slot_count
+    for key, concept in sorted(entries.items()):
+        encoded_key = key.encode('utf-8')
+        record = SEPARATOR.join([
+            encoded_key,
+            concept.uri.encode('utf-8'),
+            ' '.join(concept.schemes).encode('utf-8'),
+            json.dumps(concept.labels, sort_keys=True, ensure_ascii=False).encode('utf-8'),
+        ])
+        key_hash = _hash(encoded_key)
+        index = key_hash & mask
+        while slots[index] is not None:
+            index = (index + 1) & mask
+        slots[index] = (key_hash, len(records), len(record))
+        records.extend(record)
+
+    meta = json.dumps({
+        'schemes': dict(scheme_counts),
+        'checksum': hashlib.sha1(bytes(records)).hexdigest(),
+    }, sort_keys=True).encode('utf-8')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, slot_count, len(entries), len(meta)))
+            f.write(meta)
+            for slot in slots:
+                f.write(SLOT.pack(*(slot or (0, 0, 0))))
+            f.write(records)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(entries)
+
+
+class VocabularyIndex(object):
+    '''
+    Read-only, memory-mapped vocabulary index. Lookups hash the URI and probe
+    a few slots of the table, however large the vocabularies are.
+
+    Without an index file, nothing is known: lookups return None and no
+    scheme is loaded, so values are rendered as is.
+    '''
+
+    def __init__(self, path=None, drop_unknown=False):
+        self._mmap = None
+        self.configure(path, drop_unknown)
+        self.unknown = Counter()
+
+    def configure(self, path=None, drop_unknown=False):
+        self.close()
+        self.path = path or None
+        self.drop_unknown = drop_unknown
+        self.schemes = {}
+        self.fingerprint = None
+        self._slot_count = 0
+        self._entry_count = 0
+        if self.path:
+            self._open(self.path)
+
+    def _open(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _reserved, slot_count, entry_count, meta_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{0} is not a vocabulary index of version {1}'.format(path, VERSION))
+        meta = json.loads(self._mmap[HEADER.size:HEADER.size + meta_length])
+        self.schemes = meta['schemes']
+        self.fingerprint = meta['checksum']
+        self._slot_count = slot_count
+        self._entry_count = entry_count
+        self._slots_offset = HEADER.size + meta_length
+        self._records_offset = self._slots_offset + slot_count * SLOT.size
+        log.info('Loaded vocabulary index %s: %d URIs in %d schemes', path, entry_count, len(self.schemes))
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __len__(self):
+        return self._entry_count
+
+    def __bool__(self):
+        return self._entry_count > 0
+
+    def has_scheme(self, scheme):
+        return scheme in self.schemes
+
+    def lookup(self, uri):
+        '''
+        Returns the Concept `uri` is, or is an alias of, or None
+        '''
+        if not self._slot_count:
+            return None
+        key = uri.encode('utf-8')
+        key_hash = _hash(key)
+        mask = self._slot_count - 1
+        index = key_hash & mask
+        while True:
+            slot_hash, offset, length = SLOT.unpack_from(self._mmap, self._slots_offset + index * SLOT.size)
+            if not slot_hash:
+                return None
+            if slot_hash == key_hash:
+                start = self._records_offset + offset
+                record_key, canonical, schemes, labels = self._mmap[start:start + length].split(SEPARATOR, 3)
+                if record_key == key:
+                    return Concept(canonical.decode('utf-8'),
+                                   tuple(schemes.decode('utf-8').split()),
+                                   json.loads(labels))
+            index = (index + 1) & mask
+
+    def canonical(self, uri):
+        '''
+        Returns the URI of the concept `uri` refers to, or None if unknown
+        '''
+        concept = self.lookup(uri)
+        return concept.uri if concept else None
+
+    def contains(self, scheme, uri):
+        concept = self.lookup(uri)
+        return bool(concept) and scheme in concept.schemes
+
+    def label(self, uri, lang=None):
+        '''
+        Returns the `skos:prefLabel` of `uri` in `lang`, falling back on the
+        label without a language, or None
+        '''
+        concept = self.lookup(uri)
+        if not concept:
+            return None
+        return concept.labels.get(lang or '') or concept.labels.get('')
+
+    def validate(self, scheme, uri):
+        '''
+        Returns the canonical form of `uri`, or None if it should be dropped:
+        when `scheme` is loaded but doesn't contain `uri` and unknown values
+        are dropped. Unknown values are counted per scheme.
+        '''
+        concept = self.lookup(uri)
+        if concept and scheme in concept.schemes:
+            return concept.uri
+        if scheme not in self.schemes:
+            return concept.uri if concept else uri
+        self.unknown[scheme] += 1
+        log.debug('%s is not in vocabulary %s', uri, scheme)
+        return None if self.drop_unknown else uri
+
+
+vocabulary_index = VocabularyIndex()